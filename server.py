@@ -1,41 +1,87 @@
 # server.py
 
+import io
 import os
+import time
+import gzip
+import json
 import shutil
+import hashlib
+import threading
 import subprocess
 import traceback
+from collections import OrderedDict
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 
+_BOOT_START = time.perf_counter()
+
+import torch
+import torchaudio
 from dotenv import load_dotenv
 from flask import (
     Flask,
+    Response,
     request,
     jsonify,
     render_template,
     send_from_directory,
     abort,
 )
-from openai import OpenAI
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
 
 from speaker_detector.core import (
+    CATALOG,
+    EMBEDDING_CACHE,
+    MODEL_EMBEDDING_DIM,
+    MODEL_SAMPLE_RATE,
+    embed_waveforms,
     enroll_speaker,
+    ensure_model_precision,
+    get_embedding,
     identify_speaker,
     list_speakers,
+    load_speaker_index,
+    prepare_waveform,
+    publish_speaker_index,
+    rebuild_embedding,
+    recording_embedding_path,
+    save_recording_embedding,
+    verify_speaker,
 )
+from speaker_detector import meeting_store
+from speaker_detector.analysis import analyze_meeting
+from speaker_detector.ingest import INGEST_QUEUE
+from speaker_detector.profiling import collect_phases, peak_rss_mb, phase
+from speaker_detector.transcribe import get_backend
+from speaker_detector.catalog import probe_audio
 from speaker_detector.combine import combine_embeddings_from_folder
 from speaker_detector.export_embeddings import export_embeddings_to_json
 
+_MODEL_LOADED = time.perf_counter()  # importing core loads the model
 
 # ─── Configuration ──────────────────────────────────────────────────────────────
 
 load_dotenv()
 PORT = int(os.getenv("PORT", 9000))
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", 4))
+# Embed each saved chunk in the background so summaries only align and score
+INGEST_EMBED = os.getenv("INGEST_EMBED", "1") != "0"
+# Per-stage timings (convert, decode, embed, score, transcribe…) served at
+# /api/stage-metrics
+STAGE_METRICS = collect_phases() if os.getenv("STAGE_METRICS", "1") != "0" else None
+# Clip lengths (seconds) pushed through the model before /readyz reports ready;
+# empty skips the embedding warm-up
+WARMUP_SECONDS = [float(s) for s in os.getenv("WARMUP_SECONDS", "1,3,10").split(",") if s.strip()]
 
 BASE_DIR = Path(__file__).parent.resolve()
-MEETING_DIR = BASE_DIR / "storage" / "meetings"
-FAILED_DIR = BASE_DIR / "storage" / "failed_chunks"
-STORAGE_BASE = BASE_DIR / "storage"
+STORAGE_BASE = Path(os.getenv("SPEAKER_DETECTOR_STORAGE") or BASE_DIR / "storage")
+MEETING_DIR = STORAGE_BASE / "meetings"
+FAILED_DIR = STORAGE_BASE / "failed_chunks"
 SPEAKER_AUDIO_DIR = STORAGE_BASE / "speakers"
 EMBEDDINGS_DIR = STORAGE_BASE / "embeddings"
 TEMPLATES_DIR = BASE_DIR / "templates"
@@ -47,13 +93,11 @@ EXPORTS_DIR.mkdir(parents=True, exist_ok=True)
 for d in (MEETING_DIR, FAILED_DIR, STORAGE_BASE, SPEAKER_AUDIO_DIR, EMBEDDINGS_DIR):
     d.mkdir(parents=True, exist_ok=True)
 
-# Initialize OpenAI client
-client = OpenAI()
 
 # ─── Helper ────────────────────────────────────────────────────────────────────
 
-def convert_to_wav(input_path: str, output_path: str, sample_rate: int = 16000):
-    """Convert any audio to mono-16 kHz WAV via ffmpeg."""
+def convert_audio(input_path: str, output_path: str, sample_rate: int = 16000):
+    """Convert any audio to mono-16 kHz via ffmpeg; the container (WAV, FLAC…) follows output_path's extension."""
     cmd = [
         "ffmpeg", "-y",
         "-i", input_path,
@@ -61,12 +105,155 @@ def convert_to_wav(input_path: str, output_path: str, sample_rate: int = 16000):
         "-ac", "1",
         output_path,
     ]
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    with phase("convert"):
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     if proc.returncode != 0 or not os.path.exists(output_path):
         err = proc.stderr.decode(errors="ignore") or f"Missing output: {output_path}"
         return False, err
     return True, ""
 
+# Memoized GET bodies: key -> {"tag", "body", "etag", "encoded": {encoding: bytes}},
+# least recently used first
+_RESPONSE_CACHE = OrderedDict()
+_RESPONSE_LOCK = threading.Lock()
+RESPONSE_CACHE_SIZE = 256  # memoized bodies kept (pages × endpoints × exports)
+MIN_COMPRESS_BYTES = 512
+
+def _pick_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+def _encode_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def cached_response(key, tag, build_body, mimetype="application/json"):
+    """
+    Serves a memoized body for `key` while `tag` (a store version or file
+    stamp) is unchanged. `build_body()` only runs after `tag` moves. Sends
+    a strong ETag per encoding, answers If-None-Match with 304, and
+    gzip/brotli-compresses once per version.
+    """
+    with _RESPONSE_LOCK:
+        entry = _RESPONSE_CACHE.get(key)
+        if entry is not None:
+            _RESPONSE_CACHE.move_to_end(key)
+    if entry is None or entry["tag"] != tag:
+        body = build_body()
+        h = hashlib.blake2b(repr(tag).encode(), digest_size=8)
+        h.update(body)
+        entry = {"tag": tag, "body": body, "etag": h.hexdigest(), "encoded": {}}
+        with _RESPONSE_LOCK:
+            _RESPONSE_CACHE[key] = entry
+            _RESPONSE_CACHE.move_to_end(key)
+            while len(_RESPONSE_CACHE) > RESPONSE_CACHE_SIZE:
+                _RESPONSE_CACHE.popitem(last=False)
+
+    encoding = _pick_encoding() if len(entry["body"]) >= MIN_COMPRESS_BYTES else None
+    etag = entry["etag"] + (f"-{encoding}" if encoding else "")
+    headers = {"ETag": f'"{etag}"', "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    body = entry["body"]
+    if encoding:
+        body = entry["encoded"].get(encoding)
+        if body is None:
+            body = _encode_body(entry["body"], encoding)
+            entry["encoded"][encoding] = body
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype=mimetype, headers=headers)
+
+def cached_json(kind, build):
+    """
+    cached_response for JSON built from the catalog's `kind` store, keyed
+    on the parsed page arguments so unrelated query strings share an entry.
+    """
+    key = (request.path, *page_args())
+    return cached_response(
+        key, CATALOG.version(kind), lambda: json.dumps(build()).encode()
+    )
+
+def page_args():
+    """Reads optional ?limit=&offset= pagination parameters."""
+    limit = request.args.get("limit", type=int)
+    offset = request.args.get("offset", default=0, type=int)
+    return limit, max(offset, 0)
+
+# ─── Startup warm-up ──────────────────────────────────────────────────────────
+
+STARTUP = {"ready": False, "error": None, "phases": {}, "precision": None}
+
+
+def _phase(name, fn):
+    start = time.perf_counter()
+    fn()
+    STARTUP["phases"][name] = round((time.perf_counter() - start) * 1e3, 1)
+    print(f"⏱️  startup {name}: {STARTUP['phases'][name]:.0f} ms")
+
+
+def _warm_embeddings():
+    # One pass per length (kernel selection and allocator sizes depend on
+    # the input shape), then a mixed batch through the bucketing path
+    clips = [torch.randn(int(sec * MODEL_SAMPLE_RATE)) * 0.01 for sec in WARMUP_SECONDS]
+    for clip in clips:
+        embed_waveforms([clip], use_cache=False)
+    if len(clips) > 1:
+        embed_waveforms(clips, use_cache=False)
+
+
+def _warm_scoring():
+    index = load_speaker_index()
+    index.identify(torch.randn(4, MODEL_EMBEDDING_DIM))
+
+
+def settle_model():
+    """
+    Publishes the on-disk roster (replacing any shared index left from an
+    earlier run) and settles the encoder precision. Runs before the app is
+    set up: with MODEL_PRECISION=bf16 the check switches the shared encoder
+    between fp32 and bf16, which must not happen under live requests.
+    """
+    STARTUP["phases"]["model_load"] = round((_MODEL_LOADED - _BOOT_START) * 1e3, 1)
+    try:
+        _phase("speaker_index", publish_speaker_index)
+        _phase("precision", lambda: STARTUP.update(precision=ensure_model_precision()))
+    except Exception as e:
+        STARTUP["error"] = str(e)
+        traceback.print_exc()
+
+
+def warm_up():
+    """
+    Brings the server to a ready state: runs dummy clips through the model
+    (compiling the kernels of the settled precision), exercises index
+    scoring and opens the transcription connection pool. /readyz turns 200
+    once this finishes.
+    """
+    try:
+        if STARTUP["error"] is None:  # settle_model() failed otherwise
+            if WARMUP_SECONDS:
+                _phase("embedding", _warm_embeddings)
+            _phase("scoring", _warm_scoring)
+            _phase("transcriber", get_backend)
+            STARTUP["ready"] = True
+    except Exception as e:
+        STARTUP["error"] = str(e)
+        traceback.print_exc()
+    STARTUP["phases"]["total"] = round((time.perf_counter() - _BOOT_START) * 1e3, 1)
+    print(f"{'✅' if STARTUP['ready'] else '❌'} Warm-up finished in {STARTUP['phases']['total']:.0f} ms "
+          f"(model load {STARTUP['phases']['model_load']:.0f} ms)")
+
+
+settle_model()
+threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
 # ─── App Setup ────────────────────────────────────────────────────────────────
 
 app = Flask(
@@ -85,24 +272,58 @@ def index():
 def serve_storage(filename):
     return send_from_directory(str(STORAGE_BASE), filename)
 
+# —— Health
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify(status="ok", uptime=round(time.perf_counter() - _BOOT_START, 1))
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: model, speaker index and worker pools are warm."""
+    body = {
+        "ready": STARTUP["ready"],
+        "error": STARTUP["error"],
+        "phases_ms": STARTUP["phases"],
+        "precision": STARTUP["precision"],
+        "torch_threads": torch.get_num_threads(),
+        "ingest_queued": INGEST_QUEUE.pending(),
+    }
+    return jsonify(body), 200 if STARTUP["ready"] else 503
+
+@app.route("/api/stage-metrics", methods=["GET"])
+def stage_metrics():
+    """Server-side time per pipeline stage since boot (or the last ?reset=1)."""
+    if STAGE_METRICS is None:
+        return jsonify(error="Stage metrics are disabled (STAGE_METRICS=0)"), 404
+    reset = request.args.get("reset", default=0, type=int) == 1
+    return jsonify(
+        stages=STAGE_METRICS.snapshot(reset=reset),
+        ingest_queued=INGEST_QUEUE.pending(),
+        peak_rss_mb=peak_rss_mb(),
+    )
+
 # —— Speaker & Meeting Lists
 
 @app.route("/api/speakers", methods=["GET"])
 def api_speakers():
-    return jsonify(list_speakers())
+    limit, offset = page_args()
+    return cached_json("speakers", lambda: list_speakers(limit=limit, offset=offset))
 
 @app.route("/api/meetings", methods=["GET"])
 def api_meetings():
-    ids = [d.name for d in MEETING_DIR.iterdir() if d.is_dir()]
-    return jsonify(ids)
+    limit, offset = page_args()
+    return cached_json("meetings", lambda: CATALOG.meetings(limit=limit, offset=offset))
 
 @app.route("/api/recordings", methods=["GET"])
 def api_recordings():
-    rec = {}
-    for spk in SPEAKER_AUDIO_DIR.iterdir():
-        if spk.is_dir():
-            rec[spk.name] = sorted(f.name for f in spk.glob("*.wav"))
-    return jsonify(rec)
+    limit, offset = page_args()
+    return cached_json("speakers", lambda: CATALOG.recordings(limit=limit, offset=offset))
+
+@app.route("/api/cache-stats", methods=["GET"])
+def api_cache_stats():
+    return jsonify(EMBEDDING_CACHE.stats())
 
 # —— Generate Summary
 
@@ -113,61 +334,29 @@ def generate_summary(meeting_id):
         return jsonify(error="Meeting not found"), 404
 
     try:
-        # 1) Merge chunks
-        wavs = sorted(folder.glob("*.wav"))
-        if not wavs:
-            raise RuntimeError("No audio chunks to summarize.")
-        listfile = folder / f"{meeting_id}_files.txt"
-        listfile.write_text("\n".join(f"file '{str(p)}'" for p in wavs))
-
-        merged = folder / f"{meeting_id}_merged.wav"
-        subprocess.run([
-            "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-            "-i", str(listfile), "-c", "copy", str(merged)
-        ], check=True)
-
-        # 2) Whisper transcription
-        with open(merged, "rb") as mf:
-            resp = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=mf,
-                response_format="verbose_json",
-                temperature=0
-            )
-
-        # 3) Label segments
-        segments = []
-        # ...inside generate_summary() after you get each segment from Whisper:
-        for seg in resp.segments:
-            start, end, text = seg.start, seg.end, seg.text.strip()
-            tmp = NamedTemporaryFile(suffix=".wav", delete=False).name
-            subprocess.run([
-                "ffmpeg", "-y", "-i", str(merged),
-                "-ss", str(start), "-to", str(end),
-                "-ar", "16000", "-ac", "1", tmp
-            ], check=True)
-
-            spk = identify_speaker(tmp)  # ✅ improved speaker recognition
-            os.remove(tmp)
-
-            segments.append({
-                "start": round(start, 2),
-                "end":   round(end,   2),
-                "speaker": spk.get("speaker", "unknown"),
-                "score":   spk.get("score",   0.0),
-                "text":    text,
-            })
-
-        # Cleanup
-        merged.unlink()
-        listfile.unlink()
-
-        return jsonify(transcript=resp.text, segments=segments)
+        # Cached per meeting; only new audio is transcribed/embedded and only
+        # a roster change triggers rescoring (see analysis.analyze_meeting)
+        result = analyze_meeting(folder, CATALOG.version("roster"), workers=TRANSCRIBE_WORKERS)
+        return jsonify(result)
 
     except Exception as e:
         traceback.print_exc()
         return jsonify(error=str(e)), 500
 
+@app.route("/api/meetings/<meeting_id>/audio", methods=["GET"])
+def meeting_audio(meeting_id):
+    """Returns ?start=&end= (seconds) of a meeting as WAV, decoding only that range."""
+    folder = MEETING_DIR / meeting_id
+    if not folder.exists():
+        return jsonify(error="Meeting not found"), 404
+
+    start = request.args.get("start", default=0.0, type=float)
+    end = request.args.get("end", type=float)
+    wav, sr = meeting_store.read_range(folder, start, end)
+    buf = io.BytesIO()
+    torchaudio.save(buf, wav, sr, format="wav")
+    return Response(buf.getvalue(), mimetype="audio/wav")
+
 
 # —— Chunk saving, identify & enroll
 
@@ -184,13 +373,19 @@ def save_chunk():
 
     out_dir = MEETING_DIR / meeting_id
     out_dir.mkdir(parents=True, exist_ok=True)
-    wav_out = out_dir / f"{Path(file.filename).stem}.wav"
+    chunk_out = out_dir / f"{Path(file.filename).stem}{meeting_store.CHUNK_FORMAT}"
 
-    ok, err = convert_to_wav(tmp_webm, str(wav_out))
+    ok, err = convert_audio(tmp_webm, str(chunk_out))
     os.remove(tmp_webm)
     if not ok:
         return jsonify(error=err), 500
 
+    meeting_store.append_chunk(out_dir, chunk_out)
+    duration, _ = probe_audio(chunk_out)
+    CATALOG.add_meeting_chunk(meeting_id, duration)
+    if INGEST_EMBED:
+        INGEST_QUEUE.enqueue(out_dir, chunk_out.name)
+
     return jsonify(status="saved")
 
 @app.route("/api/identify", methods=["POST"])
@@ -203,7 +398,7 @@ def api_identify():
     file.save(tmp_webm)
     tmp_wav = tmp_webm + ".wav"
 
-    ok, err = convert_to_wav(tmp_webm, tmp_wav)
+    ok, err = convert_audio(tmp_webm, tmp_wav)
     os.remove(tmp_webm)
     if not ok:
         return jsonify(error=err), 500
@@ -212,6 +407,27 @@ def api_identify():
     os.remove(tmp_wav)
     return jsonify(res)
 
+@app.route("/api/verify/<speaker_id>", methods=["POST"])
+def api_verify(speaker_id):
+    file = request.files.get("file")
+    if not file:
+        return jsonify(error="Missing file"), 400
+
+    tmp_webm = NamedTemporaryFile(suffix=".webm", delete=False).name
+    file.save(tmp_webm)
+    tmp_wav = tmp_webm + ".wav"
+
+    ok, err = convert_audio(tmp_webm, tmp_wav)
+    os.remove(tmp_webm)
+    if not ok:
+        return jsonify(error=err), 500
+
+    res = verify_speaker(tmp_wav, speaker_id)
+    os.remove(tmp_wav)
+    if res.get("error", "").startswith("unknown speaker"):
+        return jsonify(res), 404
+    return jsonify(res)
+
 
 @app.route("/api/enroll/<speaker_id>", methods=["POST"])
 def api_enroll(speaker_id):
@@ -223,7 +439,7 @@ def api_enroll(speaker_id):
     file.save(tmp_webm)
     tmp_wav = tmp_webm + ".wav"
 
-    ok, err = convert_to_wav(tmp_webm, tmp_wav)
+    ok, err = convert_audio(tmp_webm, tmp_wav)
     os.remove(tmp_webm)
     if not ok:
         return jsonify(error=err), 500
@@ -251,13 +467,17 @@ def rename_speaker():
     if new_dir.exists():
         return jsonify(error="New speaker already exists"), 400
 
-    shutil.move(str(old_dir), str(new_dir))
-
-    # Also rename embedding file if exists
     old_emb = EMBEDDINGS_DIR / f"{old_name}.pt"
     new_emb = EMBEDDINGS_DIR / f"{new_name}.pt"
-    if old_emb.exists():
-        old_emb.rename(new_emb)
+
+    # Catalog commit only happens if the moves below succeed
+    with CATALOG.transaction():
+        CATALOG.rename_speaker(old_name, new_name, new_emb if old_emb.exists() else None)
+        shutil.move(str(old_dir), str(new_dir))
+
+        # Also rename embedding file if exists
+        if old_emb.exists():
+            old_emb.rename(new_emb)
 
     return jsonify(status="renamed", from_=old_name, to=new_name)
 
@@ -266,10 +486,12 @@ def delete_speaker(speaker_id):
     speaker_dir = SPEAKER_AUDIO_DIR / speaker_id
     emb_file = EMBEDDINGS_DIR / f"{speaker_id}.pt"
 
-    if speaker_dir.exists():
-        shutil.rmtree(speaker_dir)
-    if emb_file.exists():
-        emb_file.unlink()
+    with CATALOG.transaction():
+        CATALOG.delete_speaker(speaker_id)
+        if speaker_dir.exists():
+            shutil.rmtree(speaker_dir)
+        if emb_file.exists():
+            emb_file.unlink()
 
     return jsonify(deleted=True)
 
@@ -283,28 +505,33 @@ def improve_speaker(speaker_id):
     file.save(tmp_webm)
     tmp_wav = tmp_webm + ".wav"
 
-    ok, err = convert_to_wav(tmp_webm, tmp_wav)
+    ok, err = convert_audio(tmp_webm, tmp_wav)
     os.remove(tmp_webm)
     if not ok:
         return jsonify(error=err), 500
 
+    rec_id = dest_path = None
     try:
-        # Append new sample
-        speaker_dir = SPEAKER_AUDIO_DIR / speaker_id
-        speaker_dir.mkdir(parents=True, exist_ok=True)
-        existing = list(speaker_dir.glob("*.wav"))
-        dest_path = speaker_dir / f"{len(existing)+1}.wav"
+        # Append new sample, with its saved embedding as enrollment does
+        rec_id, dest_path = CATALOG.reserve_recording(speaker_id)
         shutil.move(tmp_wav, dest_path)
+        rec_emb_path = save_recording_embedding(dest_path, get_embedding(dest_path))
+        CATALOG.update_recording(rec_id, path=dest_path, embedding=rec_emb_path.name)
         print(f"🎙 Improved recording saved for {speaker_id} → {dest_path}")
 
         # Rebuild embedding
-        from speaker_detector.core import rebuild_embedding
         rebuild_embedding(speaker_id)
 
         return jsonify(status="improved", speaker=speaker_id)
     except Exception as e:
+        # Wherever it failed, leave no half-added recording behind for
+        # later rebuilds to count
         if os.path.exists(tmp_wav):
             os.remove(tmp_wav)
+        if rec_id is not None:
+            CATALOG.discard_recording(rec_id)
+            dest_path.unlink(missing_ok=True)
+            recording_embedding_path(dest_path).unlink(missing_ok=True)
         return jsonify(error=str(e)), 500
 
 
@@ -314,7 +541,9 @@ def improve_speaker(speaker_id):
 def delete_meeting(meeting_id):
     folder = MEETING_DIR / meeting_id
     if folder.exists():
-        shutil.rmtree(folder)
+        with CATALOG.transaction():
+            CATALOG.delete_meeting(meeting_id)
+            shutil.rmtree(folder)
         return jsonify(deleted=True)
     return jsonify(error="Not found"), 404
 
@@ -329,21 +558,31 @@ def correct_segment():
     filename = data["filename"]
 
     old_path = SPEAKER_AUDIO_DIR / old_speaker / filename
-    new_dir = SPEAKER_AUDIO_DIR / new_speaker
-    new_dir.mkdir(parents=True, exist_ok=True)
-    new_path = new_dir / filename
 
     if not old_path.exists():
         return jsonify(error="Old recording not found"), 404
 
     try:
         # Move file and optionally remove old
-        shutil.copyfile(old_path, new_path)
-        if data.get("delete_original", True):
-            old_path.unlink()
+        rec_id, new_path = CATALOG.reserve_recording(new_speaker)
+        old_emb, new_emb = recording_embedding_path(old_path), recording_embedding_path(new_path)
+        try:
+            shutil.copyfile(old_path, new_path)
+            if old_emb.exists():
+                shutil.copyfile(old_emb, new_emb)
+        except Exception:
+            CATALOG.discard_recording(rec_id)
+            new_path.unlink(missing_ok=True)
+            raise
+        with CATALOG.transaction():
+            CATALOG.update_recording(rec_id, path=new_path,
+                                     embedding=new_emb.name if new_emb.exists() else None)
+            if data.get("delete_original", True):
+                CATALOG.remove_recording(old_speaker, filename)
+                old_path.unlink()
+                old_emb.unlink(missing_ok=True)
 
         # Rebuild embedding
-        from speaker_detector.core import rebuild_embedding
         rebuild_embedding(new_speaker)
 
         # Log feedback for audit trail
@@ -362,7 +601,17 @@ def list_exports():
 
 @app.route("/exports/<filename>")
 def serve_export(filename):
-    return send_from_directory(str(EXPORTS_DIR), filename)
+    file_path = EXPORTS_DIR / filename
+    if file_path.suffix != ".json" or file_path.parent != EXPORTS_DIR:
+        return send_from_directory(str(EXPORTS_DIR), filename)
+    try:
+        st = file_path.stat()
+    except OSError:
+        abort(404)
+    # The file's stamp changes whenever the export pipeline rewrites it
+    return cached_response(
+        ("export", filename), (st.st_mtime_ns, st.st_size), file_path.read_bytes
+    )
 
 
 @app.route("/api/delete-export/<filename>", methods=["DELETE"])
@@ -382,10 +631,13 @@ def api_export_speakers_json():
         combined_file = str(STORAGE_BASE / "enrolled_speakers.pt")
         output_file = str(EXPORTS_DIR / "speakers.json")
 
-        combine_embeddings_from_folder(input_folder, combined_file)
-        export_embeddings_to_json(combined_file, output_file)
+        changed = combine_embeddings_from_folder(input_folder, combined_file)
+        if not os.path.exists(combined_file):
+            return jsonify(error="No valid embeddings to export"), 400
+        exported = export_embeddings_to_json(combined_file, output_file, force=changed)
 
-        return jsonify(status="combined and exported", output=str(output_file))
+        status = "combined and exported" if exported else "unchanged"
+        return jsonify(status=status, output=str(output_file))
     except Exception as e:
         return jsonify(error=str(e)), 500
 
@@ -0,0 +1,257 @@
+import json
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+
+import torch
+
+from speaker_detector import ingest, meeting_store
+from speaker_detector.catalog import file_sha256
+from speaker_detector.core import (
+    embed_waveforms,
+    load_speaker_index,
+    model_version,
+    prepare_waveform,
+)
+from speaker_detector.profiling import phase
+from speaker_detector.transcribe import transcribe_meeting
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-flight is per process only
+    fcntl = None
+
+RESULT_NAME = "analysis.json"
+EMBEDDINGS_NAME = "analysis.pt"
+LOCK_NAME = "analysis.lock"
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+# ─── Cache files ──────────────────────────────────────────────────────────────
+
+def _load_cache(meeting_dir):
+    try:
+        with open(meeting_dir / RESULT_NAME) as f:
+            cache = json.load(f)
+        embs = torch.load(meeting_dir / EMBEDDINGS_NAME, map_location="cpu")
+    except (OSError, ValueError, RuntimeError):
+        return {}, None
+    if not isinstance(embs, torch.Tensor) or len(embs) != len(cache.get("segments", [])):
+        embs = None
+    return cache, embs
+
+
+def _save_cache(meeting_dir, cache, embs):
+    # Embeddings first: a result file is only trusted if its row count matches
+    tmp = meeting_dir / f"{EMBEDDINGS_NAME}.{threading.get_ident()}.tmp"
+    torch.save(embs, tmp)
+    os.replace(tmp, meeting_dir / EMBEDDINGS_NAME)
+    tmp = meeting_dir / f"{RESULT_NAME}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, meeting_dir / RESULT_NAME)
+
+
+def _fingerprint(meeting_dir, chunks, previous):
+    """
+    (file, frames, size, mtime_ns, sha256) per chunk. Hashes are reused from
+    `previous` when size and mtime are unchanged, so only new or rewritten
+    chunks are read.
+    """
+    known = {c["file"]: c for c in previous}
+    out = []
+    for c in chunks:
+        st = (meeting_dir / c["file"]).stat()
+        old = known.get(c["file"])
+        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            out.append(old)
+            continue
+        out.append({"file": c["file"], "frames": c["frames"], "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns, "sha256": file_sha256(meeting_dir / c["file"])})
+    return out
+
+
+def _same_chunk(a, b):
+    return a["file"] == b["file"] and a["size"] == b["size"] and a["sha256"] == b["sha256"]
+
+
+# ─── Embedding & scoring ──────────────────────────────────────────────────────
+
+def _embed_segments(meeting_dir, index, segments):
+    """
+    [S, D] segment embeddings. Each segment is the mean of the speech-window
+    embeddings stored at ingest that fall inside it; segments with no such
+    window (short or quiet) are embedded from their own audio. Rows of empty
+    segments are zero.
+    """
+    starts, ends, windows = ingest.meeting_windows(meeting_dir, index)
+    embs, found = ingest.pool_windows(starts, ends, windows, segments)
+    wavs, rows = [], []
+    for i, seg in enumerate(segments):
+        if found[i]:
+            continue
+        wav, sr = meeting_store.read_range(meeting_dir, seg["start"], seg["end"], index)
+        if wav.shape[-1] > 0:
+            wavs.append(prepare_waveform(wav, sr))
+            rows.append(i)
+    if wavs:
+        # One-off clips, cached with the analysis; not in the clip cache
+        embs[rows] = embed_waveforms(wavs, use_cache=False)
+    return embs
+
+
+def _label(segments, embs):
+    """
+    Scores every segment against the current roster in one batch. Segments
+    scored without some shards keep the "partial" and "missing_shards" keys.
+    """
+    speakers = load_speaker_index()
+    has_audio = embs.abs().sum(dim=1) > 0
+    results = speakers.identify(embs) if len(segments) else []
+    labelled = []
+    for seg, spk, ok in zip(segments, results, has_audio.tolist()):
+        if not ok:
+            spk = {"speaker": "unknown", "score": 0.0}
+        entry = {
+            "start": round(seg["start"], 2),
+            "end": round(seg["end"], 2),
+            "speaker": spk.get("speaker", "unknown"),
+            "score": spk.get("score", 0.0),
+            "text": seg["text"],
+        }
+        if spk.get("partial"):
+            entry.update(partial=True, missing_shards=spk.get("missing_shards", []))
+        labelled.append(entry)
+    return labelled
+
+
+# ─── Analysis ─────────────────────────────────────────────────────────────────
+
+def _analyze(meeting_dir, roster_version, workers):
+    index = meeting_store.load_index(meeting_dir)
+    if not index["chunks"]:
+        raise RuntimeError("No audio chunks to summarize.")
+    sr = index["sample_rate"]
+
+    cache, cached_embs = _load_cache(meeting_dir)
+    old_chunks = cache.get("chunks", [])
+    chunks = _fingerprint(meeting_dir, index["chunks"], old_chunks)
+
+    prefix = 0
+    for old, new in zip(old_chunks, chunks):
+        if not _same_chunk(old, new):
+            break
+        prefix += 1
+    audio_same = prefix == len(old_chunks) == len(chunks)
+    model_same = cache.get("model_version") == model_version()
+
+    if audio_same and model_same and not cache.get("errors") and cache.get("roster_version") == roster_version:
+        return dict(cache["result"], reused={"transcribed_sec": 0.0, "embedded": 0, "rescored": False})
+
+    segments = cache.get("segments", [])
+    embs = cached_embs if model_same else None
+    if prefix < len(old_chunks) or not old_chunks:
+        # No cache, or a cached chunk changed or vanished: start over
+        segments, embs, resume = [], None, 0.0
+    elif audio_same and not cache.get("errors"):
+        resume = None
+    else:
+        # Redo from the last cached segment (it may have been cut off at the
+        # old end of the audio) or from the first failed piece
+        covered = sum(c["frames"] for c in old_chunks) / sr
+        resume = segments[-1]["start"] if segments else covered
+        for err in cache.get("errors", []):
+            resume = min(resume, err["start"])
+
+    kept = segments if resume is None else [s for s in segments if s["end"] <= resume]
+    errors = cache.get("errors", []) if resume is None else []
+    transcribed = 0.0
+    if resume is not None:
+        if kept:
+            resume = kept[-1]["end"]
+        elif segments:
+            resume = 0.0
+        with phase("transcribe"):
+            fresh = transcribe_meeting(meeting_dir, workers=workers, index=index, start=resume)
+        segments = kept + fresh["segments"]
+        errors = fresh["errors"]
+        transcribed = meeting_store.duration(index) - resume
+
+    n_reused = min(len(kept), len(embs)) if embs is not None else 0
+    new_embs = _embed_segments(meeting_dir, index, segments[n_reused:])
+    embs = torch.cat([embs[:n_reused], new_embs]) if n_reused else new_embs
+
+    with phase("score"):
+        labelled = _label(segments, embs)
+    result = {
+        "transcript": " ".join(s["text"] for s in segments if s["text"]),
+        "segments": labelled,
+        "errors": errors,
+    }
+    # Labels from a partial roster (a shard missed its budget) are not
+    # reused: the transcript and embeddings are cached, the scores redone
+    partial = any(seg.get("partial") for seg in labelled)
+    _save_cache(meeting_dir, {
+        "chunks": chunks,
+        "model_version": model_version(),
+        "roster_version": None if partial else roster_version,
+        "segments": segments,
+        "errors": errors,
+        "result": result,
+    }, embs)
+    return dict(result, reused={"transcribed_sec": round(transcribed, 2),
+                                "embedded": len(segments) - n_reused, "rescored": True})
+
+
+@contextmanager
+def _meeting_lock(meeting_dir):
+    if fcntl is None:
+        yield
+        return
+    with open(meeting_dir / LOCK_NAME, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def analyze_meeting(meeting_dir, roster_version, workers=4):
+    """
+    Returns {"transcript", "segments", "errors", "reused"} for a meeting,
+    served from a cache in the meeting folder when possible.
+
+    The cache is keyed by the chunk list (names, sizes, sha256), the model
+    version and `roster_version` (the catalog's "roster" counter, which
+    empty recording slots do not move). New chunks at the end are transcribed
+    and embedded on their own; if only the roster changed, cached segment
+    embeddings are rescored; if nothing changed the stored result is
+    returned. Concurrent calls for one meeting share a single computation:
+    threads in this process wait on the leader, and other processes wait
+    on a lock file and then find the fresh cache.
+    """
+    meeting_dir = Path(meeting_dir)
+    key = str(meeting_dir.resolve())
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        return future.result()
+
+    try:
+        with _meeting_lock(meeting_dir):
+            result = _analyze(meeting_dir, roster_version, workers)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
@@ -1,59 +1,45 @@
-from pathlib import Path
-import torchaudio
 import torch
-from speaker_detector.core import get_embedding, STORAGE_DIR
-
-CHUNK_DURATION = 2.5  # seconds
-
-def match_speaker(embedding, speaker_embeddings):
-    scores = {}
-    for name, emb in speaker_embeddings.items():
-        score = torch.nn.functional.cosine_similarity(emb, embedding, dim=0).item()
-        scores[name] = score
-    if not scores:
-        return "unknown", 0.0
-    best = max(scores.items(), key=lambda kv: kv[1])
-    return best[0], round(best[1], 3)
-
-def analyze_meeting(wav_path):
-    waveform, sample_rate = torchaudio.load(wav_path)
-    duration_sec = waveform.shape[1] / sample_rate
-
-    chunk_samples = int(CHUNK_DURATION * sample_rate)
-    num_chunks = int(waveform.shape[1] / chunk_samples)
-
-    # Load enrolled speaker embeddings
-    speaker_embeddings = {}
-    for spk_dir in STORAGE_DIR.iterdir():
-        if not spk_dir.is_dir():
-            continue
-        wavs = list(spk_dir.glob("*.wav"))
-        if not wavs:
-            continue
-        # Average multiple embeddings
-        embs = [get_embedding(str(wav)) for wav in wavs]
-        speaker_embeddings[spk_dir.name] = torch.stack(embs).mean(dim=0)
-
-    results = []
-
-    for i in range(num_chunks):
-        start_sample = i * chunk_samples
-        end_sample = start_sample + chunk_samples
-        chunk = waveform[:, start_sample:end_sample]
-
-        tmp_path = Path(wav_path).parent / f"tmp_chunk_{i}.wav"
-        torchaudio.save(str(tmp_path), chunk, sample_rate)
-
-        embedding = get_embedding(str(tmp_path))
-        speaker, score = match_speaker(embedding, speaker_embeddings)
-
-        results.append({
-            "start": round(i * CHUNK_DURATION, 2),
-            "end": round((i + 1) * CHUNK_DURATION, 2),
-            "speaker": speaker,
-            "score": score
-        })
-
-        tmp_path.unlink()  # clean up
+import torchaudio
 
+from speaker_detector.audio_info import audio_info
+from speaker_detector.core import load_speaker_index
+from speaker_detector.pipeline import DECODE_WORKERS, EMBED_BATCH, FEATURE_WORKERS
+from speaker_detector.segmentation import blocks, turn_pipeline
+
+
+def analyze_meeting(wav_path, decode_workers=DECODE_WORKERS, feature_workers=FEATURE_WORKERS,
+                    batch_size=EMBED_BATCH, stats=None):
+    """
+    Labels each speaker turn of a recording: [{"start", "end", "speaker",
+    "score"}] in seconds. Turns come from change-point segmentation, and
+    each is embedded once (from at most MAX_EMBED_SEC of it). The file is
+    decoded block by block in a pipeline, so decoding and segmentation run
+    alongside the model; pass a dict as `stats` to get per-stage
+    utilization.
+    """
+    frames, sr = audio_info(wav_path)
+
+    def read_block(start, end):
+        lo, hi = int(start * sr), int(end * sr)
+        return torchaudio.load(str(wav_path), frame_offset=lo, num_frames=hi - lo)
+
+    index = load_speaker_index()
+
+    def score(turns):
+        matches = index.identify(torch.stack([emb for _, _, emb in turns]))
+        return [
+            {
+                "start": round(start, 2),
+                "end": round(end, 2),
+                "speaker": match["speaker"],
+                "score": round(match["score"], 3),
+            }
+            for (start, end, _), match in zip(turns, matches)
+        ]
+
+    pipeline = turn_pipeline(read_block, score, decode_workers=decode_workers,
+                             feature_workers=feature_workers, batch_size=batch_size)
+    results = pipeline.run(blocks(frames / sr))
+    if stats is not None:
+        stats.update(pipeline.stats())
     return results
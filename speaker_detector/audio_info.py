@@ -0,0 +1,10 @@
+import soundfile
+
+
+def audio_info(path):
+    """
+    Returns (num_frames, sample_rate) from the file header; no samples are
+    decoded. Raises on unreadable or unsupported files.
+    """
+    info = soundfile.info(str(path))
+    return info.frames, info.samplerate
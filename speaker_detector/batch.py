@@ -0,0 +1,394 @@
+import csv
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import torch
+import torchaudio
+
+from speaker_detector.catalog import file_sha256
+from speaker_detector.core import (
+    BASE_DIR,
+    CATALOG,
+    EMBEDDINGS_DIR,
+    MODEL_SAMPLE_RATE,
+    SPEAKER_AUDIO_DIR,
+    embed_waveforms,
+    load_audio,
+    load_speaker_index,
+    recording_embedding_path,
+    save_recording_embedding,
+    stored_recording_embeddings,
+)
+from speaker_detector.index import MATCH_THRESHOLD, sub_centroids
+from speaker_detector.profiling import phase
+
+AUDIO_SUFFIXES = {".wav", ".flac", ".ogg", ".mp3", ".webm"}
+PROGRESS_EVERY = 500  # files between throughput reports
+CLUSTER_SAMPLES = 256  # per-speaker embeddings kept for sub-centroid clustering
+
+
+def iter_inputs(source):
+    """
+    Yields audio paths from a directory (recursively) or a manifest file.
+
+    Manifests may be plain text (one path per line), CSV with a `path`
+    column, or JSONL with a "path" key. Relative manifest paths resolve
+    against the manifest's folder.
+    """
+    source = Path(source)
+    if source.is_dir():
+        for p in sorted(source.rglob("*")):
+            if p.suffix.lower() in AUDIO_SUFFIXES and p.is_file():
+                yield p
+        return
+
+    base = source.parent
+    with open(source, newline="") as f:
+        if source.suffix == ".csv":
+            rows = (row["path"] for row in csv.DictReader(f))
+        elif source.suffix == ".jsonl":
+            rows = (json.loads(line)["path"] for line in f if line.strip())
+        else:
+            rows = (line.strip() for line in f if line.strip() and not line.startswith("#"))
+        for row in rows:
+            p = Path(row)
+            yield p if p.is_absolute() else base / p
+
+
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _safe_load(path):
+    try:
+        return load_audio(path), None
+    except Exception as e:
+        return None, str(e)
+
+
+def decoded_batches(items, batch_size, workers, loader=_safe_load, prefetch=2):
+    """
+    Runs `loader(item) -> (wav, error)` over `items` in a thread pool and
+    yields lists of (item, wav, error) in input order, keeping at most
+    `prefetch` batches in flight.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for group in _batched(items, batch_size):
+            pending.append([(p, pool.submit(loader, p)) for p in group])
+            if len(pending) > prefetch:
+                group_futures = pending.popleft()
+                yield [(p, *fut.result()) for p, fut in group_futures]
+        while pending:
+            group_futures = pending.popleft()
+            yield [(p, *fut.result()) for p, fut in group_futures]
+
+
+def _prepare_output(out_path, resume):
+    """Opens the JSONL output and returns (file, already_done_paths)."""
+    if out_path is None:
+        return sys.stdout, set()
+
+    out_path = Path(out_path)
+    done = set()
+    if resume and out_path.exists():
+        # Drop a trailing partial line left by an interrupted run
+        data = out_path.read_bytes()
+        keep = data[: data.rfind(b"\n") + 1]
+        if len(keep) != len(data):
+            out_path.write_bytes(keep)
+        for line in keep.decode("utf-8").splitlines():
+            try:
+                done.add(json.loads(line)["path"])
+            except (ValueError, KeyError):
+                continue
+        return open(out_path, "a"), done
+    return open(out_path, "w"), done
+
+
+def identify_batch(source, out_path=None, workers=4, batch_size=16, top_k=3,
+                   threshold=MATCH_THRESHOLD, resume=False):
+    """
+    Identifies every file in a directory or manifest against the enrolled
+    speakers and streams one JSON line per file to `out_path` (stdout if
+    None). The speaker index is loaded once; audio is decoded in a thread
+    pool and embedded `batch_size` files per forward pass.
+    """
+    index = load_speaker_index()
+    out, done = _prepare_output(out_path, resume)
+    paths = (p for p in iter_inputs(source) if str(p) not in done)
+    if done:
+        print(f"⏩ Resuming: {len(done)} files already scored", file=sys.stderr)
+
+    n_files = n_errors = 0
+    audio_sec = 0.0
+    start = time.perf_counter()
+    try:
+        for group in decoded_batches(paths, batch_size, workers):
+            ok = [(p, wav) for p, wav, err in group if err is None]
+            results = []
+            if ok:
+                try:
+                    embs = embed_waveforms([wav for _, wav in ok])
+                    with phase("score"):
+                        results = index.identify(embs, threshold=threshold, top_k=top_k)
+                except Exception as e:
+                    group = [(p, None, err or f"embedding failed: {e}") for p, _, err in group]
+                    ok = []
+
+            lines = []
+            for (p, wav), res in zip(ok, results):
+                audio_sec += wav.shape[-1] / MODEL_SAMPLE_RATE
+                lines.append({
+                    "path": str(p),
+                    "speaker": res["speaker"],
+                    "score": res["score"],
+                    "top_k": [{"speaker": k, "score": v} for k, v in res.get("all_scores", {}).items()],
+                })
+            for p, _, err in group:
+                if err is not None:
+                    n_errors += 1
+                    lines.append({"path": str(p), "error": err})
+
+            out.write("".join(json.dumps(line) + "\n" for line in lines))
+            out.flush()
+            n_files += len(group)
+
+            now = time.perf_counter()
+            if n_files // PROGRESS_EVERY != (n_files - len(group)) // PROGRESS_EVERY:
+                print(f"… {n_files} files, {n_files / (now - start):.1f} files/s", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "files": n_files,
+        "errors": n_errors,
+        "seconds": round(elapsed, 2),
+        "files_per_sec": round(n_files / elapsed, 2) if elapsed else 0.0,
+        "audio_x_realtime": round(audio_sec / elapsed, 1) if elapsed else 0.0,
+    }
+    print(f"✅ Scored {n_files} files ({n_errors} errors) in {stats['seconds']}s — "
+          f"{stats['files_per_sec']} files/s, {stats['audio_x_realtime']}× realtime", file=sys.stderr)
+    return stats
+
+
+def iter_enrollments(source):
+    """
+    Yields (speaker, path) pairs from a `speaker/*.wav` directory tree or a
+    CSV/JSONL manifest with `speaker` and `path` fields.
+    """
+    source = Path(source)
+    if source.is_dir():
+        for spk_dir in sorted(source.iterdir()):
+            if not spk_dir.is_dir():
+                continue
+            for p in sorted(spk_dir.iterdir()):
+                if p.suffix.lower() in AUDIO_SUFFIXES and p.is_file():
+                    yield spk_dir.name, p
+        return
+
+    base = source.parent
+    with open(source, newline="") as f:
+        if source.suffix == ".jsonl":
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            p = Path(row["path"])
+            yield row["speaker"], (p if p.is_absolute() else base / p)
+
+
+def _staging_loader(staging_dir):
+    """Decodes an enrollment file and copies it into `staging_dir`, hashing it on the way."""
+    counter = itertools.count()
+
+    def load(item):
+        speaker, path = item
+        try:
+            wav = load_audio(path)
+            staged = staging_dir / f"{next(counter)}.wav"
+            if Path(path).suffix.lower() == ".wav":
+                shutil.copyfile(path, staged)
+            else:
+                torchaudio.save(str(staged), wav.unsqueeze(0), MODEL_SAMPLE_RATE)
+            return (wav, staged, file_sha256(staged)), None
+        except Exception as e:
+            return None, str(e)
+
+    return load
+
+
+class _Reservoir:
+    """Uniform sample of at most `size` embeddings from a stream."""
+
+    def __init__(self, size=CLUSTER_SAMPLES, seed=0):
+        self.size = size
+        self.items = []
+        self.seen = 0
+        self._rng = random.Random(seed)
+
+    def add(self, emb):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(emb)
+        else:
+            j = self._rng.randrange(self.seen)
+            if j < self.size:
+                self.items[j] = emb
+
+
+def _commit_enrollments(samples, staged):
+    """
+    Publishes staged recordings and new sub-centroids in one catalog
+    transaction. Each speaker's sampled new embeddings are clustered
+    together with the saved embeddings of their existing recordings, so
+    the result matches rebuild_embedding. Audio, per-recording and speaker
+    embeddings are moved into place with os.replace. On failure the
+    recordings are moved back, replaced embeddings are restored from
+    backups, and speaker folders created for the commit are removed again.
+    """
+    pending_embs = []
+    for speaker, reservoir in samples.items():
+        embs = torch.stack(reservoir.items)
+        existing = list((SPEAKER_AUDIO_DIR / speaker).glob("*.wav"))
+        if existing:
+            embs = torch.cat([embs, stored_recording_embeddings(existing)])
+        emb_path = EMBEDDINGS_DIR / f"{speaker}.pt"
+        tmp_path = emb_path.with_name(emb_path.name + ".tmp")
+        torch.save(sub_centroids(embs), tmp_path)
+        pending_embs.append((speaker, tmp_path, emb_path))
+
+    new_dirs = {SPEAKER_AUDIO_DIR / speaker for speaker, _, _ in staged
+                if not (SPEAKER_AUDIO_DIR / speaker).exists()}
+    placed, swapped = [], []
+    try:
+        with CATALOG.transaction():
+            for speaker, staged_path, sha256 in staged:
+                rec_id, dest = CATALOG.reserve_recording(speaker)
+                os.replace(staged_path, dest)
+                placed.append((dest, staged_path))
+                staged_emb, dest_emb = recording_embedding_path(staged_path), recording_embedding_path(dest)
+                os.replace(staged_emb, dest_emb)
+                placed.append((dest_emb, staged_emb))
+                CATALOG.update_recording(rec_id, path=dest, sha256=sha256, embedding=dest_emb.name)
+            for speaker, tmp_path, emb_path in pending_embs:
+                CATALOG.set_speaker_embedding(speaker, emb_path)
+            for speaker, tmp_path, emb_path in pending_embs:
+                backup = emb_path.with_name(emb_path.name + ".bak")
+                if emb_path.exists():
+                    shutil.copy2(emb_path, backup)
+                else:
+                    backup = None
+                swapped.append((emb_path, backup))
+                os.replace(tmp_path, emb_path)
+    except Exception:
+        for emb_path, backup in swapped:
+            try:
+                if backup is not None:
+                    os.replace(backup, emb_path)
+                else:
+                    emb_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+        for dest, staged_path in placed:
+            try:
+                os.replace(dest, staged_path)
+            except OSError:
+                pass
+        for _, tmp_path, _ in pending_embs:
+            tmp_path.unlink(missing_ok=True)
+        for speaker_dir in new_dirs:
+            try:
+                speaker_dir.rmdir()
+            except OSError:
+                pass
+        raise
+    for _, backup in swapped:
+        if backup is not None:
+            backup.unlink(missing_ok=True)
+
+
+def enroll_bulk(source, workers=4, batch_size=16, report_path=None):
+    """
+    Enrolls every file in a manifest or `speaker/*.wav` tree in one pass.
+
+    Files are decoded and staged in a thread pool and embedded in batches.
+    A bounded sample of each speaker's embeddings is kept as batches
+    finish, and sub-centroids are clustered once per speaker at the end.
+    Store updates are published together, and failed files are listed in
+    `report_path` (JSONL) if given.
+    """
+    samples = {}
+    staged, errors = [], []
+    n_files = 0
+    start = time.perf_counter()
+    staging_dir = Path(tempfile.mkdtemp(prefix=".enroll-", dir=BASE_DIR))
+    try:
+        loader = _staging_loader(staging_dir)
+        for group in decoded_batches(iter_enrollments(source), batch_size, workers, loader=loader):
+            ok = [(item, res) for item, res, err in group if err is None]
+            errors += [{"speaker": s, "path": str(p), "error": err}
+                       for (s, p), _, err in group if err is not None]
+            embs = []
+            if ok:
+                try:
+                    embs = embed_waveforms([res[0] for _, res in ok])
+                except Exception as e:
+                    errors += [{"speaker": s, "path": str(p), "error": f"embedding failed: {e}"}
+                               for (s, p), _ in ok]
+                    ok = []
+            for ((speaker, _), (_, staged_path, sha256)), emb in zip(ok, embs):
+                samples.setdefault(speaker, _Reservoir()).add(emb.clone())
+                save_recording_embedding(staged_path, emb)
+                staged.append((speaker, staged_path, sha256))
+
+            n_files += len(group)
+            if n_files // PROGRESS_EVERY != (n_files - len(group)) // PROGRESS_EVERY:
+                elapsed = time.perf_counter() - start
+                print(f"… {n_files} files, {len(samples)} speakers, {len(errors)} errors, "
+                      f"{n_files / elapsed:.1f} files/s", file=sys.stderr)
+
+        if staged:
+            _commit_enrollments(samples, staged)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    if report_path is not None:
+        with open(report_path, "w") as f:
+            f.write("".join(json.dumps(e) + "\n" for e in errors))
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "files": n_files,
+        "enrolled": len(staged),
+        "speakers": len(samples),
+        "errors": len(errors),
+        "seconds": round(elapsed, 2),
+        "files_per_sec": round(n_files / elapsed, 2) if elapsed else 0.0,
+    }
+    print(f"✅ Enrolled {stats['enrolled']} files for {stats['speakers']} speakers "
+          f"({stats['errors']} errors) in {stats['seconds']}s — {stats['files_per_sec']} files/s",
+          file=sys.stderr)
+    for e in errors[:10]:
+        print(f"❌ {e['speaker']}: {e['path']} — {e['error']}", file=sys.stderr)
+    if len(errors) > 10:
+        print(f"   … and {len(errors) - 10} more", file=sys.stderr)
+    return stats
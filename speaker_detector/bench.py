@@ -0,0 +1,176 @@
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import torch
+
+from speaker_detector.core import (
+    MODEL,
+    MODEL_SAMPLE_RATE,
+    SHARDED_INDEX,
+    embed_waveforms,
+    get_resampler,
+    precision_check_clips,
+    load_speaker_index,
+    prepare_waveform,
+)
+from speaker_detector.index import SpeakerIndex
+from speaker_detector.precision import check_precision, get_precision, set_precision
+from speaker_detector.scheduler import run_bucketed
+from speaker_detector.stub_transcriber import make_handler
+from speaker_detector.transcribe import WhisperHTTPBackend, transcribe_waveform
+
+RESAMPLE_RATES = (8000, 16000, 22050, 32000, 44100, 48000)
+FEATURE_FRAMES_PER_SEC = 100  # Fbank hop of 10 ms
+
+
+def _timeit(fn, repeats):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def bench_resample(rates=RESAMPLE_RATES, seconds=10.0, channels=2, batch=8, repeats=5):
+    """
+    Reports the front-end cost (downmix + resample to MODEL_SAMPLE_RATE)
+    for each source rate: kernel build time on first use, and steady-state
+    time per batch with the cached kernel.
+    """
+    print(f"⏱️  Front-end: {batch}×{channels}ch × {seconds:g}s → {MODEL_SAMPLE_RATE} Hz mono")
+    print(f"{'rate':>7} {'kernel ms':>10} {'batch ms':>10} {'x realtime':>11}")
+    rows = []
+    for rate in rates:
+        signal = torch.randn(batch, channels, int(seconds * rate))
+
+        start = time.perf_counter()
+        if rate != MODEL_SAMPLE_RATE:
+            get_resampler(rate)
+        kernel_s = time.perf_counter() - start
+
+        per_batch = _timeit(lambda: prepare_waveform(signal, rate), repeats)
+        realtime = (batch * seconds) / per_batch if per_batch else float("inf")
+        rows.append({"rate": rate, "kernel_ms": kernel_s * 1e3,
+                     "batch_ms": per_batch * 1e3, "realtime": realtime})
+        print(f"{rate:>7} {kernel_s * 1e3:>10.2f} {per_batch * 1e3:>10.2f} {realtime:>10.0f}×")
+    return rows
+
+
+def bench_bucketing(n_segments=64, min_sec=0.5, max_sec=30.0, batch_size=16,
+                    max_padded_sec=240.0, seed=0):
+    """
+    Runs the ECAPA encoder over Whisper-like segments (uniform lengths
+    between min_sec and max_sec) twice: fixed-size batches in arrival
+    order, then length buckets capped at max_padded_sec of padded audio.
+    Reports padding efficiency and throughput for both.
+    """
+    rng = random.Random(seed)
+    n_mels = 80
+    feats = [
+        torch.randn(int(rng.uniform(min_sec, max_sec) * FEATURE_FRAMES_PER_SEC), n_mels)
+        for _ in range(n_segments)
+    ]
+    encoder = MODEL.mods.embedding_model.eval()
+    forward = lambda x, lengths: encoder(x, lengths=lengths)
+    cap = int(max_padded_sec * FEATURE_FRAMES_PER_SEC)
+
+    print(f"🪣 Bucketing: {n_segments} segments, {min_sec:g}–{max_sec:g}s")
+    run_bucketed(forward, feats[:batch_size], float("inf"), batch_size)  # warm-up
+    plain_stats = _fixed_batches(forward, feats, batch_size)
+    _, bucket_stats = run_bucketed(forward, feats, cap, max_batch=max(batch_size, 64))
+
+    print(f"{'mode':>10} {'batches':>8} {'pad eff':>8} {'seg/s':>8} {'audio x rt':>11}")
+    total_sec = sum(f.shape[0] for f in feats) / FEATURE_FRAMES_PER_SEC
+    for name, st in (("fixed", plain_stats), ("bucketed", bucket_stats)):
+        print(f"{name:>10} {st['batches']:>8} {st['padding_efficiency']:>8.3f} "
+              f"{st['items_per_sec']:>8.1f} {total_sec / st['seconds']:>10.0f}×")
+    return {"fixed": plain_stats, "bucketed": bucket_stats}
+
+
+def _fixed_batches(forward, feats, batch_size):
+    totals = {"items": 0, "batches": 0, "frames": 0, "padded_frames": 0, "seconds": 0.0}
+    for i in range(0, len(feats), batch_size):
+        group = feats[i:i + batch_size]
+        # An infinite cap and max_batch=len(group) yield one batch in arrival order
+        _, st = run_bucketed(forward, group, float("inf"), max_batch=len(group))
+        for k in totals:
+            totals[k] += st[k]
+    totals["padding_efficiency"] = round(totals["frames"] / totals["padded_frames"], 3)
+    totals["items_per_sec"] = totals["items"] / totals["seconds"]
+    return totals
+
+
+def bench_transcribe(minutes=20.0, workers=(1, 4, 8), latency=0.2, realtime_factor=0.01,
+                     fail_rate=0.05):
+    """
+    Transcribes a synthetic meeting against the local stub transcriber
+    (no network, no API key) with 1..N concurrent pieces, so the split,
+    pooled upload, retry and stitch path is timed end to end offline.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(
+        latency=latency, realtime_factor=realtime_factor, fail_rate=fail_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/audio/transcriptions"
+
+    sr = MODEL_SAMPLE_RATE
+    wav = torch.randn(int(minutes * 60 * sr)) * 0.1
+    # Short silent gaps every ~7 s give the splitter realistic cut points
+    for t in range(0, wav.shape[0], 7 * sr):
+        wav[t:t + sr // 4] = 0
+
+    print(f"📝 Transcription: {minutes:g} min against stub "
+          f"({latency:g}s + {realtime_factor:g}×rt per piece, {fail_rate:.0%} 503s)")
+    print(f"{'workers':>8} {'seconds':>8} {'segments':>9} {'errors':>7} {'x realtime':>11}")
+    rows = []
+    try:
+        for n in workers:
+            backend = WhisperHTTPBackend(url=url, backoff=0.05, pool_size=n)
+            start = time.perf_counter()
+            result = transcribe_waveform(wav, sr, backend=backend, workers=n)
+            elapsed = time.perf_counter() - start
+            rows.append({"workers": n, "seconds": elapsed,
+                         "segments": len(result["segments"]), "errors": len(result["errors"])})
+            print(f"{n:>8} {elapsed:>8.2f} {len(result['segments']):>9} "
+                  f"{len(result['errors']):>7} {minutes * 60 / elapsed:>10.0f}×")
+    finally:
+        server.shutdown()
+        server.server_close()
+    return rows
+
+
+def bench_precision(precision="bf16", repeats=3):
+    """
+    Compares the encoder in fp32 and `precision` on the enrolled roster
+    (the same check the server runs at boot, without its cache): time per
+    pass, top-1 agreement and score drift. Restores the previous mode.
+    """
+    encoder = MODEL.mods.embedding_model
+    previous = get_precision(encoder)
+    clips = precision_check_clips()
+    # As at boot: a sharded roster is not held here, so compare embeddings
+    index = load_speaker_index() if SHARDED_INDEX is None else SpeakerIndex([], None)
+    seconds = sum(len(c) for c in clips) / MODEL_SAMPLE_RATE
+    print(f"⏱️  Encoder precision: {len(clips)} clips, {seconds:.0f}s of audio")
+    try:
+        report = check_precision(encoder, lambda wavs: embed_waveforms(wavs, use_cache=False), clips, index, precision, repeats=repeats)
+    finally:
+        set_precision(encoder, previous)
+    print(f"{'mode':>6} {'sec':>8} {'x realtime':>11}")
+    for mode in ("fp32", precision):
+        sec = report[f"{mode}_sec"]
+        print(f"{mode:>6} {sec:>8.3f} {seconds / sec:>11.1f}")
+    print(f"speedup {report['speedup']}x · top-1 agreement {report['top1_agreement']:.2%} · "
+          f"max score drift {report['max_score_drift']} · min cosine {report['min_cosine']} · "
+          f"native bf16 {'yes' if report['native_bf16'] else 'no'} · "
+          f"{'✅ within' if report['ok'] else '❌ outside'} guardrails")
+    return report
+
+
+BENCHMARKS = {
+    "resample": bench_resample,
+    "bucketing": bench_bucketing,
+    "transcribe": bench_transcribe,
+    "precision": bench_precision,
+}
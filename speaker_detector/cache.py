@@ -0,0 +1,126 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import torch
+
+DISK_PRUNE_EVERY = 256  # disk writes between size checks of the on-disk tier
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by a hash of the decoded audio plus the model version.
+
+    The in-memory tier is an LRU bounded by `max_entries`. The optional
+    on-disk tier under `disk_dir` is bounded by `max_disk_entries`. Entries
+    older than `ttl` seconds are treated as misses in both tiers (ttl=None
+    disables expiry). Safe to share between threads.
+    """
+
+    def __init__(self, model_version, max_entries=1024, ttl=24 * 3600,
+                 disk_dir=None, max_disk_entries=100_000):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()  # key -> (created, embedding)
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.hits = self.misses = self.evictions = self.disk_hits = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, wav, sample_rate):
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{self.model_version}|{sample_rate}|{tuple(wav.shape)}|".encode())
+        h.update(wav.detach().cpu().contiguous().float().numpy().tobytes())
+        return h.hexdigest()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _disk_path(self, key):
+        return self.disk_dir / key[:2] / f"{key}.pt"
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, emb = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return emb.clone()
+                del self._entries[key]
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                created = path.stat().st_mtime
+                if not self._expired(created):
+                    emb = torch.load(path, map_location="cpu")
+                    with self._lock:
+                        self.hits += 1
+                        self.disk_hits += 1
+                        self._insert(key, created, emb)
+                    return emb.clone()
+                path.unlink(missing_ok=True)
+            except (OSError, RuntimeError, EOFError):
+                pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _insert(self, key, created, emb):
+        self._entries[key] = (created, emb)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key, emb):
+        emb = emb.detach().cpu().clone()
+        with self._lock:
+            self._insert(key, time.time(), emb)
+            self._disk_writes += 1
+            prune = self._disk_writes % DISK_PRUNE_EVERY == 0
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            torch.save(emb, tmp_path)
+            tmp_path.replace(path)
+            if prune:
+                self._prune_disk()
+
+    def _prune_disk(self):
+        files = []
+        for path in self.disk_dir.glob("*/*.pt"):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        files.sort()
+        for _, path in files[: max(0, len(files) - self.max_disk_entries)]:
+            path.unlink(missing_ok=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
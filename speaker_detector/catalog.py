@@ -0,0 +1,417 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from speaker_detector.audio_info import audio_info
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS speakers (
+    name TEXT PRIMARY KEY,
+    embedding TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    speaker TEXT NOT NULL REFERENCES speakers(name) ON DELETE CASCADE ON UPDATE CASCADE,
+    filename TEXT,
+    duration REAL,
+    sample_rate INTEGER,
+    sha256 TEXT,
+    embedding TEXT,
+    created REAL NOT NULL,
+    UNIQUE (speaker, filename)
+);
+CREATE INDEX IF NOT EXISTS recordings_by_speaker ON recordings(speaker, id);
+CREATE TABLE IF NOT EXISTS meetings (
+    id TEXT PRIMARY KEY,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    duration REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS meetings_by_created ON meetings(created, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def probe_audio(path):
+    """Returns (duration_sec, sample_rate) from the file header, or (None, None)."""
+    try:
+        frames, sample_rate = audio_info(path)
+        return frames / sample_rate, sample_rate
+    except Exception:
+        return None, None
+
+
+class Catalog:
+    """
+    SQLite (WAL) index of speakers, their recordings and meetings.
+
+    The audio and embedding files on disk stay the source of truth; the
+    catalog mirrors them so list endpoints don't have to walk directories,
+    and hands out recording numbers from an AUTOINCREMENT key so concurrent
+    enrollments never pick the same file name. `reindex()` rebuilds it from
+    disk.
+
+    Each thread gets its own connection. Mutations run inside
+    `transaction()`, which nests, so several updates can be grouped into a
+    single commit. Callbacks registered with `on_commit(kind, fn)` run after
+    a commit that changed that kind.
+    """
+
+    def __init__(self, db_path, speakers_dir, meetings_dir, embeddings_dir=None):
+        self.db_path = Path(db_path)
+        self.speakers_dir = Path(speakers_dir)
+        self.meetings_dir = Path(meetings_dir)
+        self.embeddings_dir = Path(embeddings_dir) if embeddings_dir else None
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready = False
+        self._listeners = {}
+
+    # ─── Connection & transactions ────────────────────────────────────────
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self._conn()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        self._ensure_indexed()
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        self._local.changed = set()
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+        self._notify(self._local.changed)
+
+    def on_commit(self, kind, fn):
+        """Calls `fn()` after every committed transaction that bumped `kind`."""
+        self._listeners.setdefault(kind, []).append(fn)
+
+    def _notify(self, kinds):
+        for kind in kinds:
+            for fn in self._listeners.get(kind, ()):
+                try:
+                    fn()
+                except Exception as e:
+                    print(f"⚠️  {kind} commit listener failed: {e}")
+
+    def _ensure_indexed(self):
+        # A fresh catalog next to an existing storage tree is populated once
+        # from disk so upgrades don't show an empty roster.
+        if self._ready or getattr(self._local, "indexing", False):
+            return
+        with self._init_lock:
+            if self._ready:
+                return
+            self._local.indexing = True
+            try:
+                row = self._conn().execute(
+                    "SELECT value FROM meta WHERE key = 'indexed_at'"
+                ).fetchone()
+                if row is None:
+                    self.reindex()
+                self._ready = True
+            finally:
+                self._local.indexing = False
+
+    def _bump(self, conn, kind):
+        self._local.changed.add(kind)
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1",
+            (f"{kind}_version",),
+        )
+
+    def version(self, kind):
+        """
+        Monotonic change counter for "speakers", "roster" (speaker
+        embeddings only, so not bumped by recording slots) or "meetings".
+        """
+        self._ensure_indexed()
+        row = self._conn().execute(
+            "SELECT value FROM meta WHERE key = ?", (f"{kind}_version",)
+        ).fetchone()
+        return row["value"] if row else 0
+
+    # ─── Speakers & recordings ────────────────────────────────────────────
+
+    def _ensure_speaker(self, conn, name):
+        now = time.time()
+        conn.execute(
+            "INSERT INTO speakers (name, created, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET updated = excluded.updated",
+            (name, now, now),
+        )
+
+    def reserve_recording(self, speaker):
+        """
+        Allocates a unique recording slot for `speaker`.
+
+        Returns (recording_id, dest_path). The caller writes the audio to
+        `dest_path` and then calls `update_recording`, or `discard_recording`
+        if writing failed. Until then the slot has no filename, so listings
+        and counts leave it out.
+        """
+        speaker_dir = self.speakers_dir / speaker
+        speaker_dir.mkdir(parents=True, exist_ok=True)
+        with self.transaction() as conn:
+            self._ensure_speaker(conn, speaker)
+            while True:
+                cur = conn.execute(
+                    "INSERT INTO recordings (speaker, created) VALUES (?, ?)",
+                    (speaker, time.time()),
+                )
+                rec_id = cur.lastrowid
+                filename = f"{rec_id}.wav"
+                # Skip ids that collide with files (audio or a saved
+                # embedding) the catalog doesn't know about
+                if not (speaker_dir / filename).exists() and not (speaker_dir / f"{rec_id}.pt").exists():
+                    break
+                conn.execute("DELETE FROM recordings WHERE id = ?", (rec_id,))
+            self._bump(conn, "speakers")
+        return rec_id, speaker_dir / filename
+
+    def update_recording(self, rec_id, path=None, embedding=None, sha256=None):
+        """
+        Fills in metadata for a recording; probes and hashes `path` if given,
+        which also lists it under that file name. Pass `sha256` when the
+        caller already hashed the file, and `embedding` as the file name of
+        its saved embedding (next to the audio).
+        """
+        fields = {}
+        if path is not None:
+            fields["filename"] = Path(path).name
+            fields["duration"], fields["sample_rate"] = probe_audio(path)
+            fields["sha256"] = sha256 or file_sha256(path)
+        if embedding is not None:
+            fields["embedding"] = str(embedding)
+        if not fields:
+            return
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self.transaction() as conn:
+            conn.execute(
+                f"UPDATE recordings SET {assignments} WHERE id = ?",
+                (*fields.values(), rec_id),
+            )
+            self._bump(conn, "speakers")
+
+    def discard_recording(self, rec_id):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM recordings WHERE id = ?", (rec_id,))
+            self._bump(conn, "speakers")
+
+    def remove_recording(self, speaker, filename):
+        with self.transaction() as conn:
+            conn.execute(
+                "DELETE FROM recordings WHERE speaker = ? AND filename = ?",
+                (speaker, filename),
+            )
+            self._bump(conn, "speakers")
+
+    def set_speaker_embedding(self, speaker, emb_path):
+        with self.transaction() as conn:
+            self._ensure_speaker(conn, speaker)
+            conn.execute(
+                "UPDATE speakers SET embedding = ? WHERE name = ?",
+                (str(emb_path), speaker),
+            )
+            self._bump(conn, "speakers")
+            self._bump(conn, "roster")
+
+    def rename_speaker(self, old_name, new_name, emb_path=None):
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE speakers SET name = ?, updated = ? WHERE name = ?",
+                (new_name, time.time(), old_name),
+            )
+            if emb_path is not None:
+                conn.execute(
+                    "UPDATE speakers SET embedding = ? WHERE name = ?",
+                    (str(emb_path), new_name),
+                )
+            self._bump(conn, "speakers")
+            self._bump(conn, "roster")
+
+    def delete_speaker(self, name):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM speakers WHERE name = ?", (name,))
+            self._bump(conn, "speakers")
+            self._bump(conn, "roster")
+
+    def speakers(self, limit=None, offset=0):
+        """Returns [(name, recording_count)] ordered by name."""
+        self._ensure_indexed()
+        rows = self._conn().execute(
+            "SELECT s.name, "
+            "(SELECT COUNT(*) FROM recordings r "
+            " WHERE r.speaker = s.name AND r.filename IS NOT NULL) AS n "
+            "FROM speakers s ORDER BY s.name LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset),
+        ).fetchall()
+        return [(r["name"], r["n"]) for r in rows]
+
+    def recordings(self, limit=None, offset=0):
+        """Returns {speaker: [filename, ...]} for a page of speakers."""
+        names = [name for name, _ in self.speakers(limit, offset)]
+        result = {name: [] for name in names}
+        if not names:
+            return result
+        placeholders = ",".join("?" * len(names))
+        rows = self._conn().execute(
+            f"SELECT speaker, filename FROM recordings "
+            f"WHERE speaker IN ({placeholders}) AND filename IS NOT NULL "
+            f"ORDER BY speaker, filename",
+            names,
+        ).fetchall()
+        for r in rows:
+            result[r["speaker"]].append(r["filename"])
+        return result
+
+    def recording_rows(self, speaker):
+        """Returns full recording rows for one speaker, oldest first."""
+        self._ensure_indexed()
+        return self._conn().execute(
+            "SELECT * FROM recordings WHERE speaker = ? AND filename IS NOT NULL ORDER BY id",
+            (speaker,),
+        ).fetchall()
+
+    # ─── Meetings ─────────────────────────────────────────────────────────
+
+    def add_meeting_chunk(self, meeting_id, duration=0.0):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO meetings (id, chunks, duration, created, updated) "
+                "VALUES (?, 1, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET chunks = chunks + 1, "
+                "duration = duration + excluded.duration, updated = excluded.updated",
+                (meeting_id, duration or 0.0, now, now),
+            )
+            self._bump(conn, "meetings")
+
+    def delete_meeting(self, meeting_id):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM meetings WHERE id = ?", (meeting_id,))
+            self._bump(conn, "meetings")
+
+    def meetings(self, limit=None, offset=0):
+        self._ensure_indexed()
+        rows = self._conn().execute(
+            "SELECT id FROM meetings ORDER BY created, id LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset),
+        ).fetchall()
+        return [r["id"] for r in rows]
+
+    # ─── Rebuild ──────────────────────────────────────────────────────────
+
+    def reindex(self):
+        """Rebuilds the whole catalog from the storage tree in one transaction."""
+        self._conn()
+        self._local.indexing = True
+        try:
+            result = self._reindex()
+        finally:
+            self._local.indexing = False
+        self._ready = True
+        return result
+
+    def _reindex(self):
+        n_speakers = n_recordings = n_meetings = 0
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM recordings")
+            conn.execute("DELETE FROM speakers")
+            conn.execute("DELETE FROM meetings")
+
+            if self.speakers_dir.exists():
+                for spk_dir in sorted(self.speakers_dir.iterdir()):
+                    if not spk_dir.is_dir():
+                        continue
+                    self._ensure_speaker(conn, spk_dir.name)
+                    n_speakers += 1
+                    if self.embeddings_dir is not None:
+                        emb_path = self.embeddings_dir / f"{spk_dir.name}.pt"
+                        if emb_path.exists():
+                            conn.execute(
+                                "UPDATE speakers SET embedding = ? WHERE name = ?",
+                                (str(emb_path), spk_dir.name),
+                            )
+                    for wav in sorted(spk_dir.glob("*.wav")):
+                        duration, sample_rate = probe_audio(wav)
+                        emb = wav.with_suffix(".pt")
+                        conn.execute(
+                            "INSERT INTO recordings "
+                            "(speaker, filename, duration, sample_rate, sha256, embedding, created) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (spk_dir.name, wav.name, duration, sample_rate, file_sha256(wav),
+                             emb.name if emb.exists() else None, wav.stat().st_mtime),
+                        )
+                        n_recordings += 1
+
+            if self.meetings_dir.exists():
+                for m_dir in sorted(self.meetings_dir.iterdir()):
+                    if not m_dir.is_dir():
+                        continue
+                    chunks = [f for f in m_dir.iterdir() if f.suffix in (".wav", ".flac")]
+                    duration = sum((probe_audio(f)[0] or 0.0) for f in chunks)
+                    created = m_dir.stat().st_mtime
+                    conn.execute(
+                        "INSERT INTO meetings (id, chunks, duration, created, updated) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (m_dir.name, len(chunks), duration, created, created),
+                    )
+                    n_meetings += 1
+
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('indexed_at', ?)",
+                (int(time.time()),),
+            )
+            self._bump(conn, "speakers")
+            self._bump(conn, "roster")
+            self._bump(conn, "meetings")
+
+        return {"speakers": n_speakers, "recordings": n_recordings, "meetings": n_meetings}
@@ -1,30 +1,127 @@
 import warnings
 import argparse
 import os
+import sys
 
-def main():
+from .profiling import DEFAULT_PROFILE_DIR, Profiler, phase
+
+def main(argv=None):
     parser = argparse.ArgumentParser(prog="speaker-detector", description="Speaker Detector CLI")
     subparsers = parser.add_subparsers(dest="command")
 
     # ---- Global options ----
     parser.add_argument("--verbose", action="store_true", help="Show detailed logs and warnings")
+    parser.add_argument("--profile", metavar="OUT_DIR",
+                        help=f"Profile the command: --profile[=OUT_DIR] (default {DEFAULT_PROFILE_DIR}/)")
+    parser.add_argument("--precision", choices=("fp32", "bf16"),
+                        help="Encoder precision (default: $MODEL_PRECISION or fp32); "
+                             "bf16 falls back to fp32 if it drifts on the enrolled roster")
 
     # ---- enroll ----
     enroll_cmd = subparsers.add_parser("enroll", help="Enroll a speaker from a .wav file")
     enroll_cmd.add_argument("speaker_id", help="Name/ID of the speaker")
     enroll_cmd.add_argument("audio_path", help="Path to .wav file")
 
+    # ---- enroll-bulk ----
+    eb_cmd = subparsers.add_parser("enroll-bulk", help="Enroll many speakers from a manifest or speaker/*.wav tree")
+    eb_cmd.add_argument("source", help="Folder with one sub-folder per speaker, or a .csv/.jsonl manifest (speaker, path)")
+    eb_cmd.add_argument("--workers", type=int, default=4, help="Decoder threads")
+    eb_cmd.add_argument("--batch-size", type=int, default=16, help="Files per model forward pass")
+    eb_cmd.add_argument("--report", help="Write per-file errors to this .jsonl file")
+
     # ---- identify ----
     identify_cmd = subparsers.add_parser("identify", help="Identify speaker from a .wav file")
     identify_cmd.add_argument("audio_path", help="Path to .wav file")
 
+    # ---- identify-batch ----
+    ib_cmd = subparsers.add_parser("identify-batch", help="Identify every file in a folder or manifest (JSONL output)")
+    ib_cmd.add_argument("source", help="Folder of audio files, or a .txt/.csv/.jsonl manifest of paths")
+    ib_cmd.add_argument("--out", help="Output .jsonl file (default: stdout)")
+    ib_cmd.add_argument("--workers", type=int, default=4, help="Decoder threads")
+    ib_cmd.add_argument("--batch-size", type=int, default=16, help="Files per model forward pass")
+    ib_cmd.add_argument("--top-k", type=int, default=3, help="Scores to include per file")
+    ib_cmd.add_argument("--resume", action="store_true", help="Skip files already present in --out")
+
+    # ---- verify ----
+    verify_cmd = subparsers.add_parser("verify", help="Check a claimed identity (1:1) against an enrolled speaker")
+    verify_cmd.add_argument("speaker_id", help="Claimed speaker")
+    verify_cmd.add_argument("audio_path", help="Path to .wav file")
+
+    # ---- evaluate ----
+    eval_cmd = subparsers.add_parser("evaluate", help="EER/minDCF on a verification trial list")
+    eval_cmd.add_argument("trials", help="Trial list: 'label enroll test' lines (VoxCeleb), or .csv/.jsonl with enroll, test, label")
+    eval_cmd.add_argument("--root", help="Folder relative trial paths resolve against (default: the list's folder)")
+    eval_cmd.add_argument("--workers", type=int, default=4, help="Decoder threads")
+    eval_cmd.add_argument("--batch-size", type=int, default=16, help="Files per model forward pass")
+    eval_cmd.add_argument("--p-target", type=float, default=0.01, help="Target prior for minDCF")
+    eval_cmd.add_argument("--cohort", help="[M, D] impostor embeddings (.pt) to also report AS-norm metrics")
+    eval_cmd.add_argument("--embeddings", help="Cache embeddings here and reuse them on the next run")
+    eval_cmd.add_argument("--out", help="Write the JSON report (with DET points) here")
+    eval_cmd.add_argument("--scores", help="Write 'enroll test label score' per trial here")
+
     # ---- list-speakers ----
     subparsers.add_parser("list-speakers", help="List enrolled speakers")
 
+    # ---- reindex ----
+    subparsers.add_parser("reindex", help="Rebuild the speaker/recording/meeting catalog from disk")
+
+    # ---- bench ----
+    bench_cmd = subparsers.add_parser("bench", help="Run performance micro-benchmarks")
+    bench_cmd.add_argument("names", nargs="*", help="Benchmarks to run (default: all)")
+
+    # ---- stub-transcriber ----
+    stub_cmd = subparsers.add_parser("stub-transcriber", help="Run a local fake Whisper endpoint for offline testing")
+    stub_cmd.add_argument("--host", default="127.0.0.1")
+    stub_cmd.add_argument("--port", type=int, default=9100)
+    stub_cmd.add_argument("--latency", type=float, default=0.0, help="Fixed seconds per request")
+    stub_cmd.add_argument("--realtime-factor", type=float, default=0.0, help="Extra seconds per second of audio")
+    stub_cmd.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+
+    # ---- loadtest ----
+    lt_cmd = subparsers.add_parser("loadtest", help="Load-test the Flask API (starts server.py locally unless --url)")
+    lt_cmd.add_argument("--url", help="Test a running server instead of starting one")
+    lt_cmd.add_argument("--mix", default="identify=8,enroll=1,summary=1", help="Endpoint weights")
+    lt_cmd.add_argument("--pattern", choices=("closed", "poisson", "step"), default="closed",
+                        help="Back-to-back clients, Poisson arrivals, or stepped Poisson rates")
+    lt_cmd.add_argument("--concurrency", type=int, default=8, help="Clients / max requests in flight")
+    lt_cmd.add_argument("--duration", type=float, default=30.0, help="Seconds per run (per step)")
+    lt_cmd.add_argument("--rate", type=float, default=5.0, help="Requests/s (first step with --pattern step)")
+    lt_cmd.add_argument("--steps", type=int, default=5)
+    lt_cmd.add_argument("--slo-ms", type=float, default=2000.0, help="p95 target for --pattern step")
+    lt_cmd.add_argument("--format", choices=("wav", "opus"), default="wav", help="Upload format of synthetic clips")
+    lt_cmd.add_argument("--speakers", type=int, default=4)
+    lt_cmd.add_argument("--meetings", type=int, default=2)
+    lt_cmd.add_argument("--out", help="Write the JSON report here")
+    lt_cmd.add_argument("--keep-storage", action="store_true", help="Keep the throwaway storage tree and server log")
+
+    # ---- shard-server ----
+    shard_cmd = subparsers.add_parser("shard-server", help="Serve one partition of the speaker roster (see SPEAKER_SHARDS)")
+    shard_cmd.add_argument("folder", help="The server's embeddings folder (<speaker>.pt files), shared with it, e.g. storage/embeddings")
+    shard_cmd.add_argument("--shard", type=int, required=True, help="This shard's number, from 0")
+    shard_cmd.add_argument("--shards", type=int, required=True, help="Total number of shards")
+    shard_cmd.add_argument("--host", default="127.0.0.1")
+    shard_cmd.add_argument("--port", type=int, default=9200)
+    shard_cmd.add_argument("--cohort", help="[M, D] impostor embeddings shared by all shards, for AS-norm")
+    shard_cmd.add_argument("--delay", type=float, default=0.0, help="Extra seconds per request (testing)")
+
+    # ---- shard-harness ----
+    sh_cmd = subparsers.add_parser("shard-harness", help="Compare sharded and single-process search on local shard processes")
+    sh_cmd.add_argument("--speakers", type=int, default=20000)
+    sh_cmd.add_argument("--shards", type=int, default=4)
+    sh_cmd.add_argument("--queries", type=int, default=200)
+    sh_cmd.add_argument("--batch", type=int, default=1, help="Queries per identify call")
+    sh_cmd.add_argument("--budget-ms", type=float, default=250.0, help="Scatter-gather deadline")
+    sh_cmd.add_argument("--slow-ms", type=float, help="Also run with shard 0 delayed by this much")
+    sh_cmd.add_argument("--out", help="Write the JSON report here")
+
     # ---- export-model ----
     model_parser = subparsers.add_parser("export-model", help="Export ECAPA model to ONNX")
-    model_parser.add_argument("--pt", required=True, help="Path to embedding_model.ckpt")
+    model_parser.add_argument("--pt", help="Path to embedding_model.ckpt (optional with --end-to-end)")
     model_parser.add_argument("--out", default="speaker_embedding.onnx", help="Output ONNX file")
+    model_parser.add_argument("--end-to-end", action="store_true", help="Waveform in, embedding out (Fbank + normalization baked in)")
+    model_parser.add_argument("--fp16", action="store_true", help="Also write an fp16 variant (requires --end-to-end)")
+    model_parser.add_argument("--opset", type=int, help="ONNX opset (default: export_model.ONNX_OPSET)")
+    model_parser.add_argument("--no-validate", action="store_true", help="Skip the parity/latency check")
 
     # ---- export-speaker-json ----
     emb_parser = subparsers.add_parser("export-speaker-json", help="Convert enrolled .pt file to browser-friendly .json")
@@ -37,7 +134,13 @@ def main():
     comb_parser.add_argument("--out", required=True, help="Output .pt file path")
 
     # ---- Parse arguments ----
-    args = parser.parse_args()
+    # A bare --profile would swallow the subcommand as its value
+    argv = sys.argv[1:] if argv is None else list(argv)
+    argv = [f"--profile={DEFAULT_PROFILE_DIR}" if a == "--profile" else a for a in argv]
+    args = parser.parse_args(argv)
+    # Checked before the model loads; the trunk export has no fp16 variant
+    if args.command == "export-model" and args.fp16 and not args.end_to_end:
+        parser.error("export-model --fp16 needs --end-to-end")
 
     # ---- Suppress warnings unless --verbose ----
     if not args.verbose:
@@ -45,38 +148,141 @@ def main():
         warnings.simplefilter("ignore", category=UserWarning)
         os.environ["PYTHONWARNINGS"] = "ignore"
 
+    # The load generator drives a separate server process; don't load the
+    # model here
+    if args.command == "loadtest":
+        from .loadtest import run_load_test
+        run_load_test(url=args.url, mix=args.mix, pattern=args.pattern, concurrency=args.concurrency,
+                      duration=args.duration, rate=args.rate, steps=args.steps, slo_ms=args.slo_ms,
+                      fmt=args.format, speakers=args.speakers, meetings=args.meetings,
+                      out_path=args.out, keep_storage=args.keep_storage)
+        return
+
+    # Shards only score embeddings; neither needs the model
+    if args.command == "shard-server":
+        from .shards import serve_shard
+        serve_shard(args.folder, args.shard, args.shards, host=args.host, port=args.port,
+                    cohort_path=args.cohort, delay=args.delay)
+        return
+    if args.command == "shard-harness":
+        from .shards import run_shard_harness
+        run_shard_harness(speakers=args.speakers, shards=args.shards, queries=args.queries,
+                          batch=args.batch, budget_ms=args.budget_ms, slow_ms=args.slow_ms,
+                          out_path=args.out)
+        return
+
+    # The fake Whisper server stands in for a remote service; no model either
+    if args.command == "stub-transcriber":
+        from .stub_transcriber import serve
+        serve(args.host, args.port, latency=args.latency,
+              realtime_factor=args.realtime_factor, fail_rate=args.fail_rate)
+        return
+
+    profiler = Profiler(args.profile) if args.profile else None
+    if profiler:
+        profiler.start()
+
+    # core reads MODEL_PRECISION at import
+    if args.precision:
+        os.environ["MODEL_PRECISION"] = args.precision
+
     # ---- Import modules after filtering warnings ----
-    from .core import enroll_speaker, identify_speaker, list_speakers
-    from .export_model import export_model_to_onnx
-    from .export_embeddings import export_embeddings_to_json
-    from .combine import combine_embeddings_from_folder
-
-    # ---- Command Dispatch ----
-    if args.command == "enroll":
-        enroll_speaker(args.audio_path, args.speaker_id)
-        print(f"✅ Enrolled: {args.speaker_id}")
-
-    elif args.command == "identify":
-        result = identify_speaker(args.audio_path)
-        print(f"🕵️  Identified: {result['speaker']} (score: {result['score']})")
-
-    elif args.command == "list-speakers":
-        speakers = list_speakers()
-        if speakers:
-            print("📋 Enrolled Speakers:")
-            for s in speakers:
-                print(f"  • {s}")
-        else:
-            print("⚠️  No speakers enrolled yet.")
+    with phase("import"):
+        import torch  # noqa: F401
+        import speechbrain.pretrained  # noqa: F401
+    with phase("model_load"):  # core loads the model at import
+        from .core import (enroll_speaker, identify_speaker, verify_speaker, list_speakers, CATALOG,
+                           ensure_model_precision)
+    with phase("import"):
+        from .export_model import export_model_to_onnx, export_end_to_end, ONNX_OPSET
+        from .export_embeddings import export_embeddings_to_json
+        from .combine import combine_embeddings_from_folder
+        from .bench import BENCHMARKS
+        from .batch import identify_batch, enroll_bulk
+        from .evaluate import evaluate
+
+    if profiler:
+        profiler.start_torch()
+    try:
+        report = ensure_model_precision()
+        if report:
+            print(f"🧮 Encoder precision: {report['active']} (requested {report['precision']}, "
+                  f"speedup {report['speedup']}x, max score drift {report['max_score_drift']})")
+
+        # ---- Command Dispatch ----
+        if args.command == "enroll":
+            enroll_speaker(args.audio_path, args.speaker_id)
+            print(f"✅ Enrolled: {args.speaker_id}")
+
+        elif args.command == "enroll-bulk":
+            enroll_bulk(args.source, workers=args.workers, batch_size=args.batch_size,
+                        report_path=args.report)
+
+        elif args.command == "identify":
+            result = identify_speaker(args.audio_path)
+            print(f"🕵️  Identified: {result['speaker']} (score: {result['score']})")
 
-    elif args.command == "export-model":
-        export_model_to_onnx(args.pt, args.out)
+        elif args.command == "identify-batch":
+            identify_batch(args.source, out_path=args.out, workers=args.workers,
+                           batch_size=args.batch_size, top_k=args.top_k, resume=args.resume)
 
-    elif args.command == "export-speaker-json":
-        export_embeddings_to_json(args.pt, args.out)
+        elif args.command == "verify":
+            result = verify_speaker(args.audio_path, args.speaker_id)
+            if "error" in result:
+                parser.exit(1, f"❌ {result['error']}\n")
+            verdict = "✅ Accepted" if result["match"] else "🚫 Rejected"
+            print(f"{verdict}: {args.speaker_id} (score: {result['score']})")
 
-    elif args.command == "combine":
-        combine_embeddings_from_folder(args.folder, args.out)
+        elif args.command == "evaluate":
+            evaluate(args.trials, root=args.root, workers=args.workers, batch_size=args.batch_size,
+                     p_target=args.p_target, cohort_path=args.cohort, embeddings_path=args.embeddings,
+                     out_path=args.out, scores_path=args.scores)
 
-    else:
-        parser.print_help()
+        elif args.command == "list-speakers":
+            speakers = list_speakers()
+            if speakers:
+                print("📋 Enrolled Speakers:")
+                for s in speakers:
+                    print(f"  • {s}")
+            else:
+                print("⚠️  No speakers enrolled yet.")
+
+        elif args.command == "reindex":
+            counts = CATALOG.reindex()
+            print(f"🗂️  Reindexed {counts['speakers']} speakers, "
+                  f"{counts['recordings']} recordings, {counts['meetings']} meetings")
+
+        elif args.command == "bench":
+            names = args.names or list(BENCHMARKS)
+            unknown = [n for n in names if n not in BENCHMARKS]
+            if unknown:
+                parser.error(f"unknown benchmark(s): {', '.join(unknown)} (choose from {', '.join(BENCHMARKS)})")
+            for name in names:
+                BENCHMARKS[name]()
+
+        elif args.command == "export-model":
+            opset = args.opset or ONNX_OPSET
+            if args.end_to_end:
+                reports = export_end_to_end(args.out, ckpt_path=args.pt, opset=opset,
+                                            fp16=args.fp16, validate=not args.no_validate)
+            elif args.pt:
+                reports = export_model_to_onnx(args.pt, args.out, opset=opset,
+                                               validate=not args.no_validate)
+            else:
+                parser.error("export-model needs --pt unless --end-to-end is given")
+            failed = [path for path, report in reports.items() if not report["ok"]]
+            if failed:
+                parser.exit(1, f"❌ Parity check failed for {', '.join(failed)}\n")
+
+        elif args.command == "export-speaker-json":
+            export_embeddings_to_json(args.pt, args.out)
+
+        elif args.command == "combine":
+            combine_embeddings_from_folder(args.folder, args.out)
+
+        else:
+            parser.print_help()
+    finally:
+        if profiler:
+            profiler.stop()
+            profiler.report()
@@ -1,22 +1,124 @@
 import torch
 import os
+import json
+from concurrent.futures import ThreadPoolExecutor
 
-def combine_embeddings_from_folder(folder_path, output_path):
-    speaker_data = {}
+from speaker_detector.catalog import file_sha256
+
+LOAD_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def manifest_path(output_path):
+    return f"{output_path}.manifest.json"
+
+
+def _read_manifest(output_path):
+    try:
+        with open(manifest_path(output_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json_atomic(path, data, **kwargs):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp, path)
+
+
+def _load_tensor(fpath):
+    try:
+        tensor = torch.load(fpath, map_location="cpu")
+    except Exception as e:
+        return None, str(e)
+    if not isinstance(tensor, torch.Tensor):
+        return None, "not a valid tensor"
+    return tensor, None
 
+
+def combine_embeddings_from_folder(folder_path, output_path, workers=LOAD_WORKERS):
+    """
+    Combines every `<label>.pt` in `folder_path` into one {label: tensor}
+    file at `output_path`.
+
+    A manifest next to the output records each source's mtime, size and
+    sha256. On later runs only new or changed sources are loaded (in
+    parallel) and patched into the existing combined file, removed ones
+    are dropped, and nothing is written if no source changed. Returns True
+    when `output_path` was (re)written.
+    """
+    sources = {}
     for fname in os.listdir(folder_path):
         if fname.endswith(".pt"):
-            label = os.path.splitext(fname)[0]
-            fpath = os.path.join(folder_path, fname)
-            tensor = torch.load(fpath, map_location="cpu")
-            if not isinstance(tensor, torch.Tensor):
-                print(f"❌ Skipping {fname}: not a valid tensor")
+            st = os.stat(os.path.join(folder_path, fname))
+            sources[fname] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+    manifest = _read_manifest(output_path)
+    old_sources = manifest.get("sources", {})
+    speaker_data = {}
+    # The combined file matches the manifest (possibly with no speakers)
+    in_sync = "sources" in manifest and os.path.exists(output_path)
+    if in_sync:
+        try:
+            speaker_data = torch.load(output_path, map_location="cpu")
+        except Exception:
+            old_sources, speaker_data, in_sync = {}, {}, False
+
+    # A source is unchanged if its stat matches, or if only its mtime moved
+    # but the content hash is the same
+    changed = []
+    rehashed = False
+    for fname, meta in sources.items():
+        old = old_sources.get(fname)
+        label = os.path.splitext(fname)[0]
+        known = old and (label in speaker_data or old.get("invalid"))
+        if known and old["size"] == meta["size"]:
+            if old["mtime_ns"] == meta["mtime_ns"]:
+                sources[fname] = old
                 continue
-            speaker_data[label] = tensor
+            digest = file_sha256(os.path.join(folder_path, fname))
+            if digest == old["sha256"]:
+                sources[fname] = dict(old, mtime_ns=meta["mtime_ns"])
+                rehashed = True
+                continue
+        changed.append(fname)
+    removed = [f for f in old_sources if f not in sources]
+
+    if not changed and not removed and in_sync:
+        if rehashed:
+            _write_json_atomic(manifest_path(output_path), {"sources": sources})
+        print(f"✅ {output_path} is up to date ({len(speaker_data)} speakers)")
+        return False
+
+    paths = [os.path.join(folder_path, f) for f in changed]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        loaded = list(pool.map(_load_tensor, paths))
+        digests = list(pool.map(file_sha256, paths))
+
+    for fname in removed:
+        speaker_data.pop(os.path.splitext(fname)[0], None)
+    for fname, (tensor, err), digest in zip(changed, loaded, digests):
+        label = os.path.splitext(fname)[0]
+        sources[fname]["sha256"] = digest
+        if tensor is None:
+            print(f"❌ Skipping {fname}: {err}")
+            speaker_data.pop(label, None)
+            sources[fname]["invalid"] = True
+            continue
+        speaker_data[label] = tensor
 
     if not speaker_data:
         print("⚠️ No valid .pt files found.")
-        return
+        if not os.path.exists(output_path):
+            return False
+        # Every speaker is gone: write an empty file rather than leave the
+        # old roster in place for the exporter to pick up
 
-    torch.save(speaker_data, output_path)
-    print(f"✅ Combined {len(speaker_data)} speakers into {output_path}")
+    tmp = f"{output_path}.tmp"
+    torch.save(speaker_data, tmp)
+    os.replace(tmp, output_path)
+    _write_json_atomic(manifest_path(output_path), {"sources": sources})
+    print(f"✅ Combined {len(speaker_data)} speakers into {output_path} "
+          f"({len(changed)} updated, {len(removed)} removed)")
+    return True
@@ -1,92 +1,381 @@
 from speechbrain.pretrained import SpeakerRecognition
 from pathlib import Path
+import json
+import os
+import threading
 import torchaudio
 import torch
 
-# Storage directories
-BASE_DIR = Path(__file__).resolve().parent.parent / "storage"
+from speaker_detector.cache import EmbeddingCache
+from speaker_detector.catalog import Catalog
+from speaker_detector.index import SpeakerIndex, MATCH_THRESHOLD, VERIFY_THRESHOLD, sub_centroids
+from speaker_detector.precision import check_precision, get_precision, set_precision
+from speaker_detector.profiling import phase
+from speaker_detector.scheduler import run_bucketed
+from speaker_detector.shared_index import SharedSpeakerIndex, default_prefix
+from speaker_detector.shards import SHARD_BUDGET_MS, ShardedIndex, roster_id
+
+# Storage directories (SPEAKER_DETECTOR_STORAGE points a process at another
+# tree, e.g. a throwaway one for load tests)
+BASE_DIR = Path(os.getenv("SPEAKER_DETECTOR_STORAGE") or Path(__file__).resolve().parent.parent / "storage")
 SPEAKER_AUDIO_DIR = BASE_DIR / "speakers"
 EMBEDDINGS_DIR = BASE_DIR / "embeddings"
+MEETINGS_DIR = BASE_DIR / "meetings"
+INDEX_PATH = BASE_DIR / "speaker_index.pt"  # stacked embeddings + cohort stats
+PRECISION_CHECK_PATH = BASE_DIR / "precision_check.json"
+COHORT_PATH = BASE_DIR / "cohort.pt"        # optional [M, D] impostor embeddings
 
 # Ensure they exist
 SPEAKER_AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 EMBEDDINGS_DIR.mkdir(parents=True, exist_ok=True)
 
+# Metadata index over the storage tree
+CATALOG = Catalog(BASE_DIR / "catalog.db", SPEAKER_AUDIO_DIR, MEETINGS_DIR, EMBEDDINGS_DIR)
+
 # Load model once
-MODEL = SpeakerRecognition.from_hparams(
-    source="speechbrain/spkrec-ecapa-voxceleb", savedir="model"
+MODEL_SOURCE = "speechbrain/spkrec-ecapa-voxceleb"
+MODEL = SpeakerRecognition.from_hparams(source=MODEL_SOURCE, savedir="model")
+MODEL_SAMPLE_RATE = 16000  # rate the ECAPA front-end was trained on
+# Encoder precision requested via MODEL_PRECISION / --precision ("fp32" or
+# "bf16"); bf16 is only kept if ensure_model_precision() finds it accurate
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32").lower()
+MODEL_ID = f"{MODEL_SOURCE}@{MODEL_SAMPLE_RATE}"
+MODEL_EMBEDDING_DIM = 192
+# Cap on batch size × longest clip per forward pass (samples)
+MAX_PADDED_SAMPLES = int(os.getenv("MAX_PADDED_SAMPLES", MODEL_SAMPLE_RATE * 240))
+PRECISION_CHECK_CLIPS = 32  # roster recordings compared in fp32 vs reduced precision
+
+def model_version():
+    """Tag for embeddings from the encoder as it runs now: MODEL_ID plus any reduced precision."""
+    precision = get_precision(MODEL.mods.embedding_model)
+    return MODEL_ID if precision == "fp32" else f"{MODEL_ID}+{precision}"
+
+# Embeddings of recently seen audio, keyed by content hash + model_version();
+# ensure_model_precision() re-keys it when the precision changes
+EMBEDDING_CACHE = EmbeddingCache(
+    model_version(),
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("EMBEDDING_CACHE_TTL", 24 * 3600)),
+    disk_dir=os.getenv("EMBEDDING_CACHE_DIR") or None,
 )
 
-def get_embedding(audio_path):
+# Roster partitioned across shard servers (`speaker-detector shard-server`),
+# listed in shard order as SPEAKER_SHARDS=url0,url1,...; searches wait at
+# most SHARD_BUDGET_MS for them. Replaces the local/shared index when set.
+# Enrollment still writes to EMBEDDINGS_DIR, which the shards must serve
+# (a shared filesystem); shards reading any other folder are refused.
+_shard_urls = [u.strip() for u in os.getenv("SPEAKER_SHARDS", "").split(",") if u.strip()]
+SHARDED_INDEX = None
+if _shard_urls:
+    SHARDED_INDEX = ShardedIndex(_shard_urls, budget_ms=float(os.getenv("SHARD_BUDGET_MS", SHARD_BUDGET_MS)),
+                                 roster=roster_id(EMBEDDINGS_DIR))
+    SHARDED_INDEX.check_roster()
+    CATALOG.on_commit("roster", lambda: publish_speaker_index())
+
+# Speaker matrix shared by all processes on this host; every committed
+# roster change publishes a new generation. SPEAKER_INDEX_SHM=off disables it.
+_shm_setting = os.getenv("SPEAKER_INDEX_SHM", "")
+SHARED_INDEX = None
+if _shm_setting.lower() != "off" and SHARDED_INDEX is None:
     try:
-        signal, fs = torchaudio.load(audio_path)
+        SHARED_INDEX = SharedSpeakerIndex(
+            _shm_setting or default_prefix(BASE_DIR),
+            lock_path=BASE_DIR / "speaker_index.lock",
+        )
+        CATALOG.on_commit("roster", lambda: publish_speaker_index())
+    except OSError as e:
+        print(f"⚠️  Shared speaker index unavailable ({e}); using per-process index")
+
+# Resample kernels are built once per (source rate, target rate) pair
+_RESAMPLERS = {}
+_RESAMPLERS_LOCK = threading.Lock()
+
+def get_resampler(orig_freq, new_freq=MODEL_SAMPLE_RATE):
+    key = (int(orig_freq), int(new_freq))
+    resampler = _RESAMPLERS.get(key)
+    if resampler is None:
+        with _RESAMPLERS_LOCK:
+            resampler = _RESAMPLERS.get(key)
+            if resampler is None:
+                resampler = torchaudio.transforms.Resample(*key)
+                _RESAMPLERS[key] = resampler
+    return resampler
+
+def prepare_waveform(signal, sample_rate):
+    """
+    Downmixes to mono and resamples to MODEL_SAMPLE_RATE.
+
+    Accepts [channels, time] as returned by torchaudio.load, or a batch
+    [batch, channels, time]; returns [time] or [batch, time]. Both steps
+    are whole-tensor ops, so a batch costs one call regardless of size.
+    """
+    if signal.dim() == 1:
+        signal = signal.unsqueeze(0)
+    signal = signal.mean(dim=-2)
+    if sample_rate != MODEL_SAMPLE_RATE:
+        with torch.no_grad():
+            signal = get_resampler(sample_rate)(signal)
+    return signal
+
+def load_audio(audio_path):
+    """Decodes a file into a mono [time] tensor at MODEL_SAMPLE_RATE."""
+    with phase("decode"):
+        signal, fs = torchaudio.load(str(audio_path))
         if signal.numel() == 0:
             raise ValueError(f"{audio_path} is empty.")
-        return MODEL.encode_batch(signal).squeeze().detach().cpu()
+        return prepare_waveform(signal, fs)
+
+def _encode(wavs):
+    # Similar-length clips share a batch so short clips aren't padded to
+    # the longest one in the request
+    with phase("embed"):
+        embs, _ = run_bucketed(MODEL.encode_batch, list(wavs), MAX_PADDED_SAMPLES)
+        return torch.stack([e.reshape(-1) for e in embs]).detach().cpu()
+
+def embed_waveforms(wavs, use_cache=True):
+    """
+    Embeds a list of mono [time] tensors → [B, D]. Cached clips are served
+    from EMBEDDING_CACHE; the rest go through one padded forward pass.
+    """
+    if not use_cache:
+        return _encode(wavs)
+
+    keys = [EMBEDDING_CACHE.key(w, MODEL_SAMPLE_RATE) for w in wavs]
+    embs = [EMBEDDING_CACHE.get(k) for k in keys]
+    missing = [i for i, e in enumerate(embs) if e is None]
+    if missing:
+        fresh = _encode([wavs[i] for i in missing])
+        for i, emb in zip(missing, fresh):
+            EMBEDDING_CACHE.put(keys[i], emb)
+            embs[i] = emb
+    return torch.stack(embs)
+
+def get_embedding(audio_path):
+    try:
+        wav = load_audio(audio_path)
+        return embed_waveforms([wav])[0]
     except Exception as e:
         raise RuntimeError(f"Failed to embed {audio_path}: {e}")
 
-def enroll_speaker(audio_path, speaker_id):
-    speaker_dir = SPEAKER_AUDIO_DIR / speaker_id
-    speaker_dir.mkdir(parents=True, exist_ok=True)
+def recording_embedding_path(audio_path):
+    """Each recording's embedding is saved next to its audio: `<id>.wav` → `<id>.pt`."""
+    return Path(audio_path).with_suffix(".pt")
 
-    # Save audio sample
-    existing = list(speaker_dir.glob("*.wav"))
-    new_index = len(existing) + 1
-    dest_path = speaker_dir / f"{new_index}.wav"
+def save_recording_embedding(audio_path, emb):
+    """Saves one recording's [D] embedding (tagged with model_version()) and returns its path."""
+    path = recording_embedding_path(audio_path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    torch.save({"model": model_version(), "embedding": emb.detach().clone()}, tmp_path)
+    os.replace(tmp_path, path)
+    return path
 
+def stored_recording_embeddings(paths):
+    """
+    Embeddings of enrolled recordings → [R, D], read from the .pt saved
+    next to each one. Recordings without one for the current model (older
+    enrollments, moved clips) are embedded in one batched pass and saved;
+    unreadable files are skipped.
+    """
+    version = model_version()
+    embs, missing = {}, []
+    for path in paths:
+        try:
+            saved = torch.load(recording_embedding_path(path), map_location="cpu")
+            if saved.get("model") == version:
+                embs[path] = saved["embedding"]
+                continue
+        except Exception:
+            pass
+        missing.append(path)
+
+    wavs, loaded = [], []
+    for path in missing:
+        try:
+            wavs.append(load_audio(path))
+            loaded.append(path)
+        except Exception as e:
+            print(f"⚠️  Skipping {path}: {e}")
+    if wavs:
+        for path, emb in zip(loaded, embed_waveforms(wavs)):
+            save_recording_embedding(path, emb)
+            embs[path] = emb
+
+    found = [embs[p] for p in paths if p in embs]
+    return torch.stack(found) if found else torch.empty(0, MODEL_EMBEDDING_DIM)
+
+def enroll_speaker(audio_path, speaker_id):
     waveform, sample_rate = torchaudio.load(audio_path)
     if waveform.numel() == 0:
         raise ValueError("Cannot enroll empty audio file.")
 
-    torchaudio.save(str(dest_path), waveform, sample_rate)
-    print(f"🎙 Saved {speaker_id}'s recording #{new_index} → {dest_path}")
+    # Save audio sample under a catalog-allocated name
+    rec_id, dest_path = CATALOG.reserve_recording(speaker_id)
+    try:
+        torchaudio.save(str(dest_path), waveform, sample_rate)
+        print(f"🎙 Saved {speaker_id}'s recording #{rec_id} → {dest_path}")
 
-    # Save embedding
-    emb = get_embedding(audio_path)
-    emb_path = EMBEDDINGS_DIR / f"{speaker_id}.pt"
-    torch.save(emb, emb_path)
-    print(f"🧠 Saved embedding for {speaker_id} → {emb_path}")
+        # Re-cluster the speaker's recordings including this one (reuses the
+        # decoded audio; earlier clips come from their saved embeddings)
+        emb = embed_waveforms([prepare_waveform(waveform, sample_rate)])
+        rec_emb_path = save_recording_embedding(dest_path, emb[0])
+        others = [w for w in (SPEAKER_AUDIO_DIR / speaker_id).glob("*.wav") if w != dest_path]
+        centroids = sub_centroids(torch.cat([emb, stored_recording_embeddings(others)]))
+        emb_path = EMBEDDINGS_DIR / f"{speaker_id}.pt"
+        torch.save(centroids, emb_path)
+        print(f"🧠 Saved {len(centroids)} centroid(s) for {speaker_id} → {emb_path}")
+    except Exception:
+        CATALOG.discard_recording(rec_id)
+        dest_path.unlink(missing_ok=True)
+        recording_embedding_path(dest_path).unlink(missing_ok=True)
+        raise
+
+    with CATALOG.transaction():
+        CATALOG.update_recording(rec_id, path=dest_path, embedding=rec_emb_path.name)
+        CATALOG.set_speaker_embedding(speaker_id, emb_path)
+
+def _index_signature():
+    sources = sorted(EMBEDDINGS_DIR.glob("*.pt"))
+    if COHORT_PATH.exists():
+        sources.append(COHORT_PATH)
+    return [(str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in sources]
+
+def _build_speaker_index():
+    """
+    Builds the SpeakerIndex for the enrolled roster from disk. The stacked
+    matrix and its cohort statistics are cached in INDEX_PATH and rebuilt
+    only when an embedding or the cohort file changes.
+    """
+    signature = _index_signature()
+    if INDEX_PATH.exists():
+        try:
+            cached = torch.load(INDEX_PATH, map_location="cpu")
+            if cached.get("signature") == signature:
+                return SpeakerIndex.from_state_dict(cached["index"])
+        except Exception:
+            pass
+
+    index = SpeakerIndex.from_folder(EMBEDDINGS_DIR, cohort_path=COHORT_PATH)
+    tmp_path = INDEX_PATH.with_name(INDEX_PATH.name + ".tmp")
+    torch.save({"signature": signature, "index": index.state_dict()}, tmp_path)
+    tmp_path.replace(INDEX_PATH)
+    return index
 
-def identify_speaker(audio_path, threshold=0.25):
+def publish_speaker_index():
+    """Rebuilds the index from disk and hands it to every worker process (or shard)."""
+    if SHARDED_INDEX is not None:
+        SHARDED_INDEX.reload()
+        return SHARDED_INDEX
+    index = _build_speaker_index()
+    if SHARED_INDEX is not None:
+        SHARED_INDEX.publish(index)
+    return index
+
+def load_speaker_index():
+    """
+    Returns the current SpeakerIndex. With the shared index enabled this
+    is the generation last published by any process (no disk access);
+    otherwise it is rebuilt from disk as needed. With SPEAKER_SHARDS it is
+    the ShardedIndex router.
+    """
+    if SHARDED_INDEX is not None:
+        return SHARDED_INDEX
+    if SHARED_INDEX is not None:
+        index = SHARED_INDEX.current()
+        if index is not None:
+            return index
+        return publish_speaker_index()
+    return _build_speaker_index()
+
+def identify_speaker(audio_path, threshold=MATCH_THRESHOLD):
     try:
         test_emb = get_embedding(audio_path)
     except Exception as e:
         return {"speaker": "error", "score": 0, "error": str(e)}
 
-    scores = {}
-    for emb_path in EMBEDDINGS_DIR.glob("*.pt"):
-        speaker_name = emb_path.stem
+    with phase("index"):
+        index = load_speaker_index()
+    with phase("score"):
+        return index.identify(test_emb, threshold=threshold)[0]
+
+def verify_speaker(audio_path, speaker_id, threshold=VERIFY_THRESHOLD):
+    """1:1 check of a claimed identity: does `audio_path` sound like enrolled `speaker_id`?"""
+    try:
+        test_emb = get_embedding(audio_path)
+    except Exception as e:
+        return {"speaker": speaker_id, "match": False, "score": 0, "error": str(e)}
+
+    with phase("index"):
+        index = load_speaker_index()
+    with phase("score"):
+        return index.verify(test_emb, [speaker_id], threshold=threshold)[0]
+
+def list_speakers(limit=None, offset=0):
+    rows = CATALOG.speakers(limit=limit, offset=offset)
+    speakers = [f"{name} ({count} recording{'s' if count != 1 else ''})" for name, count in rows]
+    print(f"📋 Found {len(speakers)} enrolled speaker(s): {speakers}")
+    return [name for name, _ in rows]
+
+def precision_check_clips(limit=PRECISION_CHECK_CLIPS):
+    # Round-robin over speakers so every voice in the roster is represented
+    per_speaker = [sorted(d.glob("*.wav")) for d in sorted(SPEAKER_AUDIO_DIR.iterdir()) if d.is_dir()]
+    paths = []
+    for i in range(max((len(p) for p in per_speaker), default=0)):
+        paths += [p[i] for p in per_speaker if i < len(p)]
+    clips = []
+    for path in paths[:limit]:
         try:
-            enrolled_emb = torch.load(emb_path)
-            score = torch.nn.functional.cosine_similarity(enrolled_emb, test_emb, dim=0).item()
-            scores[speaker_name] = score
+            clips.append(load_audio(path))
         except Exception as e:
-            continue
-
-    if not scores:
-        return {"speaker": "unknown", "score": 0}
-
-    sorted_scores = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
-    best, second = sorted_scores[0], sorted_scores[1] if len(sorted_scores) > 1 else (None, None)
-    auto_thresh = best[1] - (second[1] if second else 0) > 0.1
-    is_match = auto_thresh or best[1] >= threshold
-
-    result = {
-        "speaker": best[0] if is_match else "unknown",
-        "score": round(best[1], 3),
-        "all_scores": {k: round(v, 3) for k, v in sorted_scores}
-    }
-    return result
-
-def list_speakers():
-    speakers = []
-    for dir in SPEAKER_AUDIO_DIR.iterdir():
-        if dir.is_dir():
-            count = len(list(dir.glob("*.wav")))
-            speakers.append(f"{dir.name} ({count} recording{'s' if count != 1 else ''})")
-    print(f"📋 Found {len(speakers)} enrolled speaker(s): {speakers}")
-    return [s.split()[0] for s in speakers]
+            print(f"⚠️  Skipping {path}: {e}")
+    if not clips:
+        # Empty roster: low-level noise still exercises every kernel
+        g = torch.Generator().manual_seed(0)
+        clips = [torch.randn(int(sec * MODEL_SAMPLE_RATE), generator=g) * 0.01 for sec in (1, 3, 10)]
+    return clips
+
+def ensure_model_precision(precision=MODEL_PRECISION):
+    """
+    Switches the encoder to `precision`, guarded by check_precision on the
+    enrolled roster. The report is cached in PRECISION_CHECK_PATH per
+    precision, torch build and roster version, so the comparison only runs
+    again when one of them changes. EMBEDDING_CACHE is then keyed by the
+    precision actually in use. Returns the report (None for fp32).
+
+    The check switches the shared encoder back and forth, so call this
+    before embeddings are served (the server does it before taking traffic).
+    """
+    try:
+        return _apply_precision(precision)
+    finally:
+        EMBEDDING_CACHE.model_version = model_version()
+
+def _apply_precision(precision):
+    encoder = MODEL.mods.embedding_model
+    if precision == "fp32":
+        if hasattr(encoder, "precision"):
+            set_precision(encoder, "fp32")
+        return None
+
+    key = {"precision": precision, "torch": torch.__version__,
+           "model": MODEL_ID, "speakers": CATALOG.version("speakers")}
+    try:
+        cached = json.loads(PRECISION_CHECK_PATH.read_text())
+    except (OSError, ValueError):
+        cached = {}
+    if cached.get("key") == key:
+        report = cached["report"]
+        set_precision(encoder, precision if report["ok"] else "fp32")
+        return dict(report, cached=True)
+
+    # A sharded roster is not held here; the check then falls back to
+    # comparing the embeddings themselves
+    index = load_speaker_index() if SHARDED_INDEX is None else SpeakerIndex([], None)
+    report = check_precision(encoder, _encode, precision_check_clips(), index, precision)
+    PRECISION_CHECK_PATH.write_text(json.dumps({"key": key, "report": report}))
+    if not report["ok"]:
+        print(f"⚠️  {precision} drifts too far from fp32 (max score drift {report['max_score_drift']}, "
+              f"top-1 agreement {report['top1_agreement']}); staying in fp32")
+    return report
 
 def rebuild_embedding(speaker_id):
     speaker_dir = SPEAKER_AUDIO_DIR / speaker_id
@@ -95,9 +384,12 @@ def rebuild_embedding(speaker_id):
     if not wavs:
         raise RuntimeError(f"No recordings found for {speaker_id}.")
 
-    embeddings = [get_embedding(w) for w in wavs]
-    avg_emb = torch.stack(embeddings).mean(dim=0)
+    embeddings = stored_recording_embeddings(wavs)
+    if not len(embeddings):
+        raise RuntimeError(f"No readable recordings for {speaker_id}.")
+    centroids = sub_centroids(embeddings)
 
     emb_path = EMBEDDINGS_DIR / f"{speaker_id}.pt"
-    torch.save(avg_emb, emb_path)
-    print(f"🔁 Rebuilt embedding for {speaker_id}")
+    torch.save(centroids, emb_path)
+    CATALOG.set_speaker_embedding(speaker_id, emb_path)
+    print(f"🔁 Rebuilt embedding for {speaker_id} ({len(centroids)} centroid(s) from {len(wavs)} recordings)")
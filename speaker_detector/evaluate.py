@@ -0,0 +1,225 @@
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from speaker_detector.batch import PROGRESS_EVERY, decoded_batches
+from speaker_detector.core import MODEL_SAMPLE_RATE, embed_waveforms, model_version
+from speaker_detector.index import COHORT_TOP_K, _cohort_stats
+from speaker_detector.metrics import P_TARGET, metrics
+from speaker_detector.profiling import phase
+
+SCORE_CHUNK = 65536   # trials scored per vector op
+COHORT_CHUNK = 1024   # files scored against the cohort per matrix product
+LABELS = {"1": 1, "0": 0, "target": 1, "nontarget": 0, "tgt": 1, "imp": 0}
+
+
+def _label(value):
+    try:
+        return LABELS[str(value).strip().lower()]
+    except KeyError:
+        raise ValueError(f"bad trial label: {value!r}") from None
+
+
+def iter_trials(source, root=None):
+    """
+    Yields (enroll_path, test_path, label) from a trial list. Accepted
+    formats: whitespace-separated text in VoxCeleb order (`label enroll
+    test`) or `enroll test label`; CSV with `enroll`, `test`, `label`
+    columns; or JSONL with the same keys. Labels are 1/0 or
+    target/nontarget. Relative paths resolve against `root` (default: the
+    trial list's folder).
+    """
+    source = Path(source)
+    base = Path(root) if root else source.parent
+
+    def resolve(p):
+        p = Path(p)
+        return p if p.is_absolute() else base / p
+
+    with open(source, newline="") as f:
+        if source.suffix == ".csv":
+            rows = ((r["enroll"], r["test"], r["label"]) for r in csv.DictReader(f))
+        elif source.suffix == ".jsonl":
+            rows = ((r["enroll"], r["test"], r["label"])
+                    for r in map(json.loads, filter(str.strip, f)))
+        else:
+            rows = []
+            for line in f:
+                fields = line.split()
+                if not fields or fields[0].startswith("#"):
+                    continue
+                if len(fields) != 3:
+                    raise ValueError(f"expected 3 fields per trial, got: {line.strip()!r}")
+                if fields[0].lower() in LABELS:
+                    rows.append((fields[1], fields[2], fields[0]))
+                else:
+                    rows.append((fields[0], fields[1], fields[2]))
+        for enroll, test, label in rows:
+            yield resolve(enroll), resolve(test), _label(label)
+
+
+def load_trials(source, root=None):
+    """
+    Reads a trial list into (paths, enroll_idx, test_idx, labels): each
+    distinct file appears once in `paths`, and trials refer to it by
+    position, so every file is decoded and embedded exactly once.
+    """
+    positions = {}
+    enroll_idx, test_idx, labels = [], [], []
+    for enroll, test, label in iter_trials(source, root):
+        enroll_idx.append(positions.setdefault(str(enroll), len(positions)))
+        test_idx.append(positions.setdefault(str(test), len(positions)))
+        labels.append(label)
+    return (list(positions), np.array(enroll_idx, dtype=np.int64),
+            np.array(test_idx, dtype=np.int64), np.array(labels, dtype=np.int8))
+
+
+def embed_files(paths, workers=4, batch_size=16, cache_path=None):
+    """
+    Embeds each path once → ([U, D] L2-normalised embeddings, ok [U] bool
+    mask); unreadable files get a zero row and ok=False. Files are sorted
+    by size so a batch holds clips of similar length (less padding).
+    With `cache_path`, embeddings from an earlier run with the same model
+    are reused and new ones are added, so re-scoring costs no model time.
+    """
+    cached = {}
+    if cache_path and Path(cache_path).exists():
+        state = torch.load(cache_path, map_location="cpu")
+        if state.get("model_version") == model_version():
+            cached = dict(zip(state["paths"], state["embeddings"]))
+
+    embs = [cached.get(p) for p in paths]
+    todo = [i for i, e in enumerate(embs) if e is None]
+    todo.sort(key=lambda i: Path(paths[i]).stat().st_size if Path(paths[i]).exists() else 0)
+    if cached:
+        print(f"⏩ {len(paths) - len(todo)} of {len(paths)} embeddings loaded from {cache_path}",
+              file=sys.stderr)
+
+    n_done = n_errors = 0
+    audio_sec = 0.0
+    start = time.perf_counter()
+    for group in decoded_batches((paths[i] for i in todo), batch_size, workers):
+        ok = [(p, wav) for p, wav, err in group if err is None]
+        if ok:
+            fresh = embed_waveforms([wav for _, wav in ok], use_cache=False)
+            for (p, wav), emb in zip(ok, fresh):
+                cached[p] = emb
+                audio_sec += wav.shape[-1] / MODEL_SAMPLE_RATE
+        for p, _, err in group:
+            if err is not None:
+                n_errors += 1
+                print(f"⚠️  Skipping {p}: {err}", file=sys.stderr)
+        n_done += len(group)
+        if n_done // PROGRESS_EVERY != (n_done - len(group)) // PROGRESS_EVERY:
+            elapsed = time.perf_counter() - start
+            print(f"… {n_done}/{len(todo)} files, {n_done / elapsed:.1f} files/s", file=sys.stderr)
+
+    if todo:
+        elapsed = time.perf_counter() - start
+        print(f"🧠 Embedded {n_done} files ({n_errors} errors) in {elapsed:.1f}s — "
+              f"{n_done / elapsed:.1f} files/s, {audio_sec / elapsed:.1f}× realtime", file=sys.stderr)
+        if cache_path:
+            keep = list(cached)
+            cache_path = Path(cache_path)
+            tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+            torch.save({"model_version": model_version(), "paths": keep,
+                        "embeddings": torch.stack([cached[p] for p in keep])}, tmp_path)
+            tmp_path.replace(cache_path)
+
+    ok = np.array([p in cached for p in paths])
+    dim = next(iter(cached.values())).shape[-1] if cached else 0
+    matrix = torch.zeros(len(paths), dim)
+    for i, p in enumerate(paths):
+        if ok[i]:
+            matrix[i] = cached[p].reshape(-1).float()
+    return F.normalize(matrix, dim=1), ok
+
+
+def score_trials(embs, enroll_idx, test_idx, cohort=None, cohort_top_k=COHORT_TOP_K):
+    """
+    Cosine score of every trial → [T] float64 array, computed SCORE_CHUNK
+    trials at a time as row-wise dot products of the normalised
+    embeddings. With a [M, D] `cohort`, returns (raw, AS-norm) instead;
+    cohort statistics are computed once per file, not per trial.
+    """
+    enroll_idx = torch.from_numpy(np.asarray(enroll_idx))
+    test_idx = torch.from_numpy(np.asarray(test_idx))
+    raw = torch.empty(len(enroll_idx))
+    for lo in range(0, len(enroll_idx), SCORE_CHUNK):
+        e, t = enroll_idx[lo:lo + SCORE_CHUNK], test_idx[lo:lo + SCORE_CHUNK]
+        raw[lo:lo + SCORE_CHUNK] = (embs[e] * embs[t]).sum(dim=1)
+    if cohort is None:
+        return raw.double().numpy()
+
+    cohort = F.normalize(cohort.reshape(len(cohort), -1).float(), dim=1)
+    mean, std = torch.empty(len(embs)), torch.empty(len(embs))
+    for lo in range(0, len(embs), COHORT_CHUNK):
+        mean[lo:lo + COHORT_CHUNK], std[lo:lo + COHORT_CHUNK] = _cohort_stats(
+            embs[lo:lo + COHORT_CHUNK] @ cohort.T, cohort_top_k
+        )
+    norm = 0.5 * ((raw - mean[enroll_idx]) / std[enroll_idx] + (raw - mean[test_idx]) / std[test_idx])
+    return raw.double().numpy(), norm.double().numpy()
+
+
+def evaluate(trials_path, root=None, workers=4, batch_size=16, p_target=P_TARGET,
+             cohort_path=None, embeddings_path=None, out_path=None, scores_path=None):
+    """
+    Scores a verification trial list end to end and reports EER and
+    minDCF (plus AS-norm metrics when `cohort_path` gives a [M, D]
+    impostor tensor). `embeddings_path` keeps embeddings between runs;
+    `out_path` receives the JSON report with DET points; `scores_path`
+    one "enroll test label score" line per trial.
+    """
+    start = time.perf_counter()
+    paths, enroll_idx, test_idx, labels = load_trials(trials_path, root)
+    print(f"📋 {len(labels)} trials over {len(paths)} files "
+          f"({int(labels.sum())} target, {int(len(labels) - labels.sum())} non-target)", file=sys.stderr)
+
+    embed_start = time.perf_counter()
+    embs, ok = embed_files(paths, workers=workers, batch_size=batch_size, cache_path=embeddings_path)
+    embed_sec = time.perf_counter() - embed_start
+
+    valid = ok[enroll_idx] & ok[test_idx]
+    if not valid.all():
+        print(f"⚠️  Dropping {int((~valid).sum())} trials with unreadable files", file=sys.stderr)
+        enroll_idx, test_idx, labels = enroll_idx[valid], test_idx[valid], labels[valid]
+
+    score_start = time.perf_counter()
+    cohort = torch.load(cohort_path, map_location="cpu") if cohort_path else None
+    with phase("score"):
+        scored = score_trials(embs, enroll_idx, test_idx, cohort=cohort)
+    raw, norm = scored if cohort is not None else (scored, None)
+    report = {
+        "trials": int(len(labels)),
+        "files": len(paths),
+        "dropped_trials": int((~valid).sum()),
+        "model_version": model_version(),
+        "raw": metrics(raw, labels, p_target),
+    }
+    if norm is not None:
+        report["as_norm"] = metrics(norm, labels, p_target)
+    score_sec = time.perf_counter() - score_start
+    report["seconds"] = {"embed": round(embed_sec, 2), "score": round(score_sec, 3),
+                         "total": round(time.perf_counter() - start, 2)}
+
+    for name in ("raw", "as_norm"):
+        if name in report:
+            m = report[name]
+            print(f"📈 {name:<7} EER {m['eer']:.2%} (threshold {m['eer_threshold']}) · "
+                  f"minDCF@{p_target:g} {m['min_dcf']:.4f} (threshold {m['min_dcf_threshold']})")
+    print(f"⏱️  embed {embed_sec:.1f}s · score {score_sec * 1e3:.0f}ms for {len(labels)} trials", file=sys.stderr)
+
+    if out_path:
+        Path(out_path).write_text(json.dumps(report, indent=2))
+    if scores_path:
+        final = raw if norm is None else norm
+        with open(scores_path, "w") as f:
+            for e, t, label, score in zip(enroll_idx, test_idx, labels, final):
+                f.write(f"{paths[e]} {paths[t]} {label} {score:.5f}\n")
+    return report
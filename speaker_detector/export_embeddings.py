@@ -1,25 +1,47 @@
 import torch
 import json
+import os
 
-def export_embeddings_to_json(pt_path, json_path):
+def _source_stamp(pt_path):
+    st = os.stat(pt_path)
+    return {"source": os.path.abspath(pt_path), "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+def export_embeddings_to_json(pt_path, json_path, force=False):
     """
     Converts a .pt file containing speaker embeddings into a
     JSON file for use in the browser frontend.
 
-    Expected input format:
+    The source file's mtime and size are stored next to the output
+    (`<json_path>.manifest`); if they haven't changed since the last
+    export, the export is skipped unless `force` is set. Returns True
+    when `json_path` was written.
+
+    Expected input format ([D] vectors or [K, D] sub-centroids):
         {
             "lara": tensor([...]),
-            "guest": tensor([...]),
+            "guest": tensor([[...], [...]]),
             ...
         }
 
-    Output format:
+    Output format ("vector" is always one [D] list — the normalized mean
+    of the sub-centroids — and "centroids" is added when there are several):
         [
             { "label": "lara", "vector": [...] },
-            { "label": "guest", "vector": [...] },
+            { "label": "guest", "vector": [...], "centroids": [[...], [...]] },
             ...
         ]
     """
+    stamp = _source_stamp(pt_path)
+    stamp_path = f"{json_path}.manifest"
+    if not force and os.path.exists(json_path):
+        try:
+            with open(stamp_path) as f:
+                if json.load(f) == stamp:
+                    print(f"✅ {json_path} is up to date")
+                    return False
+        except (OSError, ValueError):
+            pass
+
     data = torch.load(pt_path, map_location="cpu")
 
     if not isinstance(data, dict):
@@ -30,12 +52,22 @@ def export_embeddings_to_json(pt_path, json_path):
         if not isinstance(tensor, torch.Tensor):
             print(f"⚠️ Skipping {label}: not a tensor")
             continue
-        converted.append({
+        rows = tensor.reshape(-1, tensor.shape[-1]).float()
+        entry = {
             "label": label,
-            "vector": tensor.tolist()
-        })
+            "vector": torch.nn.functional.normalize(rows.mean(dim=0), dim=0).tolist()
+            if len(rows) > 1 else rows[0].tolist()
+        }
+        if len(rows) > 1:
+            entry["centroids"] = rows.tolist()
+        converted.append(entry)
 
-    with open(json_path, "w") as f:
+    tmp_path = f"{json_path}.tmp"
+    with open(tmp_path, "w") as f:
         json.dump(converted, f, indent=2)
+    os.replace(tmp_path, json_path)
+    with open(stamp_path, "w") as f:
+        json.dump(stamp, f)
 
     print(f"✅ Exported {len(converted)} speaker embeddings to {json_path}")
+    return True
@@ -1,17 +1,23 @@
+import inspect
+import math
+import os
+import time
+from collections import OrderedDict
+
 import torch
+import torch.nn.functional as F
 from speechbrain.lobes.models.ECAPA_TDNN import ECAPA_TDNN
-from collections import OrderedDict
 
-def export_model_to_onnx(ckpt_path, out_path):
-    model = ECAPA_TDNN(
-        input_size=80,
-        channels=[1024, 1024, 1024, 1024, 3072],
-        kernel_sizes=[5, 3, 3, 3, 1],
-        dilations=[1, 2, 3, 4, 1],
-        attention_channels=128,
-        lin_neurons=192,
-    )
+ONNX_OPSET = 17
+SAMPLE_RATE = 16000
+PARITY_SECONDS = (1.0, 3.0, 10.0, 30.0)
+PARITY_MIN_COSINE = {"fp32": 0.9999, "fp16": 0.999}
+LATENCY_REPEATS = 10
 
+
+# ─── Checkpoint → ECAPA config ────────────────────────────────────────────────
+
+def _load_state_dict(ckpt_path):
     state_dict = torch.load(ckpt_path, map_location="cpu")
 
     if "model" in state_dict:
@@ -22,19 +28,314 @@ def export_model_to_onnx(ckpt_path, out_path):
         if k.startswith("embedding_model."):
             k = k[len("embedding_model."):]
         new_state_dict[k] = v
+    return new_state_dict
+
+
+def ecapa_config(state_dict):
+    """
+    Reads ECAPA_TDNN constructor arguments off the checkpoint's weight
+    shapes, so exports follow whatever channel/kernel layout was trained.
+    Dilations are not stored in weights; the standard 1, 2, …, n, 1
+    progression is assumed.
+    """
+    w = lambda key: state_dict[key].shape
+    n_res = len({k.split(".")[1] for k in state_dict if k.startswith("blocks.")}) - 1
+
+    channels = [w("blocks.0.conv.conv.weight")[0]]
+    kernel_sizes = [w("blocks.0.conv.conv.weight")[2]]
+    for i in range(1, n_res + 1):
+        channels.append(w(f"blocks.{i}.tdnn1.conv.conv.weight")[0])
+        kernel_sizes.append(w(f"blocks.{i}.res2net_block.blocks.0.conv.conv.weight")[2])
+    channels.append(w("mfa.conv.conv.weight")[0])
+    kernel_sizes.append(w("mfa.conv.conv.weight")[2])
+
+    res2net_blocks = {k.split(".")[4] for k in state_dict if k.startswith("blocks.1.res2net_block.blocks.")}
+    return {
+        "input_size": w("blocks.0.conv.conv.weight")[1],
+        "channels": channels,
+        "kernel_sizes": kernel_sizes,
+        "dilations": [1] + list(range(2, n_res + 2)) + [1],
+        "attention_channels": w("asp.tdnn.conv.conv.weight")[0],
+        "res2net_scale": len(res2net_blocks) + 1,
+        "se_channels": w("blocks.1.se_block.conv1.conv.weight")[0],
+        "global_context": w("asp.tdnn.conv.conv.weight")[1] == 3 * channels[-1],
+        "lin_neurons": w("fc.conv.weight")[0],
+    }
+
+
+def load_ecapa(ckpt_path):
+    state_dict = _load_state_dict(ckpt_path)
+    model = ECAPA_TDNN(**ecapa_config(state_dict))
+    model.load_state_dict(state_dict)
+    return model.eval()
+
+
+# ─── End-to-end graph ─────────────────────────────────────────────────────────
+
+class WaveformEncoder(torch.nn.Module):
+    """
+    wav [B, T] + relative lengths [B] → embedding [B, D], equivalent to
+    SpeakerRecognition.encode_batch. The STFT is a strided conv with a
+    windowed DFT kernel (torch.stft does not export), the mel filterbank
+    is SpeechBrain's own module, and sentence mean-variance normalization
+    is a masked mean so it stays batched.
+    """
+
+    def __init__(self, compute_features, mean_var_norm, embedding_model):
+        super().__init__()
+        stft = compute_features.compute_STFT
+        if getattr(compute_features, "deltas", False) or getattr(compute_features, "context", False):
+            raise ValueError("Fbank deltas/context are not supported in the ONNX front-end")
+        if getattr(mean_var_norm, "norm_type", "sentence") != "sentence":
+            raise ValueError(f"Only sentence normalization is supported, got {mean_var_norm.norm_type}")
+
+        n_fft, win = stft.n_fft, stft.win_length
+        window = torch.zeros(n_fft)
+        left = (n_fft - win) // 2  # torch.stft centres a short window in n_fft
+        window[left:left + win] = stft.window.float()
+        n = torch.arange(n_fft, dtype=torch.float64)
+        k = torch.arange(n_fft // 2 + 1, dtype=torch.float64)
+        angle = 2 * math.pi * k[:, None] * n[None, :] / n_fft
+        kernel = torch.cat([torch.cos(angle), -torch.sin(angle)]) * window.double()
+        self.register_buffer("dft", kernel.float().unsqueeze(1))  # [2F, 1, n_fft]
+
+        self.n_fft = n_fft
+        self.hop = stft.hop_length
+        self.center = stft.center
+        self.pad_mode = stft.pad_mode
+        self.fbanks = compute_features.compute_fbanks
+        self.mean_norm = getattr(mean_var_norm, "mean_norm", True)
+        self.std_norm = getattr(mean_var_norm, "std_norm", False)
+        self.eps = getattr(mean_var_norm, "eps", 1e-10)
+        self.embedding_model = embedding_model
+
+    def features(self, wav):
+        x = wav.unsqueeze(1)
+        if self.center:
+            x = F.pad(x, (self.n_fft // 2, self.n_fft // 2), mode=self.pad_mode)
+        spec = F.conv1d(x, self.dft, stride=self.hop)  # [B, 2F, L]
+        real, imag = spec.chunk(2, dim=1)
+        power = (real.pow(2) + imag.pow(2)).transpose(1, 2)  # [B, L, F]
+        return self.fbanks(power)
+
+    def normalize(self, feats, lengths):
+        frames = feats.shape[1]
+        valid = torch.arange(frames, device=feats.device)[None, :] < torch.round(lengths * frames)[:, None]
+        mask = valid.unsqueeze(-1).to(feats.dtype)
+        count = mask.sum(dim=1, keepdim=True)
+        mean = (feats * mask).sum(dim=1, keepdim=True) / count
+        if self.std_norm:
+            var = ((feats - mean).pow(2) * mask).sum(dim=1, keepdim=True) / (count - 1)
+            std = var.sqrt().clamp(min=self.eps)
+        if self.mean_norm:
+            feats = feats - mean
+        if self.std_norm:
+            feats = feats / std
+        return feats
+
+    def forward(self, wav, lengths):
+        feats = self.normalize(self.features(wav), lengths)
+        return self.embedding_model(feats, lengths).squeeze(1)
+
+
+# ─── ONNX post-processing ─────────────────────────────────────────────────────
+
+def _export_kwargs():
+    # SpeechBrain builds its pooling masks with len(lengths); the TorchScript
+    # exporter turns that into a constant, which stays batch-agnostic only
+    # when traced at batch 1 (it then broadcasts). The dynamo exporter would
+    # specialize a batch of 1 instead, so pin the TorchScript path.
+    params = inspect.signature(torch.onnx.export).parameters
+    return {"dynamo": False} if "dynamo" in params else {}
+
 
-    model.load_state_dict(new_state_dict)
-    model.eval()
+def optimize_onnx(path):
+    """
+    Rewrites `path` with onnxruntime's basic offline graph optimizations
+    (constant folding, redundant node elimination). Only basic rewrites are
+    saved: extended ones fuse into onnxruntime-only contrib ops, which other
+    runtimes and the fp16 converter cannot load. Sessions still apply the
+    full set at load time. Returns False if onnxruntime is missing.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        print("⚠️  onnxruntime not installed; skipping graph optimization")
+        return False
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+    tmp = f"{path}.opt.tmp"
+    opts.optimized_model_filepath = tmp
+    ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+    os.replace(tmp, path)
+    return True
 
-    dummy_input = torch.randn(1, 200, 80)
+
+def convert_fp16(src, dst):
+    """
+    Writes an fp16 copy of `src`, keeping fp32 inputs/outputs and the
+    whole front-end (power spectrum and log-mel overflow fp16) in fp32;
+    only the encoder's nodes are converted.
+    """
+    import onnx
+    try:
+        from onnxconverter_common import float16
+    except ImportError as e:
+        raise RuntimeError("fp16 export needs `pip install onnxconverter-common`") from e
+    model = onnx.load(src)
+    keep_fp32 = [n.name for n in model.graph.node if not n.name.startswith("/embedding_model/")]
+    model = float16.convert_float_to_float16(model, keep_io_types=True, node_block_list=keep_fp32)
+    onnx.save(model, dst)
+    return dst
+
+
+def _fp16_path(out_path):
+    root, ext = os.path.splitext(out_path)
+    return f"{root}.fp16{ext or '.onnx'}"
+
+
+# ─── Validation ───────────────────────────────────────────────────────────────
+
+def _median_ms(fn, repeats=LATENCY_REPEATS):
+    fn()  # warm-up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2] * 1e3
+
+
+def validate_onnx(onnx_path, reference, cases, min_cosine, input_names):
+    """
+    Runs `reference(*inputs)` and the ONNX graph on each case and reports
+    the worst cosine similarity, max abs difference and median latency of
+    both. `cases` is a list of (label, tuple of input tensors). Returns
+    {"ok": bool, "rows": [...]}.
+    """
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(onnx_path, opts, providers=["CPUExecutionProvider"])
+
+    print(f"🔎 Validating {onnx_path} (min cosine {min_cosine})")
+    print(f"{'case':>14} {'cosine':>8} {'max abs':>9} {'torch ms':>9} {'onnx ms':>8} {'speedup':>8}")
+    rows, ok = [], True
+    for label, inputs in cases:
+        feeds = {name: t.numpy() for name, t in zip(input_names, inputs)}
+        with torch.no_grad():
+            expected = reference(*inputs).reshape(inputs[0].shape[0], -1)
+        actual = torch.from_numpy(session.run(None, feeds)[0]).reshape_as(expected).float()
+        cosine = F.cosine_similarity(expected, actual, dim=-1).min().item()
+        max_abs = (expected - actual).abs().max().item()
+        with torch.no_grad():
+            torch_ms = _median_ms(lambda: reference(*inputs))
+        onnx_ms = _median_ms(lambda: session.run(None, feeds))
+        passed = cosine >= min_cosine
+        ok &= passed
+        rows.append({"case": label, "cosine": cosine, "max_abs": max_abs,
+                     "torch_ms": torch_ms, "onnx_ms": onnx_ms, "ok": passed})
+        print(f"{label:>14} {cosine:>8.5f} {max_abs:>9.2e} {torch_ms:>9.1f} {onnx_ms:>8.1f} "
+              f"{torch_ms / onnx_ms:>7.2f}× {'✅' if passed else '❌'}")
+    return {"ok": ok, "rows": rows}
+
+
+def _waveform_cases(seconds=PARITY_SECONDS, sr=SAMPLE_RATE):
+    gen = torch.Generator().manual_seed(0)
+    cases = [(f"1×{s:g}s", (torch.randn(1, int(s * sr), generator=gen) * 0.1, torch.ones(1)))
+             for s in seconds]
+    # A padded batch checks dynamic batch and the length-masked statistics
+    lens = [int(s * sr) for s in seconds]
+    batch = torch.zeros(len(lens), max(lens))
+    for i, n in enumerate(lens):
+        batch[i, :n] = torch.randn(n, generator=gen) * 0.1
+    cases.append((f"{len(lens)}×padded", (batch, torch.tensor(lens, dtype=torch.float) / max(lens))))
+    return cases
+
+
+def _feature_cases(n_mels, seconds=PARITY_SECONDS, frames_per_sec=100):
+    gen = torch.Generator().manual_seed(0)
+    return [(f"2×{s:g}s", (torch.randn(2, int(s * frames_per_sec), n_mels, generator=gen),))
+            for s in seconds]
+
+
+# ─── Entry points ─────────────────────────────────────────────────────────────
+
+def export_model_to_onnx(ckpt_path, out_path, opset=ONNX_OPSET, validate=True):
+    """
+    Exports the ECAPA trunk alone: features [B, T, n_mels] → embedding.
+    Returns {path: validation report} like export_end_to_end.
+    """
+    model = load_ecapa(ckpt_path)
+    n_mels = model.blocks[0].conv.conv.in_channels
+
+    dummy_input = torch.randn(1, 200, n_mels)
     torch.onnx.export(
         model,
         dummy_input,
         out_path,
         input_names=["features"],
         output_names=["embedding"],
-        dynamic_axes={"features": {0: "batch", 1: "time"}},
-        opset_version=12,
+        dynamic_axes={"features": {0: "batch", 1: "time"}, "embedding": {0: "batch"}},
+        opset_version=opset,
+        **_export_kwargs(),
     )
-
+    optimize_onnx(out_path)
     print(f"✅ Exported ECAPA-TDNN to {out_path}")
+
+    if validate:
+        try:
+            return {out_path: validate_onnx(out_path, model, _feature_cases(n_mels),
+                                            PARITY_MIN_COSINE["fp32"], ["features"])}
+        except ImportError:
+            print("⚠️  onnxruntime not installed; skipping validation")
+    return {}
+
+
+def export_end_to_end(out_path, ckpt_path=None, opset=ONNX_OPSET, fp16=False, validate=True):
+    """
+    Exports waveform [B, T] (16 kHz mono) + relative lengths [B] → embedding
+    [B, D] as one graph: Fbank, sentence mean normalization and ECAPA.
+    Uses the pretrained model from core, optionally with encoder weights
+    from `ckpt_path`. With `fp16`, also writes `<out>.fp16.onnx`. Returns
+    {path: validation report} (empty when validation is skipped).
+    """
+    from speaker_detector.core import MODEL, MODEL_SAMPLE_RATE
+
+    mods = MODEL.mods
+    encoder = load_ecapa(ckpt_path) if ckpt_path else mods.embedding_model
+    wrapper = WaveformEncoder(mods.compute_features, mods.mean_var_norm, encoder).eval()
+    # Same steps as encode_batch, but with `encoder` swapped in
+    reference = lambda wav, lens: encoder(mods.mean_var_norm(mods.compute_features(wav), lens), lens).squeeze(1)
+
+    dummy = (torch.randn(1, 3 * MODEL_SAMPLE_RATE) * 0.1, torch.ones(1))
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            dummy,
+            out_path,
+            input_names=["waveform", "lengths"],
+            output_names=["embedding"],
+            dynamic_axes={"waveform": {0: "batch", 1: "samples"}, "lengths": {0: "batch"},
+                          "embedding": {0: "batch"}},
+            opset_version=opset,
+            **_export_kwargs(),
+        )
+    outputs = {out_path: "fp32"}
+    if fp16:
+        # Convert the plain export; optimized graphs carry fused contrib ops
+        outputs[convert_fp16(out_path, _fp16_path(out_path))] = "fp16"
+    for path, precision in outputs.items():
+        optimize_onnx(path)
+        print(f"✅ Exported waveform → embedding graph ({precision}) to {path}")
+
+    reports = {}
+    if validate:
+        try:
+            cases = _waveform_cases(sr=MODEL_SAMPLE_RATE)
+            for path, precision in outputs.items():
+                reports[path] = validate_onnx(path, reference, cases, PARITY_MIN_COSINE[precision],
+                                              ["waveform", "lengths"])
+        except ImportError:
+            print("⚠️  onnxruntime not installed; skipping validation")
+    return reports
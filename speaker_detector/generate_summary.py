@@ -1,110 +1,77 @@
-import os
 import torch
-import torchaudio
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from pydub import AudioSegment
 from dotenv import load_dotenv
-from speaker_detector.core import get_embedding, STORAGE_DIR
+from speaker_detector.core import load_speaker_index
+from speaker_detector import meeting_store
+from speaker_detector.segmentation import blocks, turn_pipeline
+from speaker_detector.transcribe import get_backend, transcribe_meeting
 
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-CHUNK_DURATION = 8  # seconds
-SCORE_THRESHOLD = 0.6
 MIN_VALID_DURATION = 1.0  # seconds
-WHISPER_API_URL = "https://api.openai.com/v1/audio/transcriptions"
+WHISPER_PROMPT = "This is a meeting transcription."
+WHISPER_TEMPERATURE = 0.2
 
-def match_speaker(embedding, speaker_embeddings):
-    scores = {
-        name: torch.nn.functional.cosine_similarity(emb, embedding, dim=0).item()
-        for name, emb in speaker_embeddings.items()
-    }
-    if not scores:
-        return "unknown", 0.0
-    best = max(scores.items(), key=lambda kv: kv[1])
-    return best[0], round(best[1], 3)
-
-def transcribe_full_audio(wav_path: Path) -> str:
+def transcribe_full_audio(meeting_dir: Path, index=None) -> str:
     try:
-        with open(wav_path, "rb") as f:
-            response = requests.post(
-                WHISPER_API_URL,
-                headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
-                files={"file": (wav_path.name, f, "audio/wav")},
-                data={
-                    "model": "whisper-1",
-                    "response_format": "json",
-                    "temperature": 0.2,
-                    "language": "en",
-                    "prompt": "This is a meeting transcription.",
-                },
-                timeout=120
-            )
-        response.raise_for_status()
-        return response.json()["text"].strip()
+        backend = get_backend(prompt=WHISPER_PROMPT, temperature=WHISPER_TEMPERATURE)
+        result = transcribe_meeting(meeting_dir, backend=backend, index=index)
+        for err in result["errors"]:
+            print(f"❌ Whisper failed on {err['start']}-{err['end']}s: {err['error']}")
+        return result["text"]
     except Exception as e:
         print(f"❌ Whisper failed: {e}")
         return ""
 
-def is_valid_audio(path):
-    try:
-        waveform, sample_rate = torchaudio.load(str(path))
-        duration_sec = waveform.shape[1] / sample_rate
-        return duration_sec >= MIN_VALID_DURATION
-    except Exception:
-        return False
-
 def generate_summary(meeting_dir: Path):
     meeting_dir = meeting_dir.resolve()
-    chunk_files = sorted([
-        f for f in meeting_dir.iterdir()
-        if f.name.startswith("chunk_") and f.suffix == ".wav" and is_valid_audio(f)
-    ])
+    # Validity comes from the seek index (header frame counts), not decoding;
+    # short chunks are dropped from both the transcript and the speaker turns
+    index = meeting_store.select_chunks(
+        meeting_store.load_index(meeting_dir),
+        lambda c: c["frames"] / c["sample_rate"] >= MIN_VALID_DURATION,
+    )
 
-    if not chunk_files:
-        return {"warning": "No valid .wav chunks found in meeting folder.", "segments": []}
+    if not index["chunks"]:
+        return {"warning": "No valid audio chunks found in meeting folder.", "segments": []}
 
-    # Merge all chunks into one file
-    combined = AudioSegment.empty()
-    for f in chunk_files:
-        combined += AudioSegment.from_wav(f)
-    merged_path = meeting_dir / "combined.wav"
-    combined.export(merged_path, format="wav")
+    # The enrolled roster, as every other scoring path sees it
+    speaker_index = load_speaker_index()
 
-    # Get full transcript
-    full_text = transcribe_full_audio(merged_path)
-    print("🧠 Full transcript:", full_text)
-
-    # Load speaker embeddings
-    speaker_embeddings = {}
-    for spk_dir in STORAGE_DIR.iterdir():
-        if spk_dir.is_dir():
-            wavs = [w for w in spk_dir.glob("*.wav") if is_valid_audio(w)]
-            if wavs:
-                embs = [get_embedding(str(w)) for w in wavs]
-                speaker_embeddings[spk_dir.name] = torch.stack(embs).mean(dim=0)
+    # Speaker turns from change-point segmentation, each embedded once;
+    # decoding, segmentation, the model and scoring run as pipeline stages
+    def label(turns):
+        matches = speaker_index.identify(torch.stack([emb for _, _, emb in turns]))
+        return [
+            {
+                "timestamp": round(start, 2),
+                "end": round(end, 2),
+                "speaker": match["speaker"],
+                "score": round(match["score"], 3),
+            }
+            for (start, end, _), match in zip(turns, matches)
+        ]
 
-    segments = []
-    total = len(chunk_files)
+    pipeline = turn_pipeline(
+        lambda start, end: meeting_store.read_range(meeting_dir, start, end, index), label
+    )
+    # Full transcript, streamed from the chunks in silence-split pieces; the
+    # uploads run while the speaker pipeline works locally
+    with ThreadPoolExecutor(max_workers=1) as transcriber:
+        transcript = transcriber.submit(transcribe_full_audio, meeting_dir, index)
+        segments = pipeline.run(blocks(meeting_store.duration(index)))
+        full_text = transcript.result()
+    pipeline.print_stats()
+    print("🧠 Full transcript:", full_text)
 
-    for idx, chunk in enumerate(chunk_files):
-        try:
-            emb = get_embedding(chunk)
-            speaker, score = match_speaker(emb, speaker_embeddings)
-            segment_text = f"[chunk {idx+1}]"
-            segments.append({
-                "timestamp": idx * CHUNK_DURATION,
-                "speaker": speaker if score >= SCORE_THRESHOLD else "unknown",
-                "score": round(score, 3),
-                "text": segment_text,
-                "progress": round((idx + 1) / total * 100)
-            })
-        except Exception as e:
-            print(f"❌ Failed on {chunk.name}: {e}")
+    for idx, seg in enumerate(segments):
+        seg["text"] = f"[segment {idx+1}]"
+        seg["progress"] = round((idx + 1) / len(segments) * 100)
 
     return {
         "transcript": full_text,
         "segments": segments if segments else [],
-        "warning": None if segments else "No speaker segments found."
+        "warning": None if segments else "No speaker segments found.",
+        "pipeline": pipeline.stats(),
     }
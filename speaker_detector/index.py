@@ -0,0 +1,327 @@
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+
+MATCH_THRESHOLD = 0.25  # absolute cosine score accepted as a match
+MATCH_GAP = 0.1         # ...or a lead this large over the runner-up
+NORM_THRESHOLD = 2.0    # AS-norm score accepted as a match when a cohort is available
+VERIFY_THRESHOLD = 0.25 # cosine score accepting a 1:1 claim; tune with `speaker-detector evaluate`
+COHORT_TOP_K = 200      # AS-norm: statistics over the k closest cohort members
+MIN_COHORT = 10         # below this, cohort statistics are too noisy to use
+MAX_CENTROIDS = 4       # sub-centroids kept per speaker
+MIN_PER_CENTROID = 3    # recordings needed to justify each extra sub-centroid
+MERGE_COSINE = 0.7      # sub-centroids closer than this are merged back together
+KMEANS_ITERS = 10
+
+
+def _cohort_stats(scores, top_k):
+    """Mean and std of the top_k highest scores in each row of [R, M]."""
+    k = max(1, min(top_k, scores.shape[1]))
+    top = scores.topk(k, dim=1).values
+    return top.mean(dim=1), top.std(dim=1, unbiased=False).clamp_min(1e-6)
+
+
+def _cohort_stats_excluding(scores, top_k):
+    """
+    Leave-one-out _cohort_stats over [Q, N]: for every column j, the mean
+    and std of the row's top_k scores among the other columns → two
+    [Q, N] tensors. Only columns inside a row's top_k differ from the plain
+    statistics (their slot goes to the (k+1)-th score), so one topk covers
+    all of them.
+    """
+    n = scores.shape[1]
+    k = max(1, min(top_k, n - 1))
+    vals, idx = scores.topk(k + 1, dim=1)
+    head = vals[:, :k]
+    total, total_sq = vals.sum(dim=1, keepdim=True), vals.pow(2).sum(dim=1, keepdim=True)
+    sums = head.sum(dim=1, keepdim=True).expand(-1, n).clone()
+    sums_sq = head.pow(2).sum(dim=1, keepdim=True).expand(-1, n).clone()
+    sums.scatter_(1, idx[:, :k], total - head)
+    sums_sq.scatter_(1, idx[:, :k], total_sq - head.pow(2))
+    mean = sums / k
+    std = (sums_sq / k - mean.pow(2)).clamp_min(0).sqrt().clamp_min(1e-6)
+    return mean, std
+
+
+def sub_centroids(embs, max_k=MAX_CENTROIDS, min_size=MIN_PER_CENTROID,
+                  merge_cosine=MERGE_COSINE, iters=KMEANS_ITERS):
+    """
+    Clusters a speaker's per-recording embeddings [R, D] into at most
+    `max_k` unit-norm sub-centroids [K, D] with spherical k-means
+    (farthest-point init, so results are deterministic). K grows with the
+    number of recordings, and clusters that end up closer than
+    `merge_cosine` are merged, so a speaker recorded in one setting keeps
+    a single centroid.
+    """
+    x = F.normalize(embs.reshape(-1, embs.shape[-1]).float(), dim=1)
+    k = max(1, min(max_k, len(x) // min_size))
+
+    # Farthest-point init: start nearest the mean, then add the point least
+    # similar to every chosen centre
+    chosen = [int((x @ x.mean(dim=0)).argmax())]
+    while len(chosen) < k:
+        closest = (x @ x[chosen].T).max(dim=1).values
+        chosen.append(int(closest.argmin()))
+    centers = x[chosen]
+
+    for _ in range(iters if k > 1 else 1):
+        assign = (x @ centers.T).argmax(dim=1)
+        sums = torch.zeros_like(centers).index_add_(0, assign, x)
+        counts = torch.bincount(assign, minlength=len(centers))
+        sums, counts = sums[counts > 0], counts[counts > 0]
+        centers = F.normalize(sums, dim=1)
+
+    while len(centers) > 1:
+        sim = centers @ centers.T
+        sim.fill_diagonal_(-1.0)
+        best = int(sim.argmax())
+        i, j = divmod(best, len(centers))
+        if sim[i, j] < merge_cosine:
+            break
+        sums[i] += sums[j]
+        counts[i] += counts[j]
+        keep = [c for c in range(len(centers)) if c != j]
+        sums, counts = sums[keep], counts[keep]
+        centers = F.normalize(sums, dim=1)
+    return centers
+
+
+def _segment_max(values, owner, n):
+    """Per-speaker max over the row axis: [Q, R] → [Q, n] via segment ids [R]."""
+    out = values.new_full((values.shape[0], n), float("-inf"))
+    return out.scatter_reduce_(1, owner.expand_as(values), values, reduce="amax")
+
+
+def match_result(names, raw, ranked, normalized, threshold=MATCH_THRESHOLD, gap=MATCH_GAP,
+                 norm_threshold=NORM_THRESHOLD, top_k=None):
+    """
+    identify() decision for one query from its candidate speakers, best
+    first: `names`, their raw cosine scores and their ranking scores
+    (AS-norm when `normalized`, otherwise the raw scores again).
+    """
+    best = raw[0]
+    second = raw[1] if len(raw) > 1 else 0
+    if normalized:
+        is_match = best - second > gap or ranked[0] >= norm_threshold
+    else:
+        is_match = best - second > gap or best >= threshold
+    shown = raw if top_k is None else raw[:top_k]
+    result = {
+        "speaker": names[0] if is_match else "unknown",
+        "score": round(best, 3),
+        "all_scores": {name: round(s, 3) for name, s in zip(names, shown)},
+    }
+    if normalized:
+        result["norm_score"] = round(ranked[0], 3)
+    return result
+
+
+class SpeakerIndex:
+    """
+    Enrolled speaker embeddings stacked into one L2-normalised [R, D]
+    matrix, so scoring any number of queries is a single matrix product.
+    A speaker may own several rows (sub-centroids); `owner` [R] maps each
+    row to its speaker, and a speaker's score is the max over its rows.
+
+    With an impostor cohort the index also applies adaptive score
+    normalisation (AS-norm). Each speaker's cohort mean and std are computed
+    once, when the index is built. At query time the query-side stats come
+    from the same matrix product as the raw scores. If no separate cohort
+    is given, the other enrolled speakers serve as the cohort.
+    """
+
+    def __init__(self, names, matrix, cohort=None, cohort_top_k=COHORT_TOP_K, owner=None):
+        self.names = list(names)
+        if self.names:
+            self.matrix = F.normalize(matrix.float(), dim=1)
+        else:
+            self.matrix = torch.empty(0, 0)
+        self.owner = torch.arange(len(self.names)) if owner is None else owner.long()
+
+        self.cohort_top_k = cohort_top_k
+        self.cohort = None          # [M, D] external cohort, if any
+        self.self_cohort = False    # cohort is the roster itself
+        self.enroll_mean = self.enroll_std = None
+
+        if cohort is not None and len(cohort) >= MIN_COHORT and self.names:
+            self.cohort = F.normalize(cohort.reshape(len(cohort), -1).float(), dim=1)
+            self.enroll_mean, self.enroll_std = _cohort_stats(
+                self.matrix @ self.cohort.T, cohort_top_k
+            )
+        elif len(self.names) > MIN_COHORT:
+            # Each row against every other speaker (their best row), never
+            # against its own speaker's rows
+            self.self_cohort = True
+            gram = _segment_max(self.matrix @ self.matrix.T, self.owner, len(self.names))
+            gram[torch.arange(len(self.owner)), self.owner] = float("-inf")
+            self.enroll_mean, self.enroll_std = _cohort_stats(
+                gram, min(cohort_top_k, len(self.names) - 1)
+            )
+
+    @classmethod
+    def from_folder(cls, folder, cohort_path=None, select=None):
+        """
+        Loads every `<speaker>.pt` tensor in `folder` ([D] or [K, D]
+        sub-centroids), skipping unreadable files, and those whose speaker
+        name `select(name)` rejects. `cohort_path` may point to a [M, D]
+        tensor of impostor embeddings.
+        """
+        names, rows, owner = [], [], []
+        for emb_path in sorted(Path(folder).glob("*.pt")):
+            if select is not None and not select(emb_path.stem):
+                continue
+            try:
+                emb = torch.load(emb_path, map_location="cpu")
+            except Exception:
+                continue
+            if not isinstance(emb, torch.Tensor) or emb.numel() == 0:
+                continue
+            emb = emb.reshape(-1, emb.shape[-1]).float()
+            owner += [len(names)] * len(emb)
+            names.append(emb_path.stem)
+            rows.append(emb)
+
+        cohort = None
+        if cohort_path is not None and Path(cohort_path).exists():
+            cohort = torch.load(cohort_path, map_location="cpu")
+        return cls(names, torch.cat(rows) if rows else None, cohort=cohort,
+                   owner=torch.tensor(owner, dtype=torch.long))
+
+    # ─── Persistence ──────────────────────────────────────────────────────
+
+    def state_dict(self):
+        return {
+            "names": self.names,
+            "matrix": self.matrix,
+            "owner": self.owner,
+            "cohort": self.cohort,
+            "self_cohort": self.self_cohort,
+            "cohort_top_k": self.cohort_top_k,
+            "enroll_mean": self.enroll_mean,
+            "enroll_std": self.enroll_std,
+        }
+
+    @classmethod
+    def from_state_dict(cls, state):
+        index = cls.__new__(cls)
+        index.names = list(state["names"])
+        index.matrix = state["matrix"]
+        owner = state.get("owner")
+        index.owner = torch.arange(len(index.names)) if owner is None else owner.long()
+        index.cohort = state["cohort"]
+        index.self_cohort = state["self_cohort"]
+        index.cohort_top_k = state["cohort_top_k"]
+        index.enroll_mean = state["enroll_mean"]
+        index.enroll_std = state["enroll_std"]
+        return index
+
+    # ─── Scoring ──────────────────────────────────────────────────────────
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def normalized(self):
+        return self.enroll_mean is not None
+
+    def scores(self, queries):
+        """Cosine scores [Q, N] for queries of shape [Q, D] (or a single [D])."""
+        queries = queries.reshape(-1, queries.shape[-1]).float()
+        rows = F.normalize(queries, dim=1) @ self.matrix.T
+        return _segment_max(rows, self.owner, len(self.names))
+
+    def score_with_norm(self, queries):
+        """
+        Returns (raw [Q, N], normalised [Q, N] or None). All sub-centroid
+        and cohort rows go through one matrix product; rows are then
+        max-pooled per speaker.
+        """
+        queries = F.normalize(queries.reshape(-1, queries.shape[-1]).float(), dim=1)
+        r = len(self.owner)
+        if self.cohort is not None:
+            both = queries @ torch.cat([self.matrix, self.cohort]).T
+            rows, cohort_scores = both[:, :r], both[:, r:]
+        else:
+            rows = queries @ self.matrix.T
+            cohort_scores = None
+        raw = _segment_max(rows, self.owner, len(self.names))
+        if self.self_cohort:
+            # Like the enrollment side, a speaker is never part of its own
+            # cohort: stats for column j leave speaker j out
+            q_mean, q_std = _cohort_stats_excluding(raw, min(self.cohort_top_k, len(self.names) - 1))
+            q_mean, q_std = q_mean[:, self.owner], q_std[:, self.owner]
+        elif cohort_scores is not None:
+            q_mean, q_std = _cohort_stats(cohort_scores, self.cohort_top_k)
+            q_mean, q_std = q_mean.unsqueeze(1), q_std.unsqueeze(1)
+        else:
+            return raw, None
+
+        norm_rows = 0.5 * (
+            (rows - self.enroll_mean) / self.enroll_std
+            + (rows - q_mean) / q_std
+        )
+        return raw, _segment_max(norm_rows, self.owner, len(self.names))
+
+    def identify(self, queries, threshold=MATCH_THRESHOLD, gap=MATCH_GAP, top_k=None,
+                 norm_threshold=NORM_THRESHOLD):
+        """
+        Returns one result dict per query with the best speaker (or
+        "unknown"), its raw cosine score and `all_scores`, the `top_k` best
+        raw scores (all speakers if top_k is None). When cohort statistics
+        are available, speakers are ranked and accepted on the AS-norm score,
+        which is also reported as `norm_score`.
+        """
+        if not self.names:
+            n = queries.reshape(-1, queries.shape[-1]).shape[0]
+            return [{"speaker": "unknown", "score": 0} for _ in range(n)]
+
+        raw, norm = self.score_with_norm(queries)
+        ranked = raw if norm is None else norm
+        k = len(self.names) if top_k is None else min(max(top_k, 2), len(self.names))
+        top_ranked, top_idx = ranked.topk(k, dim=1)
+        top_raw = raw.gather(1, top_idx)
+
+        return [
+            match_result([self.names[i] for i in row_idx], row_raw, row_rank, norm is not None,
+                         threshold=threshold, gap=gap, norm_threshold=norm_threshold, top_k=top_k)
+            for row_rank, row_raw, row_idx in zip(top_ranked.tolist(), top_raw.tolist(), top_idx.tolist())
+        ]
+
+    def verify(self, queries, claims, threshold=VERIFY_THRESHOLD, norm_threshold=NORM_THRESHOLD):
+        """
+        1:1 checks: one result per query row against the speaker named in
+        `claims` (one name per row). All claims are scored in one pass.
+        With cohort statistics the claim is accepted on the AS-norm score,
+        otherwise on the raw cosine. Names not in the index are rejected
+        with an "error".
+        """
+        claims = list(claims)
+        queries = queries.reshape(-1, queries.shape[-1])
+        if len(claims) != len(queries):
+            raise ValueError(f"{len(queries)} queries but {len(claims)} claims")
+        if not self.names:
+            return [{"speaker": c, "match": False, "score": 0, "error": "no speakers enrolled"} for c in claims]
+
+        positions = {name: i for i, name in enumerate(self.names)}
+        known = [c in positions for c in claims]
+        cols = torch.tensor([positions.get(c, 0) for c in claims])
+        raw, norm = self.score_with_norm(queries)
+        rows = torch.arange(len(claims))
+        raw = raw[rows, cols].tolist()
+        norm = None if norm is None else norm[rows, cols].tolist()
+
+        results = []
+        for i, claim in enumerate(claims):
+            if not known[i]:
+                results.append({"speaker": claim, "match": False, "score": 0,
+                                "error": f"unknown speaker: {claim}"})
+                continue
+            result = {"speaker": claim, "score": round(raw[i], 3)}
+            if norm is None:
+                result["match"] = raw[i] >= threshold
+            else:
+                result["match"] = norm[i] >= norm_threshold
+                result["norm_score"] = round(norm[i], 3)
+            results.append(result)
+        return results
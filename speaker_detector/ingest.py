@@ -0,0 +1,221 @@
+import os
+import queue
+import threading
+import traceback
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+import torchaudio
+
+from speaker_detector import meeting_store
+from speaker_detector.core import (
+    MODEL_EMBEDDING_DIM,
+    MODEL_SAMPLE_RATE,
+    embed_waveforms,
+    model_version,
+    prepare_waveform,
+)
+
+WINDOWS_DIR = "windows"   # per-chunk window embeddings, inside the meeting folder
+WINDOW_SEC = 1.5
+HOP_SEC = 0.75
+VAD_FRAME_SEC = 0.02
+VAD_FLOOR_DB = 12.0       # speech is this far above the chunk's noise floor...
+VAD_RANGE_DB = 45.0       # ...and within this of its loudest frame
+MIN_VOICED = 0.3          # fraction of a window's frames that must be speech
+BATCH_SIZE = 32
+
+
+# ─── VAD & windowing ──────────────────────────────────────────────────────────
+
+def speech_frames(wav, sr=MODEL_SAMPLE_RATE, frame_sec=VAD_FRAME_SEC):
+    """Energy VAD over a mono [T] tensor → bool [frames]."""
+    frame = max(1, int(frame_sec * sr))
+    if wav.shape[-1] < frame:
+        return torch.zeros(0, dtype=torch.bool)
+    db = 10 * torch.log10(wav.unfold(-1, frame, frame).pow(2).mean(dim=-1) + 1e-10)
+    floor = torch.quantile(db, 0.1)
+    threshold = torch.maximum(floor + VAD_FLOOR_DB, db.max() - VAD_RANGE_DB)
+    return db > threshold
+
+
+def speech_windows(wav, sr=MODEL_SAMPLE_RATE, window_sec=WINDOW_SEC, hop_sec=HOP_SEC):
+    """
+    [(start, end)] sample ranges of the fixed-length windows of a mono [T]
+    tensor that are mostly speech. A clip shorter than one window is a
+    single window.
+    """
+    voiced = speech_frames(wav, sr)
+    if not len(voiced):
+        return []
+    frame = max(1, int(VAD_FRAME_SEC * sr))
+    window, hop = int(window_sec * sr), int(hop_sec * sr)
+    total = wav.shape[-1]
+    starts = list(range(0, max(1, total - window + 1), hop))
+    if total > window and starts[-1] + window < total:
+        starts.append(total - window)  # cover the tail
+    out = []
+    for s in starts:
+        e = min(s + window, total)
+        frames = voiced[s // frame:max(s // frame + 1, e // frame)]
+        if frames.float().mean() >= MIN_VOICED:
+            out.append((s, e))
+    return out
+
+
+# ─── Per-chunk window embeddings ──────────────────────────────────────────────
+
+def _windows_path(meeting_dir, chunk_name):
+    return Path(meeting_dir) / WINDOWS_DIR / f"{chunk_name}.pt"
+
+
+def _stamp(path):
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "model_version": model_version()}
+
+
+def load_windows(meeting_dir, chunk_name):
+    """
+    {"starts", "ends" (seconds into the chunk), "embs" [W, D]} for a chunk,
+    or None if it has not been embedded or has changed since.
+    """
+    meeting_dir = Path(meeting_dir)
+    try:
+        stamp = _stamp(meeting_dir / chunk_name)
+        data = torch.load(_windows_path(meeting_dir, chunk_name), map_location="cpu")
+    except (OSError, RuntimeError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("stamp") != stamp:
+        return None
+    return data
+
+
+_chunk_locks = {}
+_chunk_locks_guard = threading.Lock()
+
+
+def _lock_for(path):
+    with _chunk_locks_guard:
+        return _chunk_locks.setdefault(str(Path(path).resolve()), threading.Lock())
+
+
+def embed_chunk(meeting_dir, chunk_name):
+    """
+    Runs VAD over one chunk and stores the embeddings of its speech windows
+    under windows/. A no-op if they are already stored and current; the
+    background worker and a summary request never embed the same chunk
+    twice.
+    """
+    meeting_dir = Path(meeting_dir)
+    path = meeting_dir / chunk_name
+    with _lock_for(path):
+        data = load_windows(meeting_dir, chunk_name)
+        if data is not None:
+            return data
+
+        stamp = _stamp(path)
+        signal, sr = torchaudio.load(str(path))
+        wav = prepare_waveform(signal, sr) if signal.numel() else torch.zeros(0)
+        windows = speech_windows(wav)
+        embs = torch.zeros(len(windows), MODEL_EMBEDDING_DIM)
+        for i in range(0, len(windows), BATCH_SIZE):
+            batch = windows[i:i + BATCH_SIZE]
+            # Windows never repeat, so keep them out of the clip cache
+            embs[i:i + len(batch)] = embed_waveforms([wav[s:e] for s, e in batch], use_cache=False)
+        data = {
+            "stamp": stamp,
+            "starts": torch.tensor([s / MODEL_SAMPLE_RATE for s, _ in windows]),
+            "ends": torch.tensor([e / MODEL_SAMPLE_RATE for _, e in windows]),
+            "embs": embs,
+        }
+
+        out = _windows_path(meeting_dir, chunk_name)
+        out.parent.mkdir(exist_ok=True)
+        tmp = out.with_suffix(f".{threading.get_ident()}.tmp")
+        torch.save(data, tmp)
+        os.replace(tmp, out)
+        return data
+
+
+def meeting_windows(meeting_dir, index=None):
+    """
+    Window embeddings for the whole meeting in meeting time: (starts [W],
+    ends [W], embs [W, D]). Chunks the background worker has not reached yet
+    are embedded now.
+    """
+    index = index or meeting_store.load_index(meeting_dir)
+    sr = index["sample_rate"]
+    starts, ends, embs = [], [], []
+    for c in index["chunks"]:
+        data = embed_chunk(meeting_dir, c["file"])
+        offset = c["offset"] / sr
+        starts.append(data["starts"] + offset)
+        ends.append(data["ends"] + offset)
+        embs.append(data["embs"])
+    if not embs:
+        return torch.zeros(0), torch.zeros(0), torch.zeros(0, MODEL_EMBEDDING_DIM)
+    return torch.cat(starts), torch.cat(ends), torch.cat(embs)
+
+
+def pool_windows(starts, ends, embs, segments, min_overlap=0.5):
+    """
+    [S, D] mean of the L2-normalized windows that lie at least `min_overlap`
+    inside each segment, and a bool [S] mask of segments that had any.
+    """
+    if not len(segments) or not len(embs):
+        return torch.zeros(len(segments), embs.shape[-1]), torch.zeros(len(segments), dtype=torch.bool)
+    seg_start = torch.tensor([s["start"] for s in segments]).unsqueeze(1)
+    seg_end = torch.tensor([s["end"] for s in segments]).unsqueeze(1)
+    overlap = (torch.minimum(ends, seg_end) - torch.maximum(starts, seg_start)).clamp(min=0)
+    weights = (overlap >= min_overlap * (ends - starts)).float()  # [S, W]
+    counts = weights.sum(dim=1)
+    found = counts > 0
+    pooled = weights @ F.normalize(embs, dim=-1) / counts.clamp(min=1).unsqueeze(1)
+    return pooled, found
+
+
+# ─── Background worker ────────────────────────────────────────────────────────
+
+class IngestQueue:
+    """
+    One daemon thread that embeds chunks as they are saved, so a summary
+    only has to align the transcript with stored windows. Chunks already
+    queued are not queued twice.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def enqueue(self, meeting_dir, chunk_name):
+        key = (str(meeting_dir), chunk_name)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chunk-ingest", daemon=True)
+                self._thread.start()
+        self._queue.put(key)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            with self._lock:
+                # A chunk re-saved from here on is queued again
+                self._pending.discard(key)
+            try:
+                embed_chunk(*key)
+            except Exception:
+                print(f"⚠️  Background embedding failed for {key[1]}:")
+                traceback.print_exc()
+
+
+INGEST_QUEUE = IngestQueue()
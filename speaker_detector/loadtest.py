@@ -0,0 +1,478 @@
+import io
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+import torch
+
+from speaker_detector.stub_transcriber import make_handler
+
+SERVER_PATH = Path(__file__).resolve().parent.parent / "server.py"
+SAMPLE_RATE = 16000
+ENDPOINTS = ("identify", "enroll", "summary")
+DEFAULT_MIX = "identify=8,enroll=1,summary=1"
+PATTERNS = ("closed", "poisson", "step")
+HISTOGRAM_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+REQUEST_TIMEOUT = 600
+
+
+# ─── Synthetic audio ──────────────────────────────────────────────────────────
+
+def synth_voice(seconds, speaker, sr=SAMPLE_RATE, seed=0):
+    """
+    Voice-like mono [T] signal: a vibrato glottal tone whose harmonics are
+    shaped by two formants, gated by a ~4 Hz syllable envelope. Pitch and
+    formants are fixed per `speaker`, so clips of one speaker embed close
+    together and different speakers apart.
+    """
+    voice = random.Random(speaker)
+    f0 = voice.uniform(90, 240)
+    f1, f2 = voice.uniform(350, 850), voice.uniform(900, 2400)
+    g = torch.Generator().manual_seed(speaker * 1000 + seed)
+
+    t = torch.arange(int(seconds * sr)) / sr
+    pitch = f0 * (1 + 0.03 * torch.sin(2 * math.pi * 5 * t + torch.rand(1, generator=g) * 6))
+    phase = 2 * math.pi * torch.cumsum(pitch, 0) / sr
+    wav = torch.zeros_like(t)
+    for k in range(1, 16):
+        freq = k * f0
+        if freq > sr / 2 - 500:
+            break
+        gain = math.exp(-((freq - f1) / 300) ** 2) + 0.6 * math.exp(-((freq - f2) / 500) ** 2) + 0.05
+        wav += gain / k ** 0.5 * torch.sin(k * phase)
+    syllables = 0.5 * (1 + torch.sin(2 * math.pi * 4 * t + torch.rand(1, generator=g) * 6)).clamp(min=0) ** 2
+    wav = wav * syllables + 0.01 * torch.randn(len(t), generator=g)
+    return 0.3 * wav / wav.abs().max()
+
+
+def encode_clip(wav, fmt="wav", sr=SAMPLE_RATE):
+    """16-bit WAV bytes, or WebM/Opus (as browsers upload) via ffmpeg."""
+    pcm = (wav.clamp(-1, 1) * 32767).to(torch.int16).numpy().tobytes()
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm)
+    if fmt == "wav":
+        return buf.getvalue()
+    if fmt != "opus":
+        raise ValueError(f"unknown clip format {fmt!r}")
+    proc = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+         "-c:a", "libopus", "-b:a", "32k", "-f", "webm", "pipe:1"],
+        input=buf.getvalue(), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not encode Opus: {proc.stderr.decode(errors='ignore')}")
+    return proc.stdout
+
+
+# ─── Local server ─────────────────────────────────────────────────────────────
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    """
+    Runs server.py in a child process against a throwaway storage tree, with
+    transcription pointed at an in-process stub, so a load test needs no
+    network and leaves the real storage untouched. Use as a context
+    manager; `url` is the server's base URL once it reports ready.
+    """
+
+    def __init__(self, transcriber=None, env=None, ready_timeout=600, keep_storage=False):
+        self.transcriber = transcriber or {"latency": 0.2, "realtime_factor": 0.01}
+        self.env = env or {}
+        self.ready_timeout = ready_timeout
+        self.keep_storage = keep_storage
+        self.url = None
+
+    def __enter__(self):
+        self.workdir = Path(tempfile.mkdtemp(prefix="speaker-detector-load-"))
+        self.stub = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(**self.transcriber))
+        threading.Thread(target=self.stub.serve_forever, name="stub-transcriber", daemon=True).start()
+
+        port = _free_port()
+        self.shm_prefix = f"sd-load-{os.getpid()}"
+        env = dict(
+            os.environ,
+            PORT=str(port),
+            SPEAKER_DETECTOR_STORAGE=str(self.workdir / "storage"),
+            TRANSCRIBE_URL=f"http://127.0.0.1:{self.stub.server_port}/v1/audio/transcriptions",
+            SPEAKER_INDEX_SHM=self.shm_prefix,
+            HF_HUB_OFFLINE="1",  # the model must already be in ./model
+            **self.env,
+        )
+        self.log_path = self.workdir / "server.log"
+        self._log = open(self.log_path, "wb")
+        self.proc = subprocess.Popen(
+            [sys.executable, str(SERVER_PATH)], cwd=str(SERVER_PATH.parent), env=env,
+            stdout=self._log, stderr=subprocess.STDOUT,
+        )
+        self.url = f"http://127.0.0.1:{port}"
+        try:
+            self._wait_ready()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"server.py exited with {self.proc.returncode}:\n{self.log_tail()}")
+            try:
+                r = requests.get(f"{self.url}/readyz", timeout=2)
+                if r.status_code == 200:
+                    self.startup = r.json()
+                    return
+                if r.json().get("error"):
+                    raise RuntimeError(f"server warm-up failed: {r.json()['error']}")
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        raise TimeoutError(f"server not ready after {self.ready_timeout}s:\n{self.log_tail()}")
+
+    def log_tail(self, lines=30):
+        try:
+            return "\n".join(self.log_path.read_text(errors="ignore").splitlines()[-lines:])
+        except OSError:
+            return ""
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self._log.close()
+        self.stub.shutdown()
+        self.stub.server_close()
+        _unlink_shared_index(self.shm_prefix)
+        if not self.keep_storage:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def _unlink_shared_index(prefix):
+    # The server's speaker-index segments outlive it by design
+    from speaker_detector.shared_index import SharedSpeakerIndex, _unlink
+    try:
+        generation = SharedSpeakerIndex(prefix).generation
+    except OSError:
+        return
+    _unlink(f"{prefix}-{generation}")
+    _unlink(f"{prefix}-ctl")
+
+
+# ─── Workload ─────────────────────────────────────────────────────────────────
+
+def parse_mix(text):
+    """"identify=8,enroll=1" → {"identify": 8.0, "enroll": 1.0}."""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint {name!r} (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Workload:
+    """
+    Seeds the server with `speakers` enrolled voices and `meetings` recorded
+    meetings, then issues requests against them. Summaries are served
+    from the per-meeting cache after their first call, like in production.
+    """
+
+    def __init__(self, url, speakers=4, meetings=2, fmt="wav", clip_sec=3.0,
+                 chunk_sec=10.0, chunks=3, seed=0):
+        self.url = url
+        self.fmt = fmt
+        self.speakers = speakers
+        self.meetings = [f"lt-meeting-{i}" for i in range(meetings)]
+        self.rng = random.Random(seed)
+        self._local = threading.local()
+        self._enrolls = 0
+        self._lock = threading.Lock()
+        ext = "webm" if fmt == "opus" else "wav"
+        self.filename = f"clip.{ext}"
+        # A few pre-encoded clips per speaker; encoding is not what's measured
+        self.clips = [[encode_clip(synth_voice(clip_sec, s, seed=k), fmt) for k in range(3)]
+                      for s in range(speakers)]
+        self._chunk_plan = (chunk_sec, chunks, ext)
+
+    @property
+    def session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def seed(self):
+        for s in range(self.speakers):
+            for clip in self.clips[s][:2]:
+                self._check(self.session.post(f"{self.url}/api/enroll/lt-speaker-{s}",
+                                              files={"file": (self.filename, clip)}, timeout=REQUEST_TIMEOUT))
+        chunk_sec, chunks, ext = self._chunk_plan
+        for m, meeting in enumerate(self.meetings):
+            for c in range(chunks):
+                # Turns of ~2.5 s rotating through the roster
+                turns = [synth_voice(2.5, (m + c + k) % self.speakers, seed=100 + k)
+                         for k in range(int(chunk_sec / 2.5))]
+                data = encode_clip(torch.cat(turns), self.fmt)
+                self._check(self.session.post(f"{self.url}/api/save-chunk",
+                                              data={"meeting_id": meeting},
+                                              files={"file": (f"chunk_{c:03d}.{ext}", data)},
+                                              timeout=REQUEST_TIMEOUT))
+
+    @staticmethod
+    def _check(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"seeding failed: {response.status_code} {response.text[:200]}")
+
+    def request(self, endpoint):
+        """Sends one request; returns the HTTP status."""
+        if endpoint == "identify":
+            clip = self.rng.choice(self.rng.choice(self.clips))
+            r = self.session.post(f"{self.url}/api/identify",
+                                  files={"file": (self.filename, clip)}, timeout=REQUEST_TIMEOUT)
+        elif endpoint == "enroll":
+            with self._lock:
+                self._enrolls += 1
+                n = self._enrolls
+            clip = self.rng.choice(self.clips[n % self.speakers])
+            r = self.session.post(f"{self.url}/api/enroll/lt-enroll-{n % self.speakers}",
+                                  files={"file": (self.filename, clip)}, timeout=REQUEST_TIMEOUT)
+        else:
+            r = self.session.get(f"{self.url}/api/generate-summary/{self.rng.choice(self.meetings)}",
+                                 timeout=REQUEST_TIMEOUT)
+        return r.status_code
+
+
+# ─── Drivers ──────────────────────────────────────────────────────────────────
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = []  # (endpoint, issued_at, latency_sec, status or error string)
+
+    def call(self, workload, endpoint, issued_at):
+        try:
+            status = workload.request(endpoint)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        # Open-loop latency counts from the scheduled arrival, so time spent
+        # waiting for a free client is not hidden (no coordinated omission)
+        with self._lock:
+            self.records.append((endpoint, issued_at, time.perf_counter() - issued_at, status))
+
+
+def _pick(rng, mix):
+    return rng.choices(list(mix), weights=list(mix.values()))[0]
+
+
+def run_closed(workload, mix, concurrency, duration, recorder):
+    """`concurrency` clients, each sending its next request as soon as the last returns."""
+    deadline = time.perf_counter() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            recorder.call(workload, _pick(rng, mix), time.perf_counter())
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run_poisson(workload, mix, rate, duration, recorder, concurrency, seed=0):
+    """Open loop: Poisson arrivals at `rate`/s served by up to `concurrency` clients."""
+    rng = random.Random(seed)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        next_at = start
+        while True:
+            next_at += rng.expovariate(rate)
+            if next_at - start >= duration:
+                break
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+            pool.submit(recorder.call, workload, _pick(rng, mix), next_at)
+
+
+# ─── Reporting ────────────────────────────────────────────────────────────────
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def summarize(records, elapsed):
+    """Per-endpoint counts, error rate, achieved RPS, latency percentiles (ms) and histogram."""
+    out = {}
+    for endpoint in sorted({r[0] for r in records}):
+        rows = [r for r in records if r[0] == endpoint]
+        ok = sorted(r[2] * 1e3 for r in rows if isinstance(r[3], int) and r[3] < 400)
+        statuses = {}
+        for r in rows:
+            statuses[str(r[3])] = statuses.get(str(r[3]), 0) + 1
+        histogram = {f"<={b}ms": 0 for b in HISTOGRAM_MS}
+        histogram[f">{HISTOGRAM_MS[-1]}ms"] = 0
+        for ms in ok:
+            label = next((f"<={b}ms" for b in HISTOGRAM_MS if ms <= b), f">{HISTOGRAM_MS[-1]}ms")
+            histogram[label] += 1
+        out[endpoint] = {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "error_rate": round((len(rows) - len(ok)) / len(rows), 4),
+            "statuses": statuses,
+            "rps": round(len(ok) / elapsed, 2) if elapsed else None,
+            **{f"p{int(q * 100)}_ms": round(_percentile(ok, q), 1) if ok else None for q in (0.5, 0.95, 0.99)},
+            "max_ms": round(ok[-1], 1) if ok else None,
+            "histogram": histogram,
+        }
+    return out
+
+
+def print_summary(summary, title):
+    print(f"\n📊 {title}")
+    print(f"{'endpoint':<10} {'reqs':>6} {'err %':>6} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    fmt = lambda v: f"{v:>9.1f}" if v is not None else f"{'-':>9}"
+    for name, s in summary.items():
+        print(f"{name:<10} {s['requests']:>6} {s['error_rate']:>6.1%} {s['rps'] or 0:>7.2f} "
+              f"{fmt(s['p50_ms'])} {fmt(s['p95_ms'])} {fmt(s['p99_ms'])} {fmt(s['max_ms'])}")
+    for name, s in summary.items():
+        total = max(1, sum(s["histogram"].values()))
+        print(f"\n  {name} latency histogram")
+        for label, n in s["histogram"].items():
+            if n:
+                print(f"  {label:>10} {n:>6} {'█' * max(1, round(40 * n / total))}")
+        errors = {k: v for k, v in s["statuses"].items() if not (k.isdigit() and int(k) < 400)}
+        if errors:
+            print(f"  errors: {errors}")
+
+
+def _stage_metrics(url, reset=False):
+    try:
+        r = requests.get(f"{url}/api/stage-metrics", params={"reset": int(reset)}, timeout=10)
+        return r.json() if r.status_code == 200 else None
+    except requests.RequestException:
+        return None
+
+
+def _print_stages(metrics):
+    if not metrics:
+        print("\n(server stage metrics unavailable)")
+        return
+    print(f"\n🔧 Server stages (peak RSS {metrics.get('peak_rss_mb')} MB, "
+          f"ingest queued {metrics.get('ingest_queued')})")
+    print(f"{'stage':<12} {'calls':>7} {'mean ms':>9} {'max ms':>9} {'total ms':>10}")
+    for name, s in sorted(metrics["stages"].items(), key=lambda kv: -kv[1]["total_ms"]):
+        print(f"{name:<12} {s['calls']:>7} {s['mean_ms']:>9.1f} {s['max_ms']:>9.1f} {s['total_ms']:>10.0f}")
+
+
+def _meets_slo(summary, slo_ms, max_error_rate):
+    return all(
+        s["error_rate"] <= max_error_rate and s["p95_ms"] is not None and s["p95_ms"] <= slo_ms
+        for s in summary.values()
+    )
+
+
+def run_load_test(url=None, mix=DEFAULT_MIX, pattern="closed", concurrency=8, duration=30.0,
+                  rate=5.0, steps=5, slo_ms=2000.0, max_error_rate=0.01, fmt="wav",
+                  speakers=4, meetings=2, out_path=None, keep_storage=False):
+    """
+    Load-tests /api/identify, /api/enroll/<id> and /api/generate-summary/<id>.
+
+    With no `url`, starts server.py locally (LocalServer) on a throwaway
+    storage tree with a stub transcriber, seeds speakers and meetings, and
+    drives it with `pattern`:
+
+    - "closed": `concurrency` back-to-back clients for `duration` seconds;
+    - "poisson": open-loop Poisson arrivals at `rate`/s;
+    - "step": Poisson at rate, 2×rate … steps×rate, `duration` each; the
+      highest step whose p95 stays under `slo_ms` with at most
+      `max_error_rate` errors is reported as the sustainable RPS.
+
+    Prints latency tables, histograms and the server's stage metrics, and
+    returns (and optionally writes to `out_path`) the full report.
+    """
+    mix = parse_mix(mix) if isinstance(mix, str) else mix
+    if pattern not in PATTERNS:
+        raise ValueError(f"unknown pattern {pattern!r} (choose from {', '.join(PATTERNS)})")
+
+    server = None if url else LocalServer(keep_storage=keep_storage)
+    if server:
+        print("🚀 Starting server.py with a stub transcriber…")
+        server.__enter__()
+        url = server.url
+        print(f"   ready at {url} (warm-up {server.startup['phases_ms'].get('total', '?')} ms)")
+    try:
+        workload = Workload(url, speakers=speakers, meetings=meetings, fmt=fmt)
+        print(f"🌱 Seeding {speakers} speakers and {meetings} meetings ({fmt})…")
+        workload.seed()
+        _stage_metrics(url, reset=True)
+
+        report = {"url": url, "pattern": pattern, "mix": mix, "format": fmt,
+                  "concurrency": concurrency, "runs": []}
+        if pattern == "closed":
+            plan = [("closed", None)]
+        elif pattern == "poisson":
+            plan = [("poisson", rate)]
+        else:
+            plan = [("poisson", rate * (i + 1)) for i in range(steps)]
+
+        for kind, offered in plan:
+            recorder = Recorder()
+            start = time.perf_counter()
+            if kind == "closed":
+                run_closed(workload, mix, concurrency, duration, recorder)
+            else:
+                run_poisson(workload, mix, offered, duration, recorder, concurrency)
+            elapsed = time.perf_counter() - start
+            summary = summarize(recorder.records, elapsed)
+            title = (f"closed loop, {concurrency} clients, {elapsed:.0f}s" if offered is None
+                     else f"Poisson {offered:g} req/s offered, ≤{concurrency} in flight, {elapsed:.0f}s")
+            print_summary(summary, title)
+            stages = _stage_metrics(url, reset=True)
+            _print_stages(stages)
+            report["runs"].append({"offered_rps": offered, "elapsed_sec": round(elapsed, 2),
+                                   "summary": summary, "server_stages": stages,
+                                   "meets_slo": _meets_slo(summary, slo_ms, max_error_rate)})
+
+        if pattern == "step":
+            passing = [r["offered_rps"] for r in report["runs"] if r["meets_slo"]]
+            report["max_sustainable_rps"] = max(passing) if passing else None
+            print(f"\n🏁 Max sustainable rate (p95 ≤ {slo_ms:g} ms, errors ≤ {max_error_rate:.0%}): "
+                  f"{report['max_sustainable_rps'] or 'below the first step'}"
+                  f"{' req/s' if passing else ''}")
+        if server:
+            report["server_startup"] = server.startup
+    finally:
+        if server:
+            server.__exit__(None, None, None)
+
+    if out_path:
+        Path(out_path).write_text(json.dumps(report, indent=2))
+        print(f"\n💾 Report → {out_path}")
+    return report
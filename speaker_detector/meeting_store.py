@@ -0,0 +1,153 @@
+import bisect
+import json
+import os
+import threading
+from pathlib import Path
+
+import torch
+import torchaudio
+
+from speaker_detector.audio_info import audio_info
+
+INDEX_NAME = "index.json"
+CHUNK_FORMAT = ".flac"  # lossless, ~2-3× smaller than PCM WAV, seekable
+CHUNK_SUFFIXES = (".flac", ".wav")
+SAMPLE_RATE = 16000
+
+_index_locks = {}
+_index_locks_guard = threading.Lock()
+
+
+def _lock_for(meeting_dir):
+    key = str(Path(meeting_dir).resolve())
+    with _index_locks_guard:
+        return _index_locks.setdefault(key, threading.RLock())
+
+
+def _is_chunk(path):
+    # Merged/combined files from older summary runs are not chunks
+    return (
+        path.suffix in CHUNK_SUFFIXES
+        and not path.stem.endswith("_merged")
+        and path.stem != "combined"
+    )
+
+
+def _write_index(meeting_dir, index):
+    path = Path(meeting_dir) / INDEX_NAME
+    tmp = path.with_name(f"{INDEX_NAME}.{threading.get_ident()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, path)
+
+
+def _relayout(chunks):
+    """Recomputes each chunk's frame offset on the meeting timeline."""
+    offset = 0
+    for c in chunks:
+        c["offset"] = offset
+        offset += c["frames"]
+    return chunks
+
+
+def rebuild_index(meeting_dir):
+    """Builds the seek index from the chunk files on disk (sorted by name)."""
+    meeting_dir = Path(meeting_dir)
+    chunks = []
+    for path in sorted(meeting_dir.iterdir()):
+        if not _is_chunk(path):
+            continue
+        try:
+            frames, sr = audio_info(path)
+        except Exception:
+            continue
+        chunks.append({"file": path.name, "frames": frames, "sample_rate": sr})
+    index = {"sample_rate": chunks[0]["sample_rate"] if chunks else SAMPLE_RATE,
+             "chunks": _relayout(chunks)}
+    with _lock_for(meeting_dir):
+        _write_index(meeting_dir, index)
+    return index
+
+
+def load_index(meeting_dir):
+    """
+    Returns the meeting's seek index:
+    {"sample_rate": int, "chunks": [{"file", "frames", "offset", "sample_rate"}]}
+    where `offset` is the chunk's first frame on the meeting timeline.
+    """
+    path = Path(meeting_dir) / INDEX_NAME
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return rebuild_index(meeting_dir)
+
+
+def append_chunk(meeting_dir, chunk_path):
+    """Adds (or replaces) a chunk at the end of the meeting timeline."""
+    meeting_dir = Path(meeting_dir)
+    chunk_path = Path(chunk_path)
+    frames, sr = audio_info(chunk_path)
+    with _lock_for(meeting_dir):
+        index = load_index(meeting_dir)
+        chunks = [c for c in index["chunks"] if c["file"] != chunk_path.name]
+        if not chunks:
+            index["sample_rate"] = sr
+        chunks.append({"file": chunk_path.name, "frames": frames, "sample_rate": sr})
+        index["chunks"] = _relayout(chunks)
+        _write_index(meeting_dir, index)
+    return index
+
+
+def select_chunks(index, keep):
+    """
+    Returns a copy of the index holding only the chunks for which
+    `keep(chunk)` is true, laid end to end on a new timeline.
+    """
+    chunks = [dict(c) for c in index["chunks"] if keep(c)]
+    return dict(index, chunks=_relayout(chunks))
+
+
+def duration(index):
+    chunks = index["chunks"]
+    if not chunks:
+        return 0.0
+    return (chunks[-1]["offset"] + chunks[-1]["frames"]) / index["sample_rate"]
+
+
+def read_range(meeting_dir, start=0.0, end=None, index=None):
+    """
+    Decodes only the audio between `start` and `end` seconds (end of
+    meeting if None). Chunks outside the range are never opened; inside a
+    chunk, torchaudio seeks straight to the first needed frame. Returns
+    ([channels, frames], sample_rate).
+    """
+    meeting_dir = Path(meeting_dir)
+    index = index or load_index(meeting_dir)
+    chunks = index["chunks"]
+    sr = index["sample_rate"]
+    total = chunks[-1]["offset"] + chunks[-1]["frames"] if chunks else 0
+    start_f = max(0, int(start * sr))
+    end_f = total if end is None else min(total, int(end * sr))
+
+    pieces = []
+    i = max(0, bisect.bisect_right([c["offset"] for c in chunks], start_f) - 1)
+    while i < len(chunks) and chunks[i]["offset"] < end_f:
+        c = chunks[i]
+        if c["sample_rate"] != sr:
+            raise ValueError(f"{c['file']} is {c['sample_rate']} Hz, meeting is {sr} Hz")
+        lo = max(start_f - c["offset"], 0)
+        hi = min(end_f - c["offset"], c["frames"])
+        if hi > lo:
+            wav, _ = torchaudio.load(str(meeting_dir / c["file"]), frame_offset=lo, num_frames=hi - lo)
+            pieces.append(wav)
+        i += 1
+    if not pieces:
+        return torch.zeros(1, 0), sr
+    return torch.cat(pieces, dim=1), sr
+
+
+def chunk_paths(meeting_dir, index=None):
+    index = index or load_index(meeting_dir)
+    return [Path(meeting_dir) / c["file"] for c in index["chunks"]]
+
@@ -0,0 +1,69 @@
+import numpy as np
+
+P_TARGET = 0.01    # prior of a target trial in the detection cost
+C_MISS = 1.0
+C_FA = 1.0
+DET_POINTS = 200   # points kept from the DET curve in the report
+
+
+def det_curve(scores, labels):
+    """
+    Miss and false-alarm rates for every distinct threshold → (fpr, fnr,
+    thresholds), where a trial is accepted when its score is above the
+    threshold. The first point (threshold -inf) accepts everything. Plot
+    on normal-deviate axes for the usual DET chart.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.int64)
+    order = np.argsort(scores, kind="mergesort")
+    scores, labels = scores[order], labels[order]
+    n_target = labels.sum()
+    n_nontarget = len(labels) - n_target
+    if not n_target or not n_nontarget:
+        raise ValueError("need both target and non-target trials")
+
+    # Ties share one threshold: keep the last position of each run
+    last = np.r_[scores[1:] != scores[:-1], True]
+    fnr = np.r_[0.0, np.cumsum(labels)[last] / n_target]
+    fpr = np.r_[1.0, 1.0 - np.cumsum(1 - labels)[last] / n_nontarget]
+    thresholds = np.r_[-np.inf, scores[last]]
+    return fpr, fnr, thresholds
+
+
+def compute_eer(fpr, fnr, thresholds):
+    """Equal error rate (linear interpolation at the fpr/fnr crossing) and its threshold."""
+    i = int(np.argmax(fnr >= fpr))
+    if i == 0:
+        return float(fpr[0]), float(thresholds[0])
+    d0, d1 = fpr[i - 1] - fnr[i - 1], fnr[i] - fpr[i]
+    w = d0 / (d0 + d1) if d0 + d1 else 0.0
+    eer = fnr[i - 1] + w * (fnr[i] - fnr[i - 1])
+    return float(eer), float(thresholds[i])
+
+
+def compute_min_dcf(fpr, fnr, thresholds, p_target=P_TARGET, c_miss=C_MISS, c_fa=C_FA):
+    """Minimum normalised detection cost over all thresholds, and that threshold."""
+    dcf = c_miss * p_target * fnr + c_fa * (1 - p_target) * fpr
+    i = int(np.argmin(dcf))
+    return float(dcf[i] / min(c_miss * p_target, c_fa * (1 - p_target))), float(thresholds[i])
+
+
+def _det_points(fpr, fnr, thresholds, n=DET_POINTS):
+    keep = np.unique(np.linspace(0, len(fpr) - 1, n).round().astype(int))
+    return [{"fpr": round(float(fpr[i]), 6), "fnr": round(float(fnr[i]), 6),
+             "threshold": round(float(thresholds[i]), 4)} for i in keep]
+
+
+def metrics(scores, labels, p_target=P_TARGET):
+    """EER, minDCF (with their thresholds) and downsampled DET points."""
+    fpr, fnr, thresholds = det_curve(scores, labels)
+    eer, eer_threshold = compute_eer(fpr, fnr, thresholds)
+    min_dcf, dcf_threshold = compute_min_dcf(fpr, fnr, thresholds, p_target=p_target)
+    return {
+        "eer": round(eer, 5),
+        "eer_threshold": round(eer_threshold, 4),
+        "min_dcf": round(min_dcf, 5),
+        "min_dcf_threshold": round(dcf_threshold, 4),
+        "p_target": p_target,
+        "det": _det_points(fpr, fnr, thresholds),
+    }
@@ -0,0 +1,211 @@
+import queue
+import threading
+import time
+
+QUEUE_SIZE = 4          # items buffered between two stages
+DECODE_WORKERS = 2
+FEATURE_WORKERS = 2
+EMBED_BATCH = 16
+BLOCK_SEC = 60.0        # audio decoded per item
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, stage, exc):
+        self.stage = stage
+        self.exc = exc
+
+
+class Stage:
+    """
+    One pipeline step run by `workers` threads.
+
+    `fn(payload) -> payload` by default; with `batch_size`, `fn([payload,
+    ...]) -> [payload, ...]` on up to that many queued items at once; with
+    `fan_out`, `fn(payload) -> [payload, ...]`, each sent on separately.
+    A stateful `fn` may define `reset()`, which is called before every run.
+    """
+
+    def __init__(self, name, fn, workers=1, batch_size=None, fan_out=False):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.fan_out = fan_out
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        if hasattr(self.fn, "reset"):
+            self.fn.reset()
+        self.busy = 0.0      # seconds inside fn, summed over workers
+        self.starved = 0.0   # waiting for input
+        self.blocked = 0.0   # waiting for room downstream
+        self.calls = 0
+        self.items_in = 0
+        self.items_out = 0
+
+    def _account(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                setattr(self, key, getattr(self, key) + value)
+
+
+class Pipeline:
+    """
+    Threads connected by bounded queues, so each stage works on the next
+    item while the one after it is still busy (e.g. decoding block n+1
+    while block n is in the model). Backpressure from the bounded queues
+    keeps memory flat. `run()` returns the outputs in input order
+    (fanned-out items in emission order), and `stats()` reports each
+    stage's utilization.
+    """
+
+    def __init__(self, stages, queue_size=QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.wall = 0.0
+
+    def run(self, items):
+        for stage in self.stages:
+            stage.reset()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages] + [queue.Queue()]
+        stop = threading.Event()
+        remaining = [s.workers for s in self.stages]
+        remaining_lock = threading.Lock()
+
+        def put(q, item, stage=None):
+            start = time.perf_counter()
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if stage is not None:
+                stage._account(blocked=time.perf_counter() - start)
+
+        def get(q, stage):
+            start = time.perf_counter()
+            while not stop.is_set():
+                try:
+                    item = q.get(timeout=0.1)
+                    stage._account(starved=time.perf_counter() - start)
+                    return item
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def feed():
+            try:
+                for i, item in enumerate(items):
+                    put(queues[0], ((i,), item))
+            except BaseException as e:
+                put(queues[-1], _Failed("input", e))
+                stop.set()
+            for _ in range(self.stages[0].workers):
+                put(queues[0], _DONE)
+
+        def work(k):
+            stage, inbox, outbox = self.stages[k], queues[k], queues[k + 1]
+            finished = False
+            try:
+                while not finished:
+                    item = get(inbox, stage)
+                    if item is _DONE:
+                        break
+                    batch = [item]
+                    while stage.batch_size and len(batch) < stage.batch_size:
+                        try:
+                            more = inbox.get_nowait()
+                        except queue.Empty:
+                            break
+                        if more is _DONE:
+                            finished = True
+                            break
+                        batch.append(more)
+
+                    start = time.perf_counter()
+                    if stage.batch_size:
+                        outputs = list(zip([key for key, _ in batch], stage.fn([p for _, p in batch])))
+                    elif stage.fan_out:
+                        key, payload = item
+                        outputs = [(key + (j,), out) for j, out in enumerate(stage.fn(payload))]
+                    else:
+                        outputs = [(item[0], stage.fn(item[1]))]
+                    stage._account(busy=time.perf_counter() - start, calls=1,
+                                   items_in=len(batch), items_out=len(outputs))
+                    for out in outputs:
+                        put(outbox, out, stage)
+            except BaseException as e:
+                put(queues[-1], _Failed(stage.name, e))
+                stop.set()
+            finally:
+                with remaining_lock:
+                    remaining[k] -= 1
+                    last = remaining[k] == 0
+                if last:
+                    downstream = self.stages[k + 1].workers if k + 1 < len(self.stages) else 1
+                    for _ in range(downstream):
+                        put(outbox, _DONE)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=feed, name="pipeline-input", daemon=True)]
+        for k, stage in enumerate(self.stages):
+            threads += [threading.Thread(target=work, args=(k,), name=f"pipeline-{stage.name}-{w}",
+                                         daemon=True)
+                        for w in range(stage.workers)]
+        for t in threads:
+            t.start()
+
+        results, failure = [], None
+        while True:
+            try:
+                item = queues[-1].get(timeout=0.1)
+            except queue.Empty:
+                # After a failure the end-of-stream marker may never come
+                if stop.is_set() and not any(t.is_alive() for t in threads):
+                    break
+                continue
+            if item is _DONE:
+                break
+            if isinstance(item, _Failed):
+                failure = failure or item
+                continue
+            results.append(item)
+        stop.set()
+        for t in threads:
+            t.join()
+        self.wall = time.perf_counter() - start
+        if failure is not None:
+            raise RuntimeError(f"pipeline stage {failure.stage!r} failed: {failure.exc}") from failure.exc
+        results.sort(key=lambda kv: kv[0])
+        return [payload for _, payload in results]
+
+    def stats(self):
+        """Per stage: workers, calls, items in/out, busy/starved/blocked seconds and utilization."""
+        return {
+            "wall_sec": round(self.wall, 3),
+            "stages": {
+                s.name: {
+                    "workers": s.workers,
+                    "calls": s.calls,
+                    "items_in": s.items_in,
+                    "items_out": s.items_out,
+                    "busy_sec": round(s.busy, 3),
+                    "starved_sec": round(s.starved, 3),
+                    "blocked_sec": round(s.blocked, 3),
+                    "utilization": round(s.busy / (self.wall * s.workers), 3) if self.wall else 0.0,
+                }
+                for s in self.stages
+            },
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"🔁 Pipeline: {stats['wall_sec']:.2f}s wall")
+        print(f"{'stage':<10} {'workers':>7} {'items':>11} {'busy s':>8} {'starved s':>9} {'blocked s':>9} {'util':>6}")
+        for name, s in stats["stages"].items():
+            print(f"{name:<10} {s['workers']:>7} {s['items_in']:>5}→{s['items_out']:<5} {s['busy_sec']:>8.2f} "
+                  f"{s['starved_sec']:>9.2f} {s['blocked_sec']:>9.2f} {s['utilization']:>6.0%}")
@@ -0,0 +1,118 @@
+import functools
+import time
+
+import torch
+import torch.nn.functional as F
+
+PRECISIONS = ("fp32", "bf16")
+# Layers whose statistics lose too much in 8 mantissa bits; they run in fp32
+# even inside the bf16 encoder
+FP32_MODULES = ("BatchNorm1d", "AttentiveStatisticsPooling")
+MAX_SCORE_DRIFT = 0.02      # largest |bf16 - fp32| cosine score on the roster
+MIN_TOP1_AGREEMENT = 0.98   # fraction of clips whose best speaker is unchanged
+
+
+def bf16_supported():
+    """True if this CPU has native bf16 matmul/conv kernels (AVX512-BF16/AMX)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def _fp32_forward(forward):
+    @functools.wraps(forward)
+    def run(*args, **kwargs):
+        with torch.autocast("cpu", enabled=False):
+            args = [a.float() if torch.is_tensor(a) and a.is_floating_point() else a for a in args]
+            return forward(*args, **kwargs)
+    return run
+
+
+def _encoder_forward(module, forward):
+    @functools.wraps(forward)
+    def run(*args, **kwargs):
+        if module.precision == "fp32":
+            return forward(*args, **kwargs)
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            return forward(*args, **kwargs).float()
+    return run
+
+
+def set_precision(module, precision):
+    """
+    Runs `module` (the ECAPA embedding model) in `precision`. The first call
+    wraps its forward in CPU autocast and pins FP32_MODULES to fp32; later
+    calls only flip the mode, so switching back and forth is free.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"unknown precision {precision!r} (choose from {', '.join(PRECISIONS)})")
+    if not hasattr(module, "precision"):
+        for sub in module.modules():
+            if type(sub).__name__ in FP32_MODULES:
+                sub.forward = _fp32_forward(sub.forward)
+        module.forward = _encoder_forward(module, module.forward)
+    module.precision = precision
+
+
+def get_precision(module):
+    return getattr(module, "precision", "fp32")
+
+
+def _best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def check_precision(module, embed, clips, index, precision, repeats=2,
+                    max_drift=MAX_SCORE_DRIFT, min_agreement=MIN_TOP1_AGREEMENT):
+    """
+    Embeds `clips` in fp32 and in `precision` and compares them on the
+    roster in `index`: throughput gain, top-1 agreement and score drift.
+    Leaves `module` in `precision` if both guardrails hold, in fp32
+    otherwise, and returns the report.
+    """
+    set_precision(module, "fp32")
+    ref, fp32_sec = _best_time(lambda: embed(clips), repeats)
+    set_precision(module, precision)
+    embed(clips[:1])  # first bf16 pass selects kernels
+    test, test_sec = _best_time(lambda: embed(clips), repeats)
+
+    cosine = F.cosine_similarity(ref, test, dim=-1)
+    if len(index):
+        ref_scores, test_scores = index.scores(ref), index.scores(test)
+        drift = (test_scores - ref_scores).abs()
+        same = ref_scores.argmax(dim=1) == test_scores.argmax(dim=1)
+        if ref_scores.shape[1] > 1:
+            # A flip between speakers fp32 already had within `max_drift` of
+            # each other is a tie, and is judged by the drift bound instead
+            top2 = ref_scores.topk(2, dim=1).values
+            same |= top2[:, 0] - top2[:, 1] <= max_drift
+        agreement = same.float().mean().item()
+    else:
+        # No roster to score against: the embedding itself has to hold
+        drift = 1 - cosine
+        agreement = 1.0
+
+    report = {
+        "precision": precision,
+        "clips": len(clips),
+        "speakers": len(index),
+        "native_bf16": bf16_supported(),
+        "fp32_sec": round(fp32_sec, 4),
+        f"{precision}_sec": round(test_sec, 4),
+        "speedup": round(fp32_sec / test_sec, 2) if test_sec else None,
+        "top1_agreement": round(agreement, 4),
+        "max_score_drift": round(drift.max().item(), 5),
+        "mean_score_drift": round(drift.mean().item(), 5),
+        "min_cosine": round(cosine.min().item(), 5),
+    }
+    report["ok"] = report["max_score_drift"] <= max_drift and agreement >= min_agreement
+    if not report["ok"]:
+        set_precision(module, "fp32")
+    report["active"] = get_precision(module)
+    return report
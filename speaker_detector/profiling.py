@@ -0,0 +1,160 @@
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_PROFILE_DIR = "speaker-detector-profile"
+TOP_FUNCTIONS = 15
+
+_active = None
+
+
+class PhaseTimes:
+    """Thread-safe call count, total and max seconds per phase name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            calls, total, peak = self._phases.get(name, (0, 0.0, 0.0))
+            self._phases[name] = (calls + 1, total + seconds, max(peak, seconds))
+
+    def items(self):
+        with self._lock:
+            return list(self._phases.items())
+
+    def snapshot(self, reset=False):
+        """{phase: {"calls", "total_ms", "mean_ms", "max_ms"}}."""
+        with self._lock:
+            phases = self._phases
+            if reset:
+                self._phases = {}
+        return {
+            name: {"calls": calls, "total_ms": round(total * 1e3, 2),
+                   "mean_ms": round(total / calls * 1e3, 2), "max_ms": round(peak * 1e3, 2)}
+            for name, (calls, total, peak) in phases.items()
+        }
+
+
+@contextmanager
+def _timed(times, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        times.add(name, time.perf_counter() - start)
+
+
+def phase(name):
+    """
+    Times the enclosed block as phase `name` while phase timing is on
+    (`--profile`, or the server's stage metrics); a no-op otherwise. Safe to
+    call from worker threads (their time adds up).
+    """
+    return nullcontext() if _active is None else _timed(_active, name)
+
+
+def collect_phases():
+    """Turns phase timing on for the life of the process; returns the collector."""
+    global _active
+    if _active is None:
+        _active = PhaseTimes()
+    return _active
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Profiler:
+    """
+    Collects everything `speaker-detector --profile` reports: a cProfile
+    of the whole command, a torch profiler trace of the model work, wall
+    time per phase and peak RSS. `report()` writes the artifacts to
+    `out_dir` and prints a summary table.
+    """
+
+    def __init__(self, out_dir=DEFAULT_PROFILE_DIR):
+        self.out_dir = Path(out_dir)
+        self.phases = PhaseTimes()
+        self._cprofile = cProfile.Profile()
+        self._torch = None
+        self._start = None
+
+    def start(self):
+        global _active
+        _active = self.phases
+        self._start = time.perf_counter()
+        self._cprofile.enable()
+
+    def start_torch(self):
+        """Starts the torch profiler; call once torch is imported."""
+        # Kineto set-up takes seconds on first use; keep it out of the
+        # other phases
+        with _timed(self.phases, "profiler"):
+            from torch.profiler import ProfilerActivity, profile
+            self._torch = profile(activities=[ProfilerActivity.CPU], record_shapes=True)
+            self._torch.__enter__()
+
+    def stop(self):
+        global _active
+        self._cprofile.disable()
+        if self._torch is not None:
+            self._torch.__exit__(None, None, None)
+        _active = None
+        self.wall = time.perf_counter() - self._start
+
+    def report(self):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        artifacts = {"cprofile": self.out_dir / "cprofile.pstats"}
+        self._cprofile.dump_stats(str(artifacts["cprofile"]))
+
+        if self._torch is not None:
+            artifacts["torch_trace"] = self.out_dir / "torch_trace.json"
+            artifacts["torch_ops"] = self.out_dir / "torch_ops.txt"
+            self._torch.export_chrome_trace(str(artifacts["torch_trace"]))
+            artifacts["torch_ops"].write_text(
+                self._torch.key_averages(group_by_input_shape=True)
+                .table(sort_by="self_cpu_time_total", row_limit=50)
+            )
+
+        summary = {
+            "wall_sec": round(self.wall, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "phases": self.phases.snapshot(),
+            "artifacts": {k: str(v) for k, v in artifacts.items()},
+        }
+        artifacts["summary"] = self.out_dir / "summary.json"
+        artifacts["summary"].write_text(json.dumps(summary, indent=2))
+
+        print(f"\n📈 Profile ({self.wall:.2f}s wall, peak RSS "
+              f"{summary['peak_rss_mb'] if summary['peak_rss_mb'] is not None else '?'} MB)")
+        print(f"{'phase':<12} {'calls':>6} {'ms':>10} {'% wall':>7}")
+        for name, (calls, sec, _) in self.phases.items():
+            print(f"{name:<12} {calls:>6} {sec * 1e3:>10.1f} {sec / self.wall:>7.1%}")
+        print("(threaded phases are summed across threads)")
+
+        buf = io.StringIO()
+        pstats.Stats(self._cprofile, stream=buf).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        print(f"\nTop {TOP_FUNCTIONS} functions by cumulative time:")
+        print(buf.getvalue().split("\n\n", 1)[-1].strip())
+        print("\nArtifacts:")
+        for name, path in artifacts.items():
+            print(f"  {name:<12} {path}")
+        return summary
@@ -0,0 +1,66 @@
+import time
+
+import torch
+
+MAX_BATCH = 64
+
+
+def plan_buckets(lengths, max_padded_frames, max_batch=MAX_BATCH):
+    """
+    Groups item indices into batches of similar length.
+
+    Items are sorted longest-first and packed greedily, so the first item
+    of each batch sets its padded length. A batch closes when adding
+    another item would exceed `max_padded_frames` (batch size × longest
+    item) or `max_batch` items. An item longer than the cap runs alone.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches, current = [], []
+    for i in order:
+        if current:
+            padded = (len(current) + 1) * lengths[current[0]]
+            if padded > max_padded_frames or len(current) >= max_batch:
+                batches.append(current)
+                current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def run_bucketed(forward, inputs, max_padded_frames, max_batch=MAX_BATCH):
+    """
+    Runs `forward(padded, rel_lengths)` over length-bucketed batches.
+
+    `inputs` is a list of tensors whose first dim is time (e.g. [T] for
+    waveforms or [T, 80] for features); `forward` receives them padded to
+    [B, T_max, ...] with relative lengths [B], as ECAPA_TDNN.forward and
+    encode_batch expect, and returns one row per item. Returns
+    (outputs in input order, stats).
+    """
+    lengths = [x.shape[0] for x in inputs]
+    outputs = [None] * len(inputs)
+    padded_frames = 0
+    start = time.perf_counter()
+    batches = plan_buckets(lengths, max_padded_frames, max_batch)
+    with torch.no_grad():
+        for batch in batches:
+            batch_lengths = torch.tensor([lengths[i] for i in batch], dtype=torch.float)
+            padded = torch.nn.utils.rnn.pad_sequence([inputs[i] for i in batch], batch_first=True)
+            padded_frames += padded.shape[0] * padded.shape[1]
+            out = forward(padded, batch_lengths / batch_lengths.max())
+            for i, row in zip(batch, out):
+                outputs[i] = row
+
+    elapsed = time.perf_counter() - start
+    frames = sum(lengths)
+    stats = {
+        "items": len(inputs),
+        "batches": len(batches),
+        "frames": frames,
+        "padded_frames": padded_frames,
+        "padding_efficiency": round(frames / padded_frames, 3) if padded_frames else 1.0,
+        "seconds": elapsed,
+        "items_per_sec": len(inputs) / elapsed if elapsed else 0.0,
+    }
+    return outputs, stats
@@ -0,0 +1,269 @@
+import threading
+
+import torch
+import torchaudio
+
+from speaker_detector.core import embed_waveforms, prepare_waveform
+from speaker_detector.ingest import VAD_FRAME_SEC, speech_frames
+from speaker_detector.pipeline import (
+    BLOCK_SEC,
+    DECODE_WORKERS,
+    EMBED_BATCH,
+    FEATURE_WORKERS,
+    QUEUE_SIZE,
+    Pipeline,
+    Stage,
+)
+
+SAMPLE_RATE = 16000
+HOP_SEC = 0.01            # feature frame
+N_MELS = 40
+WINDOW_SEC = 1.0          # statistics window on each side of a candidate point
+STEP_SEC = 0.1            # candidate grid
+MIN_SEGMENT_SEC = 1.0     # no two change points closer than this
+MIN_VOICED = 0.3          # both windows need this fraction of speech
+THRESHOLD_MADS = 3.0      # peak must exceed median + this × MAD of the curve
+MIN_DIVERGENCE = 0.5      # ...and this absolute divergence
+MAX_EMBED_SEC = 6.0       # long segments are embedded from their central part
+MIN_SPEECH_SEC = 0.5      # shorter segments are dropped
+BLOCK_OVERLAP_SEC = 2 * WINDOW_SEC  # audio read past each block edge, so seams get full windows
+
+_mel = None
+_mel_lock = threading.Lock()
+
+
+def log_mel(wav):
+    """[frames, N_MELS] log-mel features of a mono 16 kHz [T] tensor, 10 ms hop."""
+    global _mel
+    with _mel_lock:
+        if _mel is None:
+            _mel = torchaudio.transforms.MelSpectrogram(
+                SAMPLE_RATE, n_fft=400, hop_length=int(HOP_SEC * SAMPLE_RATE), n_mels=N_MELS
+            )
+    with torch.no_grad():
+        return (_mel(wav) + 1e-6).log().T
+
+
+def divergence_curve(feats, voiced, window, step):
+    """
+    Symmetric KL divergence between diagonal Gaussians fitted to the voiced
+    frames of the `window` frames left and right of every `step`-th frame.
+    Window statistics come from cumulative sums, so the whole curve costs
+    O(frames × dims). Returns (frame positions, divergence); positions
+    whose windows are mostly silence get 0.
+    """
+    n, dims = feats.shape
+    positions = torch.arange(window, n - window + 1, step)
+    if not len(positions):
+        return positions, torch.zeros(0)
+    m = voiced.float().unsqueeze(1)
+    zero = torch.zeros(1, dims)
+    cs = torch.cat([zero, (feats * m).cumsum(0)])
+    cs2 = torch.cat([zero, (feats.pow(2) * m).cumsum(0)])
+    cn = torch.cat([torch.zeros(1), voiced.float().cumsum(0)])
+
+    def stats(lo, hi):
+        count = (cn[hi] - cn[lo]).clamp(min=1).unsqueeze(1)
+        mean = (cs[hi] - cs[lo]) / count
+        var = ((cs2[hi] - cs2[lo]) / count - mean.pow(2)).clamp(min=1e-3)
+        return mean, var, cn[hi] - cn[lo]
+
+    m1, v1, n1 = stats(positions - window, positions)
+    m2, v2, n2 = stats(positions, positions + window)
+    div = 0.5 * ((v1 / v2 + v2 / v1 - 2) + (m1 - m2).pow(2) * (1 / v1 + 1 / v2)).mean(dim=1)
+    div[(n1 < MIN_VOICED * window) | (n2 < MIN_VOICED * window)] = 0
+    return positions, div
+
+
+def _pick_peaks(positions, div, min_gap):
+    valid = div[div > 0]
+    if not len(valid):
+        return []
+    median = valid.median()
+    mad = (valid - median).abs().median()
+    threshold = max(float(median + THRESHOLD_MADS * mad), MIN_DIVERGENCE)
+    # Highest peaks first; each one suppresses its neighbourhood
+    picked = []
+    for i in div.argsort(descending=True).tolist():
+        if div[i] < threshold:
+            break
+        p = int(positions[i])
+        if all(abs(p - q) >= min_gap for q in picked):
+            picked.append(p)
+    return sorted(picked)
+
+
+def change_points(wav, sr=SAMPLE_RATE):
+    """Sample indices of likely speaker changes in a mono 16 kHz [T] tensor."""
+    hop = int(HOP_SEC * sr)
+    feats = log_mel(wav)
+    # VAD frames are coarser than feature frames; spread them over the grid
+    vad = speech_frames(wav, sr)
+    ratio = max(1, round(VAD_FRAME_SEC / HOP_SEC))
+    voiced = vad.repeat_interleave(ratio)[:len(feats)]
+    if len(voiced) < len(feats):
+        voiced = torch.cat([voiced, torch.zeros(len(feats) - len(voiced), dtype=torch.bool)])
+    positions, div = divergence_curve(
+        feats, voiced, int(WINDOW_SEC / HOP_SEC), max(1, int(STEP_SEC / HOP_SEC))
+    )
+    return [p * hop for p in _pick_peaks(positions, div, int(MIN_SEGMENT_SEC / HOP_SEC))]
+
+
+def segment(wav, sr=SAMPLE_RATE):
+    """
+    Splits a mono 16 kHz [T] tensor into speaker-homogeneous segments:
+    [(start, end)] in samples, cut at change points and trimmed to speech.
+    Segments with less than MIN_SPEECH_SEC of speech are dropped.
+    """
+    voiced = speech_frames(wav, sr)
+    if not len(voiced) or not voiced.any():
+        return []
+    frame = int(VAD_FRAME_SEC * sr)
+    bounds = [0] + change_points(wav, sr) + [wav.shape[-1]]
+    segments = []
+    for lo, hi in zip(bounds, bounds[1:]):
+        first = lo // frame
+        idx = voiced[first:hi // frame].nonzero().flatten()
+        if len(idx) * frame < MIN_SPEECH_SEC * sr:
+            continue
+        # VAD frames sit on a grid from sample 0; `lo` need not be on it
+        start = max(lo, (first + int(idx[0])) * frame)
+        end = min(hi, (first + int(idx[-1]) + 1) * frame)
+        segments.append((start, end))
+    return segments
+
+
+def embedding_span(start, end, sr=SAMPLE_RATE, max_sec=MAX_EMBED_SEC):
+    """
+    The part of a segment that is embedded: all of it, or its central
+    `max_sec` when longer. One homogeneous segment needs one embedding, and
+    more audio than this does not change it much.
+    """
+    cap = int(max_sec * sr)
+    if end - start <= cap:
+        return start, end
+    mid = (start + end) // 2
+    return mid - cap // 2, mid - cap // 2 + cap
+
+
+class _Stitcher:
+    """
+    Joins per-block turns into meeting turns (the stage after segmentation).
+
+    Blocks may finish out of order, so they are held until every earlier
+    block is in. A turn cut at a block's right edge is joined with the next
+    block's first turn when that one is cut at its left edge, i.e. both
+    sides saw the speech run on across the seam. A failed block (no
+    pieces) ends any turn running into it. Not thread-safe: one worker.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pending = {}
+        self.next_index = 0
+        self.carry = None  # [start, end, cut_right, [clips]] of an unfinished turn
+
+    def _flush(self, done):
+        if self.carry is not None:
+            start, end, _, clips = self.carry
+            clip = torch.cat(clips)
+            a, b = embedding_span(0, len(clip))
+            done.append((start, end, clip[a:b]))
+            self.carry = None
+
+    def __call__(self, item):
+        block, pieces = item
+        self.pending[block["index"]] = (block, pieces)
+        done = []
+        while self.next_index in self.pending:
+            block, pieces = self.pending.pop(self.next_index)
+            self.next_index += 1
+            if not pieces or not pieces[0][2]:
+                self._flush(done)
+            for start, end, cut_left, cut_right, clip in pieces or ():
+                if self.carry is not None and cut_left:
+                    self.carry = [self.carry[0], end, cut_right, self.carry[3] + [clip]]
+                else:
+                    self._flush(done)
+                    self.carry = [start, end, cut_right, [clip]]
+                if not cut_right:
+                    self._flush(done)
+            if block["last"]:
+                self._flush(done)
+                self.reset()
+        return done
+
+
+def turn_pipeline(read_block, score, decode_workers=DECODE_WORKERS, feature_workers=FEATURE_WORKERS,
+                  batch_size=EMBED_BATCH, queue_size=QUEUE_SIZE):
+    """
+    Pipeline from blocks (see `blocks()`) to scored speaker turns:
+
+    decode   `read_block(start, end) -> (wav, sr)` over the block and its
+             overlap, then mono 16 kHz; a block that fails is skipped
+    segment  change points + VAD → the block's turns, clipped to the block
+    stitch   turns cut at a seam are joined with their continuation
+    embed    `batch_size` turn clips per encoder pass, bypassing the clip cache
+    score    `score([(start, end, emb), ...]) -> [result, ...]`
+
+    Decoding and segmentation of later blocks overlap with the model
+    working on earlier ones.
+    """
+    def decode(block):
+        try:
+            wav, sr = read_block(block["read_start"], block["read_end"])
+            return block, prepare_waveform(wav, sr)
+        except Exception as e:
+            print(f"❌ Failed to decode {block['start']:.1f}-{block['end']:.1f}s: {e}")
+            return block, None
+
+    def find_turns(item):
+        block, wav = item
+        if wav is None:
+            return block, None
+        offset, pieces = block["read_start"], []
+        for s, e in segment(wav):
+            a, b = offset + s / SAMPLE_RATE, offset + e / SAMPLE_RATE
+            lo, hi = max(a, block["start"]), min(b, block["end"])
+            if hi <= lo:
+                continue
+            clip = wav[int(round((lo - offset) * SAMPLE_RATE)):int(round((hi - offset) * SAMPLE_RATE))]
+            pieces.append((lo, hi, a < block["start"], b > block["end"], clip))
+        return block, pieces
+
+    def embed(turns):
+        # Turns are one-off clips; keep them out of the clip cache
+        embs = embed_waveforms([clip for _, _, clip in turns], use_cache=False)
+        return [(start, end, emb) for (start, end, _), emb in zip(turns, embs)]
+
+    return Pipeline([
+        Stage("decode", decode, workers=decode_workers),
+        Stage("segment", find_turns, workers=feature_workers),
+        Stage("stitch", _Stitcher(), fan_out=True),
+        Stage("embed", embed, batch_size=batch_size),
+        Stage("score", score, batch_size=batch_size),
+    ], queue_size=queue_size)
+
+
+def blocks(duration, block_sec=BLOCK_SEC, overlap_sec=BLOCK_OVERLAP_SEC):
+    """
+    Blocks covering [0, duration): {"index", "start", "end", "read_start",
+    "read_end", "last"} in seconds. Each block owns [start, end) and is
+    read `overlap_sec` further on both sides, so change points near its
+    edges still get full statistics windows.
+    """
+    starts = [i * block_sec for i in range(int(duration // block_sec) + 1)]
+    starts = [s for s in starts if s < duration]
+    return [
+        {
+            "index": i,
+            "start": s,
+            "end": min(s + block_sec, duration),
+            "read_start": max(0.0, s - overlap_sec),
+            "read_end": min(s + block_sec + overlap_sec, duration),
+            "last": i == len(starts) - 1,
+        }
+        for i, s in enumerate(starts)
+    ]
@@ -0,0 +1,559 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import requests
+import torch
+import torch.nn.functional as F
+from requests.adapters import HTTPAdapter
+
+from speaker_detector.index import (
+    MATCH_GAP,
+    MATCH_THRESHOLD,
+    NORM_THRESHOLD,
+    VERIFY_THRESHOLD,
+    SpeakerIndex,
+    match_result,
+)
+
+SHARD_BUDGET_MS = 250   # scatter-gather deadline; slower shards are left out of the answer
+SHARD_TOP_K = 5         # candidates each shard returns per query
+SHARD_RELOAD_SEC = 5.0  # a shard re-checks its partition on disk at most this often
+SHARD_READY_TIMEOUT = 60
+ROSTER_ID_FILE = ".roster-id"  # marks an embeddings folder, so shards can prove they read the server's
+
+
+def roster_id(folder):
+    """
+    Identity of the embeddings folder `folder`, created on first use.
+    Shards and the server read the roster from one shared folder: the
+    server writes enrollments there, the shards only read them, so both
+    must report the same id.
+    """
+    path = Path(folder) / ROSTER_ID_FILE
+    try:
+        with open(path, "x") as f:
+            f.write(uuid.uuid4().hex)
+    except FileExistsError:
+        pass
+    return path.read_text().strip()
+
+
+def shard_of(name, n_shards):
+    """Shard owning speaker `name`: a stable hash, so every process agrees without a directory."""
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % n_shards
+
+
+def _encode_queries(queries):
+    q = queries.reshape(-1, queries.shape[-1]).float().contiguous()
+    return {"queries": base64.b64encode(q.numpy().astype("<f4").tobytes()).decode(), "dim": q.shape[1]}
+
+
+def _decode_queries(payload):
+    data = np.frombuffer(base64.b64decode(payload["queries"]), dtype="<f4")
+    return torch.from_numpy(data.reshape(-1, payload["dim"]).copy())
+
+
+# ─── Shard process ────────────────────────────────────────────────────────────
+
+class Shard:
+    """
+    One partition of the roster: the speakers in `folder` (`<speaker>.pt`
+    files, as written by enrollment) that shard_of() assigns to `shard`.
+    A background thread rebuilds the partition when its files change,
+    checked every `reload_sec`; index(force=True) rebuilds it at once.
+    Searches never wait for a rescan.
+
+    AS-norm scores stay comparable across shards when every shard gets
+    the same external `cohort_path`. Without one, each shard normalises
+    against its own partition (a different sample of the roster per
+    shard), so the router ranks those on raw scores.
+
+    Shards never write: `folder` must be the server's EMBEDDINGS_DIR,
+    shared (e.g. over NFS) with every shard node.
+    """
+
+    def __init__(self, folder, shard, n_shards, cohort_path=None, reload_sec=SHARD_RELOAD_SEC):
+        self.folder = Path(folder)
+        self.shard = shard
+        self.n_shards = n_shards
+        self.cohort_path = cohort_path
+        self.reload_sec = reload_sec
+        self.roster_id = roster_id(self.folder)
+        self._lock = threading.Lock()
+        self._index = None
+        self._signature = None
+        self.cohort_id = None  # content hash of the cohort file, compared by the router
+        self._refresh()
+        threading.Thread(target=self._watch, name=f"shard-{shard}-reload", daemon=True).start()
+
+    def _owned(self, name):
+        return shard_of(name, self.n_shards) == self.shard
+
+    def _current_signature(self):
+        sources = [p for p in sorted(self.folder.glob("*.pt")) if self._owned(p.stem)]
+        if self.cohort_path and Path(self.cohort_path).exists():
+            sources.append(Path(self.cohort_path))
+        return [(str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in sources]
+
+    def _refresh(self):
+        with self._lock:
+            signature = self._current_signature()
+            if signature != self._signature:
+                self._index = SpeakerIndex.from_folder(self.folder, cohort_path=self.cohort_path,
+                                                       select=self._owned)
+                self._signature = signature
+                cohort = Path(self.cohort_path) if self.cohort_path else None
+                self.cohort_id = (hashlib.blake2b(cohort.read_bytes(), digest_size=8).hexdigest()
+                                  if cohort and cohort.exists() else None)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_sec)
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"⚠️  Shard {self.shard}: reload failed: {e}", flush=True)
+
+    def index(self, force=False):
+        if force:
+            self._refresh()
+        return self._index
+
+    def search(self, queries, top_k=SHARD_TOP_K):
+        """
+        Per query, this shard's candidates: [{"speaker", "score", "rank"}]
+        with the raw cosine score and the AS-norm score (raw again when not
+        normalised). The `top_k` best by either score are returned, so the
+        router can rank on whichever is comparable across shards.
+        """
+        index = self.index()
+        n = queries.reshape(-1, queries.shape[-1]).shape[0]
+        if not len(index):
+            return index, [[] for _ in range(n)]
+        raw, norm = index.score_with_norm(queries)
+        ranked = raw if norm is None else norm
+        k = min(top_k, len(index))
+        top_idx = raw.topk(k, dim=1).indices
+        if norm is not None:
+            top_idx = torch.cat([top_idx, norm.topk(k, dim=1).indices], dim=1)
+        results = []
+        for q, idx in enumerate(top_idx.tolist()):
+            idx = list(dict.fromkeys(idx))
+            results.append([{"speaker": index.names[i], "score": raw[q, i].item(), "rank": ranked[q, i].item()}
+                            for i in idx])
+        return index, results
+
+
+def make_shard_handler(shard, delay=0.0):
+    """
+    Handler serving one Shard over HTTP: GET /healthz, POST /search
+    (queries → top-k candidates), POST /verify (queries + claimed names)
+    and POST /reload. `delay` seconds are added to every search/verify,
+    to stand in for a slow or distant shard.
+    """
+
+    class ShardHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive for the router's pooled session
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the router stopped waiting for this shard
+
+        def _info(self, index):
+            return {"shard": shard.shard, "shards": shard.n_shards, "speakers": len(index),
+                    "normalized": index.normalized, "self_cohort": index.self_cohort,
+                    "cohort": shard.cohort_id, "roster": shard.roster_id}
+
+        def do_GET(self):
+            if self.path != "/healthz":
+                return self._send(404, {"error": "not found"})
+            self._send(200, self._info(shard.index()))
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                payload = json.loads(body or b"{}")
+                if self.path == "/reload":
+                    return self._send(200, self._info(shard.index(force=True)))
+                time.sleep(delay)
+                queries = _decode_queries(payload)
+                if self.path == "/search":
+                    index, results = shard.search(queries, payload.get("top_k", SHARD_TOP_K))
+                elif self.path == "/verify":
+                    index = shard.index()
+                    results = index.verify(queries, payload["claims"],
+                                           threshold=payload.get("threshold", VERIFY_THRESHOLD),
+                                           norm_threshold=payload.get("norm_threshold", NORM_THRESHOLD))
+                else:
+                    return self._send(404, {"error": "not found"})
+            except Exception as e:
+                return self._send(400, {"error": str(e)})
+            self._send(200, dict(self._info(index), results=results))
+
+    return ShardHandler
+
+
+def serve_shard(folder, shard, n_shards, host="127.0.0.1", port=9200, cohort_path=None, delay=0.0):
+    """Runs one shard server in the foreground."""
+    state = Shard(folder, shard, n_shards, cohort_path=cohort_path)
+    server = ThreadingHTTPServer((host, port), make_shard_handler(state, delay=delay))
+    print(f"🧩 Shard {shard}/{n_shards}: {len(state.index())} speakers from {folder} "
+          f"on http://{host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# ─── Router ───────────────────────────────────────────────────────────────────
+
+class ShardedIndex:
+    """
+    Speaker search over a roster partitioned across shard servers (one
+    URL per shard, in shard order). identify() sends the queries to every
+    shard at once and merges their top-k candidates. verify() asks only
+    the shard that owns each claimed name. Both give up on shards that
+    have not answered within `budget_ms`. The answer is then built from
+    the shards that did, and marked "partial" with the "missing_shards".
+
+    Drop-in for SpeakerIndex where only identify/verify are needed; the
+    full [Q, N] score matrix (scores()) is never materialised.
+
+    With `roster` (the roster_id() of the folder enrollment writes to),
+    answers from a shard serving another folder are refused, as if the
+    shard had not answered; check_roster() reports such shards up front.
+    """
+
+    def __init__(self, urls, budget_ms=SHARD_BUDGET_MS, top_k=SHARD_TOP_K, roster=None):
+        self.urls = [u.rstrip("/") for u in urls]
+        self.roster = roster
+        self.budget = budget_ms / 1000
+        self.top_k = top_k
+        self.sizes = {}
+        self.normalized_shards = {}  # shard -> AS-norm against an external cohort
+        self.cohorts = {}            # shard -> that cohort's content hash
+        self.session = requests.Session()
+        pool = 4 * len(self.urls)
+        adapter = HTTPAdapter(pool_connections=len(self.urls), pool_maxsize=pool)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=pool, thread_name_prefix="shard")
+
+    def __len__(self):
+        """Speakers across the shards, as last reported by each."""
+        return sum(self.sizes.values())
+
+    @property
+    def normalized(self):
+        """True when every shard normalises against the same external cohort."""
+        return self._comparable(
+            {"normalized": n, "cohort": self.cohorts.get(i)} for i, n in self.normalized_shards.items()
+        )
+
+    @staticmethod
+    def _comparable(infos):
+        # AS-norm scores from different shards can be ranked together only
+        # when all of them used one external cohort; self-cohort AS-norm
+        # depends on each shard's own partition
+        infos = list(infos)
+        return (bool(infos) and all(i["normalized"] and not i.get("self_cohort") for i in infos)
+                and len({i.get("cohort") for i in infos}) == 1)
+
+    def _post(self, shard, path, payload, timeout):
+        r = self.session.post(f"{self.urls[shard]}{path}", json=payload, timeout=timeout)
+        r.raise_for_status()
+        data = r.json()
+        if self.roster is not None and data.get("roster") != self.roster:
+            raise ValueError(f"shard {shard} serves another embeddings folder")
+        self.sizes[shard] = data["speakers"]
+        self.normalized_shards[shard] = data["normalized"] and not data.get("self_cohort")
+        self.cohorts[shard] = data.get("cohort")
+        return data
+
+    def _scatter(self, path, payloads, timeout=None):
+        """Posts {shard: payload} in parallel → ({shard: response}, [missing shards])."""
+        timeout = self.budget if timeout is None else timeout
+        futures = {self._pool.submit(self._post, i, path, p, timeout): i for i, p in payloads.items()}
+        done, _ = wait(futures, timeout=timeout)
+        answers = {}
+        for fut in done:
+            if fut.exception() is None:
+                answers[futures[fut]] = fut.result()
+        return answers, sorted(set(payloads) - set(answers))
+
+    def identify(self, queries, threshold=MATCH_THRESHOLD, gap=MATCH_GAP, top_k=None,
+                 norm_threshold=NORM_THRESHOLD):
+        """Same result dicts as SpeakerIndex.identify, merged from the shards' candidates."""
+        queries = queries.reshape(-1, queries.shape[-1])
+        k = max(self.top_k, top_k or 0, 2)
+        payload = dict(_encode_queries(queries), top_k=k)
+        answers, missing = self._scatter("/search", {i: payload for i in range(len(self.urls))})
+
+        # Rank on AS-norm only if every answering shard normalised against
+        # an external cohort; raw scores, self-cohort AS-norm and external
+        # AS-norm are not comparable with each other
+        normalized = self._comparable(answers.values())
+        results = []
+        for q in range(len(queries)):
+            candidates = [c for a in answers.values() for c in a["results"][q]]
+            candidates.sort(key=lambda c: c["rank"] if normalized else c["score"], reverse=True)
+            if top_k is not None:
+                candidates = candidates[:max(top_k, 2)]
+            if candidates:
+                result = match_result(
+                    [c["speaker"] for c in candidates], [c["score"] for c in candidates],
+                    [c["rank"] for c in candidates], normalized,
+                    threshold=threshold, gap=gap, norm_threshold=norm_threshold, top_k=top_k,
+                )
+            else:
+                result = {"speaker": "unknown", "score": 0}
+            if missing:
+                result.update(partial=True, missing_shards=missing)
+            results.append(result)
+        return results
+
+    def verify(self, queries, claims, threshold=VERIFY_THRESHOLD, norm_threshold=NORM_THRESHOLD):
+        """Same result dicts as SpeakerIndex.verify; each claim is checked by its owning shard only."""
+        queries = queries.reshape(-1, queries.shape[-1])
+        claims = list(claims)
+        if len(claims) != len(queries):
+            raise ValueError(f"{len(queries)} queries but {len(claims)} claims")
+        rows = {}
+        for q, claim in enumerate(claims):
+            rows.setdefault(shard_of(claim, len(self.urls)), []).append(q)
+        payloads = {
+            shard: dict(_encode_queries(queries[qs]), claims=[claims[q] for q in qs],
+                        threshold=threshold, norm_threshold=norm_threshold)
+            for shard, qs in rows.items()
+        }
+        answers, _ = self._scatter("/verify", payloads)
+
+        results = [None] * len(claims)
+        for shard, qs in rows.items():
+            for j, q in enumerate(qs):
+                if shard in answers:
+                    results[q] = answers[shard]["results"][j]
+                else:
+                    results[q] = {"speaker": claims[q], "match": False, "score": 0,
+                                  "error": f"shard {shard} unavailable", "partial": True,
+                                  "missing_shards": [shard]}
+        return results
+
+    def reload(self, timeout=10.0):
+        """Asks every shard to re-read its partition now; returns the shards that did not answer."""
+        _, missing = self._scatter("/reload", {i: {} for i in range(len(self.urls))}, timeout=timeout)
+        if missing:
+            print(f"⚠️  Shard reload unanswered by shard(s) {missing}")
+        return missing
+
+    def health(self, timeout=2.0):
+        """GET /healthz of every shard → {shard: info or None}."""
+        def get(i):
+            try:
+                r = self.session.get(f"{self.urls[i]}/healthz", timeout=timeout)
+                r.raise_for_status()
+                return r.json()
+            except requests.RequestException:
+                return None
+        return dict(zip(range(len(self.urls)), self._pool.map(get, range(len(self.urls)))))
+
+    def check_roster(self, timeout=2.0):
+        """
+        Raises RuntimeError if a reachable shard serves a folder other than
+        `roster`: enrollments would never reach it. Unreachable shards are
+        reported and left to the per-request check.
+        """
+        health = self.health(timeout=timeout)
+        down = [i for i, info in health.items() if info is None]
+        if down:
+            print(f"⚠️  Shard(s) {down} not reachable; their embeddings folder is unchecked")
+        foreign = [i for i, info in health.items() if info is not None and info.get("roster") != self.roster]
+        if foreign:
+            raise RuntimeError(f"shard(s) {foreign} do not serve this server's embeddings folder; "
+                               f"SPEAKER_SHARDS needs one folder shared by the server and every shard")
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self.session.close()
+
+
+# ─── Local harness ────────────────────────────────────────────────────────────
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalShards:
+    """
+    Runs `n_shards` shard servers as child processes on this host, standing
+    in for remote shard nodes. `delays` maps shard number → extra seconds
+    per request, to simulate a slow node. Each process gets an equal share
+    of the CPU cores for torch, as separate nodes would. Use as a context
+    manager; `urls` lists the shards in order once all report healthy.
+    """
+
+    def __init__(self, folder, n_shards, cohort_path=None, delays=None, ready_timeout=SHARD_READY_TIMEOUT):
+        self.folder = Path(folder)
+        self.n_shards = n_shards
+        self.cohort_path = cohort_path
+        self.delays = delays or {}
+        self.ready_timeout = ready_timeout
+        self.procs = []
+        self.urls = []
+
+    def __enter__(self):
+        threads = str(max(1, (os.cpu_count() or 1) // self.n_shards))
+        env = dict(os.environ, PYTHONWARNINGS="ignore", OMP_NUM_THREADS=threads, MKL_NUM_THREADS=threads)
+        for i in range(self.n_shards):
+            port = _free_port()
+            cmd = [sys.executable, "-m", "speaker_detector", "shard-server", str(self.folder),
+                   "--shard", str(i), "--shards", str(self.n_shards), "--port", str(port),
+                   "--delay", str(self.delays.get(i, 0.0))]
+            if self.cohort_path:
+                cmd += ["--cohort", str(self.cohort_path)]
+            self.procs.append(subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL))
+            self.urls.append(f"http://127.0.0.1:{port}")
+        try:
+            self._wait_ready()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + self.ready_timeout
+        pending = set(range(self.n_shards))
+        while pending and time.monotonic() < deadline:
+            for i in list(pending):
+                if self.procs[i].poll() is not None:
+                    raise RuntimeError(f"shard {i} exited with {self.procs[i].returncode}")
+                try:
+                    if requests.get(f"{self.urls[i]}/healthz", timeout=1).status_code == 200:
+                        pending.discard(i)
+                except requests.RequestException:
+                    pass
+            time.sleep(0.1)
+        if pending:
+            raise TimeoutError(f"shard(s) {sorted(pending)} not ready after {self.ready_timeout}s")
+
+    def __exit__(self, *exc):
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+
+def _synthetic_roster(folder, speakers, dim, seed, cohort_size):
+    g = torch.Generator().manual_seed(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    for s in range(speakers):
+        # Some speakers have two sub-centroids, as enrollment produces
+        n = 2 if s % 5 == 0 else 1
+        torch.save(F.normalize(torch.randn(n, dim, generator=g), dim=1), folder / f"spk{s:06d}.pt")
+    cohort_path = folder.parent / "cohort.pt"
+    torch.save(F.normalize(torch.randn(cohort_size, dim, generator=g), dim=1), cohort_path)
+    return cohort_path
+
+
+def _latency_summary(samples):
+    ms = np.array(samples) * 1e3
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 2), "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "max_ms": round(float(ms.max()), 2)}
+
+
+def run_shard_harness(speakers=20000, shards=4, queries=200, batch=1, budget_ms=SHARD_BUDGET_MS,
+                      slow_ms=None, dim=192, noise=0.8, cohort_size=1000, seed=0, out_path=None):
+    """
+    Builds a synthetic roster, serves it from `shards` local shard
+    processes and compares sharded identify() with a single in-process
+    SpeakerIndex on noisy copies of enrolled voices: top-1 agreement and
+    latency. With `slow_ms`, a second run delays shard 0 by that much to
+    show the budget cutting it off (partial results, bounded latency).
+    Returns the report, also written to `out_path` as JSON if given.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="speaker-detector-shards-"))
+    try:
+        folder = workdir / "embeddings"
+        cohort_path = _synthetic_roster(folder, speakers, dim, seed, cohort_size)
+        reference = SpeakerIndex.from_folder(folder, cohort_path=cohort_path)
+        g = torch.Generator().manual_seed(seed + 1)
+        owners = torch.randint(len(reference.names), (queries,), generator=g)
+        rows = torch.stack([reference.matrix[(reference.owner == o).nonzero()[0, 0]] for o in owners])
+        probes = F.normalize(rows + noise * torch.randn(queries, dim, generator=g) / dim ** 0.5, dim=1)
+
+        start = time.perf_counter()
+        expected = [r["speaker"] for b in range(0, queries, batch)
+                    for r in reference.identify(probes[b:b + batch])]
+        single_sec = (time.perf_counter() - start) / max(1, -(-queries // batch))
+        truth = [reference.names[o] for o in owners]
+
+        runs = {"healthy": {}}
+        if slow_ms:
+            runs[f"shard 0 +{slow_ms:g}ms"] = {0: slow_ms / 1000}
+        report = {"speakers": speakers, "shards": shards, "queries": queries, "batch": batch,
+                  "budget_ms": budget_ms, "single_index_ms": round(single_sec * 1e3, 2), "runs": {}}
+        print(f"🧩 {speakers} speakers over {shards} shards, {queries} queries in batches of {batch}, "
+              f"budget {budget_ms:g} ms (single index: {single_sec * 1e3:.2f} ms/batch)")
+        print(f"{'run':<20} {'agree':>7} {'correct':>8} {'partial':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for name, delays in runs.items():
+            with LocalShards(folder, shards, cohort_path=cohort_path, delays=delays) as local:
+                index = ShardedIndex(local.urls, budget_ms=budget_ms)
+                try:
+                    index.identify(probes[:1])  # connect
+                    latencies, got, partial = [], [], 0
+                    for b in range(0, queries, batch):
+                        t0 = time.perf_counter()
+                        results = index.identify(probes[b:b + batch])
+                        latencies.append(time.perf_counter() - t0)
+                        got += [r["speaker"] for r in results]
+                        partial += sum(bool(r.get("partial")) for r in results)
+                finally:
+                    index.close()
+            run = dict(
+                agreement=round(float(np.mean([a == b for a, b in zip(got, expected)])), 4),
+                correct=round(float(np.mean([a == b for a, b in zip(got, truth)])), 4),
+                partial=round(partial / queries, 4),
+                **_latency_summary(latencies),
+            )
+            report["runs"][name] = run
+            print(f"{name:<20} {run['agreement']:>7.1%} {run['correct']:>8.1%} {run['partial']:>8.1%} "
+                  f"{run['p50_ms']:>8.2f} {run['p95_ms']:>8.2f} {run['max_ms']:>8.2f}")
+        if out_path:
+            Path(out_path).write_text(json.dumps(report, indent=2))
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
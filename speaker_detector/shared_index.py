@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import torch
+
+from speaker_detector.index import SpeakerIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: one writer process is assumed
+    fcntl = None
+
+_TENSORS = ("matrix", "owner", "cohort", "enroll_mean", "enroll_std")
+_DTYPES = {"float32": torch.float32, "int64": torch.int64}
+_ALIGN = 64
+_HEADER_LEN = struct.Struct("<Q")
+_GENERATION = struct.Struct("<Q")
+
+
+def default_prefix(base_dir):
+    """Segment name prefix unique to one storage tree."""
+    return "sd-" + hashlib.blake2b(str(base_dir).encode(), digest_size=6).hexdigest()
+
+
+def _open(name, create=False, size=0):
+    # Segments must outlive the process that created them, and attaching
+    # must not register them for unlinking at exit (Python < 3.13 does both).
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def _unlink(name):
+    try:
+        from _posixshmem import shm_unlink
+    except ImportError:  # Windows frees a segment when its last handle closes
+        return
+    try:
+        shm_unlink(f"/{name}")
+    except FileNotFoundError:
+        pass
+
+
+class SharedSpeakerIndex:
+    """
+    Publishes a SpeakerIndex to every process on the host through POSIX
+    shared memory.
+
+    Each published index lives in its own segment, `<prefix>-<generation>`,
+    holding a JSON header (names, shapes, dtypes, offsets) followed by the
+    tensor data. A separate 8-byte control segment holds the current
+    generation. Writers fill a new segment completely, then store the new
+    generation into the control segment and unlink the previous segment.
+    Readers check the control word on every `current()` call and, when it
+    has moved, map the new segment and wrap its tensors without copying.
+    Readers never lock; only writers serialize on a lock file.
+    """
+
+    def __init__(self, prefix, lock_path=None):
+        self.prefix = prefix
+        self.lock_path = lock_path
+        self._local_lock = threading.Lock()
+        self._control = self._open_control()
+        self._generation = 0
+        self._shm = None
+        self._index = None
+        self._retired = []  # mapped segments that in-flight readers may still use
+
+    def _open_control(self):
+        name = f"{self.prefix}-ctl"
+        try:
+            return _open(name, create=True, size=_GENERATION.size)
+        except FileExistsError:
+            return _open(name)
+
+    @property
+    def generation(self):
+        return _GENERATION.unpack_from(self._control.buf, 0)[0]
+
+    # ─── Writers ──────────────────────────────────────────────────────────
+
+    @contextmanager
+    def _writer_lock(self):
+        with self._local_lock:
+            if fcntl is None or self.lock_path is None:
+                yield
+                return
+            with open(self.lock_path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def publish(self, index):
+        """Publishes `index` as the next generation and returns its number."""
+        state = index.state_dict()
+        header = {
+            "names": state["names"],
+            "self_cohort": state["self_cohort"],
+            "cohort_top_k": state["cohort_top_k"],
+            "tensors": {},
+        }
+        offset = 0
+        tensors = {}
+        for key in _TENSORS:
+            t = state[key]
+            if t is None:
+                continue
+            t = t.detach().contiguous()
+            t = t.long() if key == "owner" else t.float()
+            tensors[key] = t
+            header["tensors"][key] = {"shape": list(t.shape), "offset": offset,
+                                      "dtype": str(t.dtype).replace("torch.", "")}
+            offset += -(-t.numel() * t.element_size() // _ALIGN) * _ALIGN
+        header_bytes = json.dumps(header).encode()
+        data_start = -(-(_HEADER_LEN.size + len(header_bytes)) // _ALIGN) * _ALIGN
+
+        with self._writer_lock():
+            generation = self.generation + 1
+            name, size = f"{self.prefix}-{generation}", max(1, data_start + offset)
+            try:
+                shm = _open(name, create=True, size=size)
+            except FileExistsError:
+                # Left behind by a writer that died before bumping the
+                # control word; nothing can be reading an unpublished name
+                _unlink(name)
+                shm = _open(name, create=True, size=size)
+            _HEADER_LEN.pack_into(shm.buf, 0, len(header_bytes))
+            shm.buf[_HEADER_LEN.size:_HEADER_LEN.size + len(header_bytes)] = header_bytes
+            for key, t in tensors.items():
+                if t.numel() == 0:
+                    continue
+                start = data_start + header["tensors"][key]["offset"]
+                view = torch.frombuffer(shm.buf, dtype=t.dtype, count=t.numel(), offset=start)
+                view.copy_(t.reshape(-1))
+                del view
+            shm.close()
+
+            # The segment is complete before readers can see its generation
+            _GENERATION.pack_into(self._control.buf, 0, generation)
+            _unlink(f"{self.prefix}-{generation - 1}")
+        return generation
+
+    # ─── Readers ──────────────────────────────────────────────────────────
+
+    def _attach(self, generation):
+        shm = _open(f"{self.prefix}-{generation}")
+        (header_len,) = _HEADER_LEN.unpack_from(shm.buf, 0)
+        header = json.loads(bytes(shm.buf[_HEADER_LEN.size:_HEADER_LEN.size + header_len]))
+        data_start = -(-(_HEADER_LEN.size + header_len) // _ALIGN) * _ALIGN
+
+        state = {
+            "names": header["names"],
+            "self_cohort": header["self_cohort"],
+            "cohort_top_k": header["cohort_top_k"],
+        }
+        for key in _TENSORS:
+            meta = header["tensors"].get(key)
+            if meta is None:
+                state[key] = None
+                continue
+            dtype = _DTYPES[meta.get("dtype", "float32")]
+            count = 1
+            for dim in meta["shape"]:
+                count *= dim
+            if count == 0:
+                state[key] = torch.empty(meta["shape"], dtype=dtype)
+                continue
+            state[key] = torch.frombuffer(
+                shm.buf, dtype=dtype, count=count, offset=data_start + meta["offset"]
+            ).reshape(meta["shape"])
+        return shm, SpeakerIndex.from_state_dict(state)
+
+    def _release_retired(self):
+        # A segment can only be unmapped once no tensor views it any more
+        still_used = []
+        for shm in self._retired:
+            try:
+                shm.close()
+            except BufferError:
+                still_used.append(shm)
+        self._retired = still_used
+
+    def current(self):
+        """
+        Returns the latest published SpeakerIndex, or None if nothing has
+        been published yet. Costs one 8-byte read when nothing changed.
+        """
+        generation = self.generation
+        if generation == self._generation and self._index is not None:
+            return self._index
+        with self._local_lock:
+            while generation and generation != self._generation:
+                try:
+                    shm, index = self._attach(generation)
+                except FileNotFoundError:
+                    # Superseded between reading the control word and mapping
+                    generation = self.generation
+                    continue
+                if self._index is not None:
+                    self._retired.append(self._shm)
+                self._shm, self._index, self._generation = shm, index, generation
+                self._release_retired()
+        return self._index
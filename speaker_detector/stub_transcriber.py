@@ -0,0 +1,91 @@
+import json
+import random
+import tempfile
+import time
+from email.parser import BytesParser
+from email.policy import default as email_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from speaker_detector.audio_info import audio_info
+
+SEGMENT_SEC = 5.0
+
+
+def _uploaded_file(content_type, body):
+    """Returns (filename, bytes) of the multipart "file" field."""
+    msg = BytesParser(policy=email_policy).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    for part in msg.iter_parts():
+        if part.get_param("name", header="content-disposition") == "file":
+            return part.get_filename() or "upload.wav", part.get_payload(decode=True)
+    raise ValueError("missing 'file' field")
+
+
+def _audio_duration(filename, data):
+    with tempfile.NamedTemporaryFile(suffix=Path(filename).suffix or ".wav") as f:
+        f.write(data)
+        f.flush()
+        frames, sample_rate = audio_info(f.name)
+    return frames / sample_rate
+
+
+def make_handler(latency=0.0, realtime_factor=0.0, fail_rate=0.0, segment_sec=SEGMENT_SEC):
+    """
+    Handler for an OpenAI-compatible /audio/transcriptions endpoint that
+    returns placeholder verbose_json segments every `segment_sec` of the
+    uploaded audio. Each request sleeps `latency` + duration ×
+    `realtime_factor` seconds, and fails with a 503 with probability
+    `fail_rate` to exercise client retries.
+    """
+
+    class StubTranscriber(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so pooled clients reuse connections
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if random.random() < fail_rate:
+                return self._send(503, {"error": "stub: injected failure"})
+            try:
+                filename, data = _uploaded_file(self.headers["Content-Type"], body)
+                dur = _audio_duration(filename, data)
+            except Exception as e:
+                return self._send(400, {"error": f"stub: {e}"})
+
+            time.sleep(latency + dur * realtime_factor)
+            segments, t = [], 0.0
+            while t < dur:
+                end = min(t + segment_sec, dur)
+                segments.append({"start": round(t, 2), "end": round(end, 2),
+                                 "text": f"{filename} {t:.0f}-{end:.0f}s"})
+                t = end
+            self._send(200, {
+                "text": " ".join(s["text"] for s in segments),
+                "duration": dur,
+                "segments": segments,
+            })
+
+    return StubTranscriber
+
+
+def serve(host="127.0.0.1", port=9100, **handler_opts):
+    server = ThreadingHTTPServer((host, port), make_handler(**handler_opts))
+    print(f"🧪 Stub transcriber on http://{host}:{server.server_port}/v1/audio/transcriptions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
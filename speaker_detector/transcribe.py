@@ -0,0 +1,209 @@
+import abc
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import torchaudio
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from speaker_detector import meeting_store
+
+WHISPER_API_URL = "https://api.openai.com/v1/audio/transcriptions"
+TARGET_PIECE_SEC = 120.0  # aim for pieces about this long...
+SEARCH_SEC = 20.0         # ...cutting at the quietest point within ± this
+FRAME_SEC = 0.02          # energy frame used to find silence
+UPLOAD_FORMAT = "flac"
+
+
+class TranscriptionBackend(abc.ABC):
+    """
+    Turns one audio file (bytes) into {"text": str, "segments": [{"start",
+    "end", "text"}]} with times relative to the start of that file.
+    """
+
+    @abc.abstractmethod
+    def transcribe(self, audio_bytes, filename):
+        ...
+
+
+class WhisperHTTPBackend(TranscriptionBackend):
+    """
+    OpenAI-compatible /audio/transcriptions client. One pooled
+    requests.Session is shared by all threads, and connection errors,
+    429s and 5xx responses are retried with exponential backoff.
+    """
+
+    def __init__(self, url=WHISPER_API_URL, api_key=None, model="whisper-1",
+                 language="en", prompt=None, temperature=0.0, retries=4, backoff=0.5,
+                 pool_size=8, timeout=300):
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.language = language
+        self.prompt = prompt
+        self.temperature = temperature
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,  # uploads are idempotent, so POST is retried too
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def transcribe(self, audio_bytes, filename):
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        ext = os.path.splitext(filename)[1].lstrip(".") or "wav"
+        data = {
+            "model": self.model,
+            "response_format": "verbose_json",
+            "temperature": self.temperature,
+        }
+        if self.language:
+            data["language"] = self.language
+        if self.prompt:
+            data["prompt"] = self.prompt
+        response = self.session.post(
+            self.url,
+            headers=headers,
+            files={"file": (filename, audio_bytes, f"audio/{ext}")},
+            data=data,
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        body = response.json()
+        return {
+            "text": body.get("text", "").strip(),
+            "segments": [
+                {"start": s["start"], "end": s["end"], "text": s["text"].strip()}
+                for s in body.get("segments", [])
+            ],
+        }
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(prompt=None, temperature=0.0):
+    """
+    Process-wide backend configured from the environment: TRANSCRIBE_URL
+    (e.g. a local stub-transcriber), OPENAI_API_KEY and TRANSCRIBE_MODEL.
+    One backend (and connection pool) is kept per prompt/temperature.
+    """
+    key = (prompt, temperature)
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = WhisperHTTPBackend(
+                url=os.getenv("TRANSCRIBE_URL", WHISPER_API_URL),
+                api_key=os.getenv("OPENAI_API_KEY"),
+                model=os.getenv("TRANSCRIBE_MODEL", "whisper-1"),
+                prompt=prompt,
+                temperature=temperature,
+            )
+        return _backends[key]
+
+
+# ─── Splitting ────────────────────────────────────────────────────────────────
+
+def quietest_point(wav, sr, frame_sec=FRAME_SEC):
+    """Sample index at the centre of the lowest-energy frame of a mono [T] tensor."""
+    frame = max(1, int(frame_sec * sr))
+    if wav.shape[-1] < frame:
+        return wav.shape[-1] // 2
+    energy = wav.unfold(-1, frame, frame).pow(2).mean(dim=-1)
+    return int(energy.argmin()) * frame + frame // 2
+
+
+def find_cut_points(read, total_frames, sr, target_sec=TARGET_PIECE_SEC, search_sec=SEARCH_SEC,
+                    start=0):
+    """
+    Returns piece boundaries [start, c1, ..., total_frames] with each cut at
+    the quietest point within ±search_sec of target_sec after the previous
+    one. `read(start, end)` returns a mono [T] tensor of that frame range,
+    so only the search windows are decoded.
+    """
+    target, search = int(target_sec * sr), int(search_sec * sr)
+    cuts = [start]
+    while total_frames - cuts[-1] > target + search:
+        lo = cuts[-1] + target - search
+        hi = cuts[-1] + target + search
+        cuts.append(lo + quietest_point(read(lo, hi), sr))
+    cuts.append(total_frames)
+    return cuts
+
+
+def _encode(wav, sr, fmt=UPLOAD_FORMAT):
+    buf = io.BytesIO()
+    torchaudio.save(buf, wav.reshape(1, -1), sr, format=fmt)
+    return buf.getvalue()
+
+
+# ─── Transcription ────────────────────────────────────────────────────────────
+
+def transcribe_ranges(read, total_frames, sr, backend=None, workers=4, start_frame=0):
+    """
+    Splits [start_frame, total_frames) at silences and transcribes the pieces
+    concurrently, then shifts each piece's segment times by its offset and
+    stitches them in order. A piece that still fails after the backend's
+    retries is reported in "errors" instead of failing the whole call.
+    """
+    backend = backend or get_backend()
+    cuts = find_cut_points(read, total_frames, sr, start=start_frame)
+    pieces = [(s, e) for s, e in zip(cuts[:-1], cuts[1:]) if e > s]
+
+    def run(i, start, end):
+        audio = _encode(read(start, end), sr)
+        return backend.transcribe(audio, f"piece_{i:04d}.{UPLOAD_FORMAT}")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(run, i, s, e) for i, (s, e) in enumerate(pieces)]
+
+    texts, segments, errors = [], [], []
+    for (start, end), fut in zip(pieces, futures):
+        offset = start / sr
+        try:
+            result = fut.result()
+        except Exception as e:
+            errors.append({"start": round(offset, 2), "end": round(end / sr, 2), "error": str(e)})
+            continue
+        if result["text"]:
+            texts.append(result["text"])
+        for seg in result["segments"]:
+            segments.append({
+                "start": seg["start"] + offset,
+                "end": seg["end"] + offset,
+                "text": seg["text"],
+            })
+    return {"text": " ".join(texts), "segments": segments, "errors": errors}
+
+
+def transcribe_meeting(meeting_dir, backend=None, workers=4, index=None, start=0.0):
+    """
+    Transcribes a stored meeting from `start` seconds to the end, reading
+    each piece straight from its chunks. Times are on the meeting timeline.
+    """
+    index = index or meeting_store.load_index(meeting_dir)
+    sr = index["sample_rate"]
+    total = sum(c["frames"] for c in index["chunks"])
+
+    def read(start, end):
+        wav, _ = meeting_store.read_range(meeting_dir, start / sr, end / sr, index)
+        return wav.mean(dim=0)
+
+    return transcribe_ranges(read, total, sr, backend=backend, workers=workers,
+                             start_frame=min(total, int(start * sr)))
+
+
+def transcribe_waveform(wav, sr, backend=None, workers=4):
+    """Transcribes an in-memory [channels, T] or [T] waveform."""
+    mono = wav.mean(dim=0) if wav.dim() > 1 else wav
+    return transcribe_ranges(lambda s, e: mono[s:e], mono.shape[-1], sr,
+                             backend=backend, workers=workers)
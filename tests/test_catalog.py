@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+import soundfile
+
+from speaker_detector.catalog import Catalog, probe_audio
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = Catalog(tmp_path / "catalog.db", tmp_path / "speakers", tmp_path / "meetings", tmp_path / "embeddings")
+    catalog.speakers()  # the first use indexes the (empty) tree, in its own commit
+    return catalog
+
+
+def test_transaction_rolls_back_on_error(catalog):
+    catalog.set_speaker_embedding("alice", "alice.pt")
+    versions = catalog.version("speakers"), catalog.version("roster")
+
+    with pytest.raises(RuntimeError):
+        with catalog.transaction():
+            catalog.set_speaker_embedding("bob", "bob.pt")
+            catalog.delete_speaker("alice")
+            raise RuntimeError("write failed")
+
+    assert catalog.speakers() == [("alice", 0)]
+    assert (catalog.version("speakers"), catalog.version("roster")) == versions
+
+
+def test_nested_transactions_commit_once(catalog):
+    commits = []
+    catalog.on_commit("roster", lambda: commits.append(catalog.speakers()))
+
+    with catalog.transaction():
+        catalog.set_speaker_embedding("alice", "alice.pt")
+        with catalog.transaction():
+            catalog.set_speaker_embedding("bob", "bob.pt")
+        assert commits == []
+
+    # Listeners run once, after the commit, and see its changes
+    assert commits == [[("alice", 0), ("bob", 0)]]
+
+
+def test_error_in_nested_transaction_rolls_back_the_outer_one(catalog):
+    commits = []
+    catalog.on_commit("roster", lambda: commits.append(True))
+
+    with pytest.raises(ValueError):
+        with catalog.transaction():
+            catalog.set_speaker_embedding("alice", "alice.pt")
+            with catalog.transaction():
+                raise ValueError("bad input")
+
+    assert catalog.speakers() == [] and commits == []
+    catalog.set_speaker_embedding("bob", "bob.pt")
+    assert catalog.speakers() == [("bob", 0)] and commits == [True]
+
+
+def test_recording_slots_do_not_bump_the_roster(catalog):
+    roster = catalog.version("roster")
+    rec_id, path = catalog.reserve_recording("alice")
+    catalog.discard_recording(rec_id)
+    assert catalog.version("roster") == roster
+    assert path.name == f"{rec_id}.wav"
+
+    # Ids colliding with files the catalog doesn't know about are skipped
+    (path.parent / f"{rec_id + 1}.pt").write_bytes(b"")
+    next_id, _ = catalog.reserve_recording("alice")
+    assert next_id == rec_id + 2
+
+
+def test_reserved_slots_are_listed_once_written(catalog):
+    rec_id, path = catalog.reserve_recording("alice")
+    assert catalog.speakers() == [("alice", 0)]
+    assert catalog.recordings() == {"alice": []} and catalog.recording_rows("alice") == []
+
+    soundfile.write(path, np.zeros(1600, dtype="float32"), 16000)
+    catalog.update_recording(rec_id, path=path)
+    assert catalog.speakers() == [("alice", 1)]
+    assert catalog.recordings() == {"alice": [path.name]}
+    row, = catalog.recording_rows("alice")
+    assert row["duration"] == 0.1 and row["sha256"]
+
+def test_probe_audio_reads_the_header(tmp_path):
+    path = tmp_path / "clip.wav"
+    soundfile.write(path, np.zeros(24000, dtype="float32"), 16000)
+    assert probe_audio(path) == (1.5, 16000)
+    path.write_bytes(b"not audio")
+    assert probe_audio(path) == (None, None)
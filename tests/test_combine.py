@@ -0,0 +1,33 @@
+import torch
+
+from speaker_detector.combine import combine_embeddings_from_folder
+from speaker_detector.export_embeddings import export_embeddings_to_json
+
+
+def test_incremental_combine_and_removal(tmp_path):
+    src, out = tmp_path / "embeddings", tmp_path / "enrolled_speakers.pt"
+    src.mkdir()
+    torch.save(torch.ones(4), src / "alice.pt")
+    torch.save(torch.zeros(2, 4), src / "bob.pt")
+
+    assert combine_embeddings_from_folder(src, out)
+    assert set(torch.load(out)) == {"alice", "bob"}
+    assert not combine_embeddings_from_folder(src, out)  # nothing changed
+
+    (src / "bob.pt").unlink()
+    assert combine_embeddings_from_folder(src, out)
+    assert set(torch.load(out)) == {"alice"}
+
+    (src / "alice.pt").unlink()
+    assert combine_embeddings_from_folder(src, out)
+    assert torch.load(out) == {}
+    assert not combine_embeddings_from_folder(src, out)
+
+    json_path = tmp_path / "speakers.json"
+    assert export_embeddings_to_json(out, json_path)
+    assert json_path.read_text().strip() == "[]"
+
+
+def test_empty_folder_writes_nothing(tmp_path):
+    assert not combine_embeddings_from_folder(tmp_path, tmp_path / "out.pt")
+    assert not (tmp_path / "out.pt").exists()
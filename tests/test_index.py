@@ -0,0 +1,138 @@
+import torch
+import torch.nn.functional as F
+
+from speaker_detector.index import (
+    SpeakerIndex,
+    _cohort_stats,
+    _cohort_stats_excluding,
+    sub_centroids,
+)
+
+
+def _roster(n=40, dim=16, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    return [f"spk{i}" for i in range(n)], F.normalize(torch.randn(n, dim, generator=g), dim=1)
+
+
+def test_cohort_stats_excluding_matches_brute_force():
+    scores = torch.randn(5, 30, generator=torch.Generator().manual_seed(1))
+    mean, std = _cohort_stats_excluding(scores, 7)
+    for j in range(30):
+        others = [c for c in range(30) if c != j]
+        ref_mean, ref_std = _cohort_stats(scores[:, others], 7)
+        assert torch.allclose(mean[:, j], ref_mean, atol=1e-5)
+        assert torch.allclose(std[:, j], ref_std, atol=1e-4)
+
+
+def test_self_cohort_leaves_scored_speaker_out_of_query_stats():
+    names, matrix = _roster()
+    index = SpeakerIndex(names, matrix)
+    assert index.self_cohort
+
+    query = F.normalize(matrix[3] + 0.05, dim=0)
+    raw, norm = index.score_with_norm(query)
+    others = [c for c in range(len(names)) if c != 3]
+    q_mean, q_std = _cohort_stats(raw[:, others], min(index.cohort_top_k, len(names) - 1))
+    expected = 0.5 * ((raw[0, 3] - index.enroll_mean[3]) / index.enroll_std[3]
+                      + (raw[0, 3] - q_mean[0]) / q_std[0])
+    assert torch.isclose(norm[0, 3], expected, atol=1e-4)
+    assert index.identify(query)[0]["speaker"] == "spk3"
+
+
+def test_external_cohort_norm_is_symmetric_in_stats():
+    names, matrix = _roster(n=5)
+    cohort = F.normalize(torch.randn(50, 16, generator=torch.Generator().manual_seed(2)), dim=1)
+    index = SpeakerIndex(names, matrix, cohort=cohort)
+    assert index.normalized and not index.self_cohort
+
+    raw, norm = index.score_with_norm(matrix[:2])
+    q_mean, q_std = _cohort_stats(matrix[:2] @ cohort.T, index.cohort_top_k)
+    expected = 0.5 * ((raw - index.enroll_mean) / index.enroll_std
+                      + (raw - q_mean.unsqueeze(1)) / q_std.unsqueeze(1))
+    assert torch.allclose(norm, expected, atol=1e-4)
+
+
+def test_small_roster_is_not_normalised():
+    names, matrix = _roster(n=3)
+    index = SpeakerIndex(names, matrix)
+    raw, norm = index.score_with_norm(matrix)
+    assert norm is None
+    assert [r["speaker"] for r in index.identify(matrix)] == names
+
+
+def test_state_dict_round_trip():
+    names, matrix = _roster()
+    index = SpeakerIndex.from_state_dict(SpeakerIndex(names, matrix).state_dict())
+    assert index.identify(matrix[:1])[0]["speaker"] == "spk0"
+
+
+def test_verify_rejects_unknown_names():
+    names, matrix = _roster(n=3)
+    results = SpeakerIndex(names, matrix).verify(matrix[:2], ["spk0", "nobody"])
+    assert results[0]["match"] is True
+    assert results[1]["match"] is False and "error" in results[1]
+
+
+def test_sub_centroids_keeps_one_centroid_for_one_setting():
+    g = torch.Generator().manual_seed(3)
+    base = F.normalize(torch.randn(16, generator=g), dim=0)
+    embs = base + 0.01 * torch.randn(12, 16, generator=g)
+    assert sub_centroids(embs).shape == (1, 16)
+
+
+def _multi_row_roster(n=15, dim=16, seed=4):
+    # Every third speaker has three unrelated sub-centroids
+    g = torch.Generator().manual_seed(seed)
+    counts = [3 if s % 3 == 0 else 1 for s in range(n)]
+    owner = torch.repeat_interleave(torch.arange(n), torch.tensor(counts))
+    matrix = F.normalize(torch.randn(len(owner), dim, generator=g), dim=1)
+    return [f"spk{s}" for s in range(n)], matrix, owner
+
+
+def _brute_force(names, matrix, owner, queries, top_k):
+    n = len(names)
+    rows_of = [(owner == s).nonzero().flatten().tolist() for s in range(n)]
+    q = F.normalize(queries, dim=1)
+    row_scores = q @ matrix.T
+    raw = torch.stack([row_scores[:, rows].max(dim=1).values for rows in rows_of], dim=1)
+    norm = torch.empty_like(raw)
+    for s, rows in enumerate(rows_of):
+        others = [t for t in range(n) if t != s]
+        q_mean, q_std = _cohort_stats(raw[:, others], top_k)
+        best = None
+        for r in rows:
+            # Enrollment-side cohort: every other speaker's best row, none of s's own rows
+            vs_others = torch.stack([(matrix[r] @ matrix[rows_of[t]].T).max() for t in others])
+            e_mean, e_std = _cohort_stats(vs_others.unsqueeze(0), top_k)
+            row_norm = 0.5 * ((row_scores[:, r] - e_mean) / e_std + (row_scores[:, r] - q_mean) / q_std)
+            best = row_norm if best is None else torch.maximum(best, row_norm)
+        norm[:, s] = best
+    return raw, norm
+
+
+def test_multi_centroid_speakers_score_at_their_best_row():
+    names, matrix, owner = _multi_row_roster()
+    index = SpeakerIndex(names, matrix, owner=owner)
+    assert index.self_cohort
+
+    # Probes near each speaker's last sub-centroid, not its first
+    last_row = torch.tensor([(owner == s).nonzero().max() for s in range(len(names))])
+    g = torch.Generator().manual_seed(5)
+    queries = F.normalize(matrix[last_row] + 0.1 * torch.randn(len(names), 16, generator=g), dim=1)
+    top_k = min(index.cohort_top_k, len(names) - 1)
+    raw, norm = _brute_force(names, matrix, owner, queries, top_k)
+
+    got_raw, got_norm = index.score_with_norm(queries)
+    assert torch.allclose(got_raw, raw, atol=1e-5)
+    assert torch.allclose(got_norm, norm, atol=1e-3)
+
+    results = index.identify(queries)
+    best = norm.argmax(dim=1)
+    assert [r["speaker"] for r in results] == [names[i] for i in best.tolist()]
+    assert [r["score"] for r in results] == [round(raw[q, i].item(), 3) for q, i in enumerate(best.tolist())]
+    assert [r["speaker"] for r in results] == names
+
+    verdicts = index.verify(queries, names)
+    for q, v in enumerate(verdicts):
+        assert v["score"] == round(raw[q, q].item(), 3)
+        assert v["norm_score"] == round(norm[q, q].item(), 3)
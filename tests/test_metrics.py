@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from speaker_detector.metrics import compute_eer, compute_min_dcf, det_curve, metrics
+
+
+def _trials(n=2000, separation=1.5, seed=0):
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 2, n)
+    scores = rng.normal(size=n) + separation * labels
+    return scores, labels
+
+
+def _rates(scores, labels, threshold):
+    accept = scores > threshold
+    fnr = np.mean(~accept[labels == 1])
+    fpr = np.mean(accept[labels == 0])
+    return fpr, fnr
+
+
+def test_det_curve_matches_brute_force():
+    scores, labels = _trials(300)
+    scores = np.round(scores, 1)  # plenty of ties
+    fpr, fnr, thresholds = det_curve(scores, labels)
+    assert (fpr[0], fnr[0]) == (1.0, 0.0) and (fpr[-1], fnr[-1]) == (0.0, 1.0)
+    assert len(np.unique(thresholds[1:])) == len(thresholds) - 1
+    for f, m, t in zip(fpr, fnr, thresholds):
+        assert np.allclose((f, m), _rates(scores, labels, t))
+
+
+def test_det_curve_needs_both_classes():
+    with pytest.raises(ValueError):
+        det_curve([0.1, 0.2], [1, 1])
+
+
+def test_eer_of_separable_and_identical_scores():
+    fpr, fnr, thresholds = det_curve([0.1, 0.2, 0.8, 0.9], [0, 0, 1, 1])
+    eer, threshold = compute_eer(fpr, fnr, thresholds)
+    assert eer == 0.0 and 0.2 <= threshold < 0.8
+
+    fpr, fnr, thresholds = det_curve([0.5] * 4, [0, 1, 0, 1])
+    assert compute_eer(fpr, fnr, thresholds)[0] == pytest.approx(0.5)
+
+
+def test_eer_matches_threshold_sweep():
+    scores, labels = _trials()
+    eer, _ = compute_eer(*det_curve(scores, labels))
+    gaps = []
+    for t in np.unique(scores):
+        fpr, fnr = _rates(scores, labels, t)
+        gaps.append((abs(fpr - fnr), (fpr + fnr) / 2))
+    assert eer == pytest.approx(min(gaps)[1], abs=2e-3)
+
+
+def test_min_dcf_matches_threshold_sweep():
+    scores, labels = _trials()
+    p_target = 0.05
+    min_dcf, threshold = compute_min_dcf(*det_curve(scores, labels), p_target=p_target)
+    costs = [p_target * fnr + (1 - p_target) * fpr
+             for fpr, fnr in (_rates(scores, labels, t) for t in np.r_[-np.inf, np.unique(scores)])]
+    assert min_dcf == pytest.approx(min(costs) / min(p_target, 1 - p_target))
+    fpr, fnr = _rates(scores, labels, threshold)
+    assert p_target * fnr + (1 - p_target) * fpr == pytest.approx(min(costs))
+    assert min_dcf <= 1.0
+
+
+def test_metrics_report():
+    scores, labels = _trials(500)
+    report = metrics(scores, labels)
+    assert 0 < report["eer"] < 0.5 and 0 < report["min_dcf"] <= 1
+    assert len(report["det"]) <= 200
+    assert report["det"][0]["fpr"] == 1.0 and report["det"][-1]["fnr"] == 1.0
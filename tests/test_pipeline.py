@@ -0,0 +1,95 @@
+import random
+import threading
+import time
+
+import pytest
+
+from speaker_detector.pipeline import Pipeline, Stage
+
+
+def _jitter(x):
+    time.sleep(random.random() * 0.002)
+    return x
+
+
+def test_outputs_keep_input_order_across_workers():
+    pipeline = Pipeline([
+        Stage("slow", lambda x: _jitter(x * 2), workers=4),
+        Stage("add", lambda x: _jitter(x + 1), workers=3),
+    ], queue_size=2)
+    assert pipeline.run(range(200)) == [x * 2 + 1 for x in range(200)]
+
+
+def test_fan_out_items_follow_their_parent():
+    pipeline = Pipeline([
+        Stage("split", lambda n: [f"{n}.{j}" for j in range(n % 3)], workers=3, fan_out=True),
+        Stage("tag", _jitter, workers=2),
+    ])
+    expected = [f"{n}.{j}" for n in range(30) for j in range(n % 3)]
+    assert pipeline.run(range(30)) == expected
+
+
+def test_batches_are_bounded_and_ordered():
+    sizes = []
+
+    def double(batch):
+        sizes.append(len(batch))
+        return [x * 2 for x in batch]
+
+    pipeline = Pipeline([Stage("feed", _jitter, workers=2), Stage("double", double, batch_size=8)])
+    assert pipeline.run(range(100)) == [x * 2 for x in range(100)]
+    assert max(sizes) <= 8 and sum(sizes) == 100
+    stats = pipeline.stats()["stages"]["double"]
+    assert stats["items_in"] == stats["items_out"] == 100
+
+
+def test_stage_failure_propagates_and_stops_the_run():
+    seen = []
+
+    def boom(x):
+        if x == 5:
+            raise ValueError("bad item")
+        return x
+
+    def record(x):
+        seen.append(x)
+        return x
+
+    pipeline = Pipeline([Stage("check", boom), Stage("record", record)], queue_size=1)
+    with pytest.raises(RuntimeError, match="'check' failed: bad item") as info:
+        pipeline.run(range(10_000))
+    assert isinstance(info.value.__cause__, ValueError)
+    assert len(seen) < 10_000
+
+
+def test_input_failure_propagates():
+    def items():
+        yield 1
+        raise OSError("source gone")
+
+    with pytest.raises(RuntimeError, match="'input' failed: source gone"):
+        Pipeline([Stage("id", lambda x: x)]).run(items())
+
+
+def test_no_threads_left_behind_after_failure():
+    before = threading.active_count()
+    with pytest.raises(RuntimeError):
+        Pipeline([Stage("fail", lambda x: 1 / 0, workers=3), Stage("id", lambda x: x, workers=2)]).run(range(50))
+    assert threading.active_count() == before
+
+
+def test_stateful_fn_is_reset_before_each_run():
+    class Count:
+        def __init__(self):
+            self.n = 0
+
+        def reset(self):
+            self.n = 0
+
+        def __call__(self, x):
+            self.n += 1
+            return self.n
+
+    pipeline = Pipeline([Stage("count", Count())])
+    assert pipeline.run("abc") == [1, 2, 3]
+    assert pipeline.run("ab") == [1, 2]
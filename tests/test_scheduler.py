@@ -0,0 +1,56 @@
+import random
+
+import torch
+
+from speaker_detector.scheduler import plan_buckets, run_bucketed
+
+
+def _lengths(n=300, seed=0):
+    rng = random.Random(seed)
+    return [rng.randint(50, 2000) for _ in range(n)]
+
+
+def test_plan_covers_every_item_once_within_bounds():
+    lengths = _lengths()
+    batches = plan_buckets(lengths, max_padded_frames=8000, max_batch=16)
+    assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) <= 16
+        assert len(batch) * max(lengths[i] for i in batch) <= 8000
+        # The first item is the longest, so it sets the padded length
+        assert lengths[batch[0]] == max(lengths[i] for i in batch)
+
+
+def test_item_longer_than_the_cap_runs_alone():
+    lengths = [100, 5000, 120, 90]
+    batches = plan_buckets(lengths, max_padded_frames=1000)
+    assert [1] in batches
+    assert sorted(i for b in batches for i in b) == [0, 1, 2, 3]
+    assert all(len(b) * max(lengths[i] for i in b) <= 1000 for b in batches if b != [1])
+
+
+def test_run_bucketed_returns_outputs_in_input_order():
+    lengths = _lengths(100, seed=1)
+    inputs = [torch.full((n, 2), float(i)) for i, n in enumerate(lengths)]
+    seen = []
+
+    def forward(padded, rel_lengths):
+        seen.append(padded.shape)
+        assert rel_lengths.max() == 1.0
+        frames = (rel_lengths * padded.shape[1]).round().long()
+        # Item id and its unpadded length, read back from the padded batch
+        return torch.stack([torch.stack([padded[b, 0, 0], frames[b].float()]) for b in range(len(padded))])
+
+    outputs, stats = run_bucketed(forward, inputs, max_padded_frames=6000, max_batch=8)
+    assert [int(o[0]) for o in outputs] == list(range(len(inputs)))
+    assert [int(o[1]) for o in outputs] == lengths
+    assert all(b <= 8 and (b == 1 or b * t <= 6000) for b, t, _ in seen)
+    assert stats["items"] == 100 and stats["batches"] == len(seen)
+    assert stats["frames"] == sum(lengths)
+    assert stats["padded_frames"] == sum(b * t for b, t, _ in seen)
+    assert 0 < stats["padding_efficiency"] <= 1
+
+
+def test_run_bucketed_of_nothing():
+    outputs, stats = run_bucketed(lambda padded, rel: padded, [], max_padded_frames=100)
+    assert outputs == [] and stats["batches"] == 0 and stats["padding_efficiency"] == 1.0
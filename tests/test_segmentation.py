@@ -0,0 +1,120 @@
+import math
+
+import pytest
+import torch
+
+try:  # core loads the ECAPA model at import
+    from speaker_detector import segmentation
+except Exception as e:
+    pytest.skip(f"speaker_detector.core unavailable: {e}", allow_module_level=True)
+
+from speaker_detector.ingest import VAD_FRAME_SEC, speech_frames  # noqa: E402
+from speaker_detector.segmentation import (  # noqa: E402
+    SAMPLE_RATE,
+    WINDOW_SEC,
+    blocks,
+    divergence_curve,
+    segment,
+    turn_pipeline,
+)
+
+SR = SAMPLE_RATE
+
+
+def _voice(freqs, seconds, seed=0):
+    """
+    Harmonics under a 4 Hz syllable envelope over a faint noise floor:
+    enough like speech for the energy VAD and distinct per `freqs`.
+    """
+    t = torch.arange(int(seconds * SR)) / SR
+    tone = sum(torch.sin(2 * math.pi * f * t) for f in freqs) / len(freqs)
+    envelope = torch.sin(2 * math.pi * 4 * t).clamp(min=0)
+    return 0.3 * tone * envelope + _noise(seconds, seed=seed + 100)
+
+
+def _noise(seconds, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    return 0.001 * torch.randn(int(seconds * SR), generator=g)
+
+
+def test_divergence_curve_peaks_at_the_change():
+    g = torch.Generator().manual_seed(0)
+    feats = torch.cat([torch.randn(300, 8, generator=g), torch.randn(300, 8, generator=g) + 3])
+    voiced = torch.ones(600, dtype=torch.bool)
+    positions, div = divergence_curve(feats, voiced, window=100, step=10)
+    assert positions[0] == 100 and positions[-1] == 500
+    assert abs(int(positions[div.argmax()]) - 300) <= 10
+
+
+def test_divergence_curve_ignores_silent_windows():
+    feats = torch.randn(400, 8, generator=torch.Generator().manual_seed(0))
+    voiced = torch.zeros(400, dtype=torch.bool)
+    _, div = divergence_curve(feats, voiced, window=100, step=10)
+    assert torch.all(div == 0)
+
+
+def test_segment_splits_two_voices():
+    wav = torch.cat([_voice((150, 300, 450), 4.0), _voice((900, 1800), 4.0, seed=1)])
+    segments = segment(wav)
+    assert len(segments) == 2
+    (s0, e0), (s1, e1) = segments
+    assert abs(e0 - 4 * SR) <= 0.2 * SR and abs(s1 - 4 * SR) <= 0.2 * SR
+    assert s0 <= 0.05 * SR and e1 >= len(wav) - 0.2 * SR
+
+
+def test_segment_trims_to_speech_on_the_vad_grid(monkeypatch):
+    # A change point between two VAD frames: trimming must still land on
+    # the first and last voiced frame
+    silence = _noise(1.0)
+    wav = torch.cat([silence, _voice((200, 400), 3.0), silence])
+    frame = int(VAD_FRAME_SEC * SR)
+    monkeypatch.setattr(segmentation, "change_points", lambda wav, sr: [25 * frame + frame // 2])
+    voiced = speech_frames(wav).nonzero().flatten()
+
+    (start, end), = segment(wav)
+    assert start == int(voiced[0]) * frame
+    assert end == (int(voiced[-1]) + 1) * frame
+
+
+def test_segment_of_silence_is_empty():
+    assert segment(_noise(3.0)) == []
+
+
+
+def test_blocks_cover_the_duration_with_overlap():
+    assert blocks(0) == []
+    spans = blocks(150, block_sec=60, overlap_sec=2)
+    assert [(b["start"], b["end"]) for b in spans] == [(0, 60), (60, 120), (120, 150)]
+    assert [(b["read_start"], b["read_end"]) for b in spans] == [(0, 62), (58, 122), (118, 150)]
+    assert [b["last"] for b in spans] == [False, False, True]
+    assert all(b["start"] - b["read_start"] >= WINDOW_SEC for b in spans[1:])
+
+
+def _meeting():
+    voices = [((150, 300), 4.3), ((900, 1800), 5.1), ((150, 300), 7.4), ((500, 1000), 3.2)]
+    return torch.cat([_voice(f, d, seed=k) for k, (f, d) in enumerate(voices)])
+
+
+def _turns(wav, block_sec, fail=()):
+    def read(start, end):
+        if start in fail:
+            raise OSError("unreadable")
+        return wav[int(round(start * SR)):int(round(end * SR))].unsqueeze(0), SR
+
+    spans = lambda turns: [(round(s, 2), round(e, 2)) for s, e, _ in turns]
+    return turn_pipeline(read, spans).run(blocks(len(wav) / SR, block_sec=block_sec))
+
+
+def test_turns_do_not_depend_on_block_seams():
+    wav = _meeting()
+    whole = _turns(wav, block_sec=1000)
+    assert len(whole) >= 4
+    for block_sec in (3.0, 4.0, 5.5):
+        assert _turns(wav, block_sec) == whole
+
+
+def test_failed_block_is_skipped():
+    wav = _meeting()
+    turns = _turns(wav, block_sec=3.0, fail=(4.0,))  # block [6, 9) is read from 4 s
+    assert not any(s < 9.0 and e > 6.0 for s, e in turns)
+    assert any(e <= 6.0 for _, e in turns) and any(s >= 9.0 for s, _ in turns)
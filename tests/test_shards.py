@@ -0,0 +1,145 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from speaker_detector.index import SpeakerIndex
+from speaker_detector.shards import (
+    Shard,
+    ShardedIndex,
+    _synthetic_roster,
+    make_shard_handler,
+    roster_id,
+    shard_of,
+)
+
+DIM = 16
+
+
+@pytest.fixture
+def roster(tmp_path):
+    folder = tmp_path / "embeddings"
+    cohort_path = _synthetic_roster(folder, speakers=60, dim=DIM, seed=0, cohort_size=50)
+    return folder, cohort_path
+
+
+@contextmanager
+def _serve(folder, n_shards, cohort_path=None, delays=None):
+    servers = []
+    for i in range(n_shards):
+        shard = Shard(folder, i, n_shards, cohort_path=cohort_path)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_shard_handler(shard, delay=(delays or {}).get(i, 0.0)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    try:
+        yield [f"http://127.0.0.1:{s.server_port}" for s in servers]
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+
+def _probes(index, n=40, noise=0.8, seed=1):
+    g = torch.Generator().manual_seed(seed)
+    rows = index.matrix[torch.randint(len(index.matrix), (n,), generator=g)]
+    return F.normalize(rows + noise * torch.randn(n, DIM, generator=g) / DIM ** 0.5, dim=1)
+
+
+def test_shard_of_is_stable_and_spread():
+    names = [f"spk{i:04d}" for i in range(4000)]
+    assert [shard_of(n, 4) for n in names] == [shard_of(n, 4) for n in names]
+    counts = Counter(shard_of(n, 4) for n in names)
+    assert set(counts) == {0, 1, 2, 3}
+    assert max(counts.values()) < 1.2 * min(counts.values())
+
+
+def test_shards_partition_the_roster(roster):
+    folder, cohort_path = roster
+    shards = [Shard(folder, i, 3, cohort_path=cohort_path) for i in range(3)]
+    names = [n for s in shards for n in s.index().names]
+    assert sorted(names) == SpeakerIndex.from_folder(folder).names
+    assert all(shard_of(n, 3) == s.shard for s in shards for n in s.index().names)
+
+
+def test_identify_with_shared_cohort_matches_single_index(roster):
+    folder, cohort_path = roster
+    reference = SpeakerIndex.from_folder(folder, cohort_path=cohort_path)
+    probes = _probes(reference)
+    with _serve(folder, 3, cohort_path=cohort_path) as urls:
+        index = ShardedIndex(urls, budget_ms=5000, roster=roster_id(folder))
+        try:
+            got = index.identify(probes)
+            assert index.normalized and len(index) == len(reference)
+        finally:
+            index.close()
+    expected = reference.identify(probes)
+    assert [r["speaker"] for r in got] == [r["speaker"] for r in expected]
+    assert [r["norm_score"] for r in got] == [r["norm_score"] for r in expected]
+    assert not any(r.get("partial") for r in got)
+
+
+def test_identify_with_self_cohorts_ranks_on_raw_scores(roster):
+    folder, _ = roster
+    reference = SpeakerIndex.from_folder(folder)
+    probes = _probes(reference)
+    with _serve(folder, 2) as urls:
+        index = ShardedIndex(urls, budget_ms=5000)
+        try:
+            got = index.identify(probes)
+            assert not index.normalized
+        finally:
+            index.close()
+    best = reference.scores(probes).argmax(dim=1)
+    for result, raw, i in zip(got, reference.scores(probes), best.tolist()):
+        assert "norm_score" not in result
+        assert result["score"] == round(raw[i].item(), 3)
+
+
+def test_comparable_needs_one_external_cohort():
+    ext = {"normalized": True, "self_cohort": False, "cohort": "a"}
+    assert ShardedIndex._comparable([ext, dict(ext)])
+    assert not ShardedIndex._comparable([ext, dict(ext, cohort="b")])
+    assert not ShardedIndex._comparable([ext, dict(ext, self_cohort=True)])
+    assert not ShardedIndex._comparable([ext, dict(ext, normalized=False)])
+    assert not ShardedIndex._comparable([])
+
+
+def test_slow_shard_gives_partial_results(roster):
+    folder, cohort_path = roster
+    reference = SpeakerIndex.from_folder(folder, cohort_path=cohort_path)
+    probes = _probes(reference, n=4)
+    with _serve(folder, 2, cohort_path=cohort_path, delays={1: 1.0}) as urls:
+        index = ShardedIndex(urls, budget_ms=200)
+        try:
+            results = index.identify(probes)
+            claims = [n for n in reference.names if shard_of(n, 2) == 1][:len(probes)]
+            verdicts = index.verify(probes, claims)
+        finally:
+            index.close()
+    for result in results:
+        assert result["partial"] and result["missing_shards"] == [1]
+        assert result["speaker"] == "unknown" or shard_of(result["speaker"], 2) == 0
+    assert all(v["partial"] and not v["match"] for v in verdicts)
+
+
+def test_shard_on_another_folder_is_refused(roster, tmp_path):
+    folder, cohort_path = roster
+    other = tmp_path / "copy"
+    other.mkdir()
+    for path in folder.glob("*.pt"):
+        (other / path.name).write_bytes(path.read_bytes())
+    assert roster_id(other) != roster_id(folder) == roster_id(folder)
+
+    with _serve(other, 1, cohort_path=cohort_path) as urls:
+        index = ShardedIndex(urls, budget_ms=5000, roster=roster_id(folder))
+        try:
+            with pytest.raises(RuntimeError, match="embeddings folder"):
+                index.check_roster()
+            result, = index.identify(_probes(SpeakerIndex.from_folder(folder), n=1))
+            assert result["partial"] and result["missing_shards"] == [0]
+        finally:
+            index.close()
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from speaker_detector.index import SpeakerIndex
+from speaker_detector.shared_index import SharedSpeakerIndex, _open, _unlink
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="POSIX shared memory")
+
+
+@pytest.fixture
+def shared():
+    prefix = f"sd-test-{os.getpid()}"
+    index = SharedSpeakerIndex(prefix)
+    yield index
+    for generation in range(index.generation + 2):
+        _unlink(f"{prefix}-{generation}")
+    _unlink(f"{prefix}-ctl")
+
+
+def _index(n=5, dim=8):
+    g = torch.Generator().manual_seed(0)
+    return SpeakerIndex([f"spk{i}" for i in range(n)], F.normalize(torch.randn(n, dim, generator=g), dim=1))
+
+
+def test_publish_round_trips(shared):
+    index = _index()
+    assert shared.publish(index) == 1
+    current = shared.current()
+    assert current.names == index.names
+    assert torch.equal(current.matrix, index.matrix)
+
+
+def test_publish_replaces_stale_segment(shared):
+    # A writer that died after creating the next segment but before
+    # publishing it leaves the name behind
+    stale = _open(f"{shared.prefix}-1", create=True, size=16)
+    stale.close()
+
+    assert shared.publish(_index()) == 1
+    assert shared.current().names == _index().names